@@ -13,15 +13,23 @@ namespace decoding {
         this->filename = filename;
     }
 
+    // Overloaded constructor for an in-memory JPEG
+    CoefficientDecoder::CoefficientDecoder (const unsigned char* buffer, unsigned long buffer_size) {
+        this->buffer = buffer;
+        this->buffer_size = buffer_size;
+    }
+
     // Destructor
     CoefficientDecoder::~CoefficientDecoder () {
     }
 
     void CoefficientDecoder::load(bool use_float_dct, bool do_fancy_upsampling, bool do_block_smoothing) {
         // For some unknown reason we cannot call load in the constructor
-        this->infile = fopen(this->filename.c_str(), "rb");
-        if (NULL == this->infile) {
-            throw std::runtime_error("File not found");
+        if (NULL == this->buffer) {
+            this->infile = fopen(this->filename.c_str(), "rb");
+            if (NULL == this->infile) {
+                throw std::runtime_error("File not found");
+            }
         }
 
         // Set up error handling
@@ -34,8 +42,13 @@ namespace decoding {
             throw std::runtime_error( jpegLastErrorMsg );
         };
         jpeg_create_decompress(&this->cinfo);
+        this->loaded = true;
         // Specify data source
-        jpeg_stdio_src(&this->cinfo, this->infile);
+        if (NULL == this->buffer) {
+            jpeg_stdio_src(&this->cinfo, this->infile);
+        } else {
+            jpeg_mem_src(&this->cinfo, (unsigned char*) this->buffer, this->buffer_size);
+        }
         (void) jpeg_read_header(&this->cinfo, FALSE);
 
         // Be aware that bool is explicitly converted to enum integer here.
@@ -55,18 +68,21 @@ namespace decoding {
         this->output_width = this->cinfo.output_width;
         this->output_height = this->cinfo.output_height;
         this->output_components = this->cinfo.output_components;
+        this->num_components = this->cinfo.num_components;
         this->max_h_samp_factor = this->cinfo.max_h_samp_factor;
         this->max_v_samp_factor = this->cinfo.max_v_samp_factor;
         this->jpeg_color_space = this->cinfo.jpeg_color_space;
     }
 
     void CoefficientDecoder::unload() {
-        if (NULL == this->infile) {
-            return;
+        if (this->loaded) {
+            (void) jpeg_destroy_decompress(&(this->cinfo));
+            this->loaded = false;
+        }
+        if (NULL != this->infile) {
+            fclose(this->infile);
+            this->infile = NULL;
         }
-
-        (void) jpeg_destroy_decompress(&(this->cinfo));
-        fclose(this->infile);
     }
 
     void CoefficientDecoder::get_quantization_table(int channel, unsigned short int* output) {
@@ -85,49 +101,75 @@ namespace decoding {
     }
 
     void CoefficientDecoder::get_dct_coefficients(int channel, int16_t* output) {
-        // TODO: don't call this per-channel
-        jvirt_barray_ptr* src_coef_arrays = jpeg_read_coefficients(&(this->cinfo));
+        if (channel < 0 || channel >= this->cinfo.num_components) {
+            throw std::runtime_error("Illegal color channel");
+        }
+        this->get_dct_coefficient_rows(channel, 0, this->cinfo.comp_info[channel].height_in_blocks, output);
+    }
 
+    void CoefficientDecoder::get_dct_coefficient_rows(int channel, int start_row, int num_rows, int16_t* output) {
+        if (channel < 0 || channel >= this->cinfo.num_components) {
+            throw std::runtime_error("Illegal color channel");
+        }
         // JDIMENSION is defined as unsigned int
         JDIMENSION height_in_blocks = this->cinfo.comp_info[channel].height_in_blocks;
         JDIMENSION width_in_blocks = this->cinfo.comp_info[channel].width_in_blocks;
+        if (start_row < 0 || num_rows < 0 || (JDIMENSION) (start_row + num_rows) > height_in_blocks) {
+            throw std::runtime_error("Illegal block rows");
+        }
 
-        for (JDIMENSION row_num=0; row_num < height_in_blocks; row_num++) {
+        // jpeg_read_coefficients only decodes the image on the first call, and keeps the coefficients of
+        // the whole image in the virtual arrays of libjpeg: only the copy to output is bounded to the rows
+        jvirt_barray_ptr* src_coef_arrays = jpeg_read_coefficients(&(this->cinfo));
+
+        // The virtual array is accessed one row of blocks at a time, through a window of one row
+        for (JDIMENSION row_num=0; row_num < (JDIMENSION) num_rows; row_num++) {
             // A pointer to the virtual array of DCT values
-            JBLOCKARRAY row_ptr = ((&(this->cinfo))->mem->access_virt_barray)((j_common_ptr) &cinfo, src_coef_arrays[channel], row_num, (JDIMENSION) 1, FALSE);
-            // Loop through the blocks to get the DCT values
-            for (JDIMENSION block_num=0; block_num < width_in_blocks; block_num++) {
-                // Copy over DCT coefficients for the current block
-                int block_offset = (row_num * width_in_blocks + block_num) * DCTSIZE2;
-                memcpy(&output[block_offset], row_ptr[0][block_num], DCTSIZE2 * sizeof(JCOEF));
-                // for (int i=0; i<DCTSIZE2; i++) {
-                //    output[blockOffset + i] = rowPtr[0][blockNum][i];
-                // }
-            }
+            JBLOCKARRAY row_ptr = ((&(this->cinfo))->mem->access_virt_barray)((j_common_ptr) &cinfo, src_coef_arrays[channel], start_row + row_num, (JDIMENSION) 1, FALSE);
+            // Copy over the DCT coefficients of the blocks of the row
+            memcpy(&output[row_num * width_in_blocks * DCTSIZE2], row_ptr[0], width_in_blocks * DCTSIZE2 * sizeof(JCOEF));
         }
     }
 
     int CoefficientDecoder::get_width_in_blocks(int channel) {
+        if (channel < 0 || channel >= this->cinfo.num_components) {
+            throw std::runtime_error("Illegal color channel");
+        }
         return this->cinfo.comp_info[channel].width_in_blocks;
     }
 
     int CoefficientDecoder::get_height_in_blocks(int channel) {
+        if (channel < 0 || channel >= this->cinfo.num_components) {
+            throw std::runtime_error("Illegal color channel");
+        }
         return this->cinfo.comp_info[channel].height_in_blocks;
     }
 
     int CoefficientDecoder::get_MCU_width(int channel) {
+        if (channel < 0 || channel >= this->cinfo.num_components) {
+            throw std::runtime_error("Illegal color channel");
+        }
         return this->cinfo.comp_info[channel].MCU_width;
     }
 
     int CoefficientDecoder::get_MCU_height(int channel) {
+        if (channel < 0 || channel >= this->cinfo.num_components) {
+            throw std::runtime_error("Illegal color channel");
+        }
         return this->cinfo.comp_info[channel].MCU_height;
     }
 
     int CoefficientDecoder::get_h_samp_factor(int channel) {
+        if (channel < 0 || channel >= this->cinfo.num_components) {
+            throw std::runtime_error("Illegal color channel");
+        }
         return this->cinfo.comp_info[channel].h_samp_factor;
     }
 
     int CoefficientDecoder::get_v_samp_factor(int channel) {
+        if (channel < 0 || channel >= this->cinfo.num_components) {
+            throw std::runtime_error("Illegal color channel");
+        }
         return this->cinfo.comp_info[channel].v_samp_factor;
     }
 
@@ -177,4 +219,126 @@ namespace decoding {
          * with the stdio data source.
          */
     }
+
+    // Default constructor
+    CoefficientEncoder::CoefficientEncoder () {}
+
+    // Overloaded constructor
+    CoefficientEncoder::CoefficientEncoder (std::string filename, int image_width, int image_height, J_COLOR_SPACE jpeg_color_space) {
+        this->filename = filename;
+        this->image_width = image_width;
+        this->image_height = image_height;
+        this->jpeg_color_space = jpeg_color_space;
+        this->quantization_tables.resize(NUM_QUANT_TBLS);
+    }
+
+    // Destructor
+    CoefficientEncoder::~CoefficientEncoder () {
+    }
+
+    void CoefficientEncoder::set_quantization_table(int table, unsigned short int* input) {
+        if (table < 0 || table >= NUM_QUANT_TBLS) {
+            throw std::runtime_error("Illegal quantization table");
+        }
+        this->quantization_tables[table].assign(input, input + DCTSIZE2);
+    }
+
+    void CoefficientEncoder::add_component(int16_t* input, int width_in_blocks, int height_in_blocks,
+                                           int h_samp_factor, int v_samp_factor, int table) {
+        if (this->num_components >= MAX_COMPONENTS) {
+            throw std::runtime_error("Too many color channels");
+        }
+        if (table < 0 || table >= NUM_QUANT_TBLS) {
+            throw std::runtime_error("Illegal quantization table");
+        }
+        this->coefficients.emplace_back(input, input + width_in_blocks * height_in_blocks * DCTSIZE2);
+        this->width_in_blocks.push_back(width_in_blocks);
+        this->height_in_blocks.push_back(height_in_blocks);
+        this->h_samp_factor.push_back(h_samp_factor);
+        this->v_samp_factor.push_back(v_samp_factor);
+        this->quantization_table_index.push_back(table);
+        this->num_components++;
+    }
+
+    void CoefficientEncoder::write(bool optimize_coding) {
+        struct jpeg_compress_struct cinfo;
+        struct jpeg_error_mgr jerr;
+
+        for (int channel=0; channel < this->num_components; channel++) {
+            if (this->quantization_tables[this->quantization_table_index[channel]].empty()) {
+                throw std::runtime_error("Missing quantization table");
+            }
+        }
+        FILE* outfile = fopen(this->filename.c_str(), "wb");
+        if (NULL == outfile) {
+            throw std::runtime_error("Cannot open output file");
+        }
+
+        // Set up error handling
+        cinfo.err = jpeg_std_error(&jerr);
+        jerr.error_exit = [](j_common_ptr cinfo){
+            char jpegLastErrorMsg[JMSG_LENGTH_MAX];
+            /* Create the message */
+            ( *( cinfo->err->format_message ) ) ( cinfo, jpegLastErrorMsg );
+            /* Jump to the setjmp point */
+            throw std::runtime_error( jpegLastErrorMsg );
+        };
+        jpeg_create_compress(&cinfo);
+        try {
+            jpeg_stdio_dest(&cinfo, outfile);
+
+            // Critical parameters, as jpeg_copy_critical_parameters sets them for a transcoding
+            cinfo.image_width = this->image_width;
+            cinfo.image_height = this->image_height;
+            cinfo.input_components = this->num_components;
+            cinfo.in_color_space = this->jpeg_color_space;
+            jpeg_set_defaults(&cinfo);
+            jpeg_set_colorspace(&cinfo, this->jpeg_color_space);
+            if (cinfo.num_components != this->num_components) {
+                throw std::runtime_error("Number of color channels does not match the color space");
+            }
+            cinfo.optimize_coding = (boolean) optimize_coding;
+            for (int table=0; table < NUM_QUANT_TBLS; table++) {
+                if (!this->quantization_tables[table].empty()) {
+                    // A scale factor of 100 keeps the values of the table, which are not limited to baseline values
+                    jpeg_add_quant_table(&cinfo, table, this->quantization_tables[table].data(), 100, FALSE);
+                }
+            }
+            for (int channel=0; channel < this->num_components; channel++) {
+                jpeg_component_info* compptr = cinfo.comp_info + channel;
+                compptr->h_samp_factor = this->h_samp_factor[channel];
+                compptr->v_samp_factor = this->v_samp_factor[channel];
+                compptr->quant_tbl_no = this->quantization_table_index[channel];
+            }
+
+            // Coefficient arrays, padded to a whole number of MCUs as the decompressor allocates them
+            jvirt_barray_ptr coef_arrays[MAX_COMPONENTS];
+            for (int channel=0; channel < this->num_components; channel++) {
+                int h_samp_factor = this->h_samp_factor[channel];
+                int v_samp_factor = this->v_samp_factor[channel];
+                coef_arrays[channel] = (cinfo.mem->request_virt_barray)((j_common_ptr) &cinfo, JPOOL_IMAGE, TRUE,
+                    (JDIMENSION) ((this->width_in_blocks[channel] + h_samp_factor - 1) / h_samp_factor * h_samp_factor),
+                    (JDIMENSION) ((this->height_in_blocks[channel] + v_samp_factor - 1) / v_samp_factor * v_samp_factor),
+                    (JDIMENSION) v_samp_factor);
+            }
+            (cinfo.mem->realize_virt_arrays)((j_common_ptr) &cinfo);
+            for (int channel=0; channel < this->num_components; channel++) {
+                JDIMENSION width_in_blocks = this->width_in_blocks[channel];
+                for (JDIMENSION row_num=0; row_num < (JDIMENSION) this->height_in_blocks[channel]; row_num++) {
+                    JBLOCKARRAY row_ptr = (cinfo.mem->access_virt_barray)((j_common_ptr) &cinfo, coef_arrays[channel], row_num, (JDIMENSION) 1, TRUE);
+                    memcpy(row_ptr[0][0], &this->coefficients[channel][row_num * width_in_blocks * DCTSIZE2],
+                           width_in_blocks * DCTSIZE2 * sizeof(JCOEF));
+                }
+            }
+
+            jpeg_write_coefficients(&cinfo, coef_arrays);
+            jpeg_finish_compress(&cinfo);
+        } catch (...) {
+            jpeg_destroy_compress(&cinfo);
+            fclose(outfile);
+            throw;
+        }
+        jpeg_destroy_compress(&cinfo);
+        fclose(outfile);
+    }
 }
\ No newline at end of file
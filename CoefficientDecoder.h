@@ -2,6 +2,8 @@
 #define COEFFICIENTDECODER_H
 
 #include <string>
+#include <vector>
+#include <stdio.h>
 #include <jpeglib.h>
 #include <cstdint>
 
@@ -11,12 +13,14 @@ namespace decoding {
             std::string filename;
             CoefficientDecoder();
             CoefficientDecoder(std::string filename);
+            CoefficientDecoder(const unsigned char* buffer, unsigned long buffer_size);
             ~CoefficientDecoder();
 
             void load(bool use_float_dct, bool do_fancy_upsampling, bool do_block_smoothing);
             void unload();
             void get_quantization_table(int channel, unsigned short int* output);
             void get_dct_coefficients(int channel, int16_t* output);
+            void get_dct_coefficient_rows(int channel, int start_row, int num_rows, int16_t* output);
             int get_width_in_blocks(int channel);
             int get_height_in_blocks(int channel);
             int get_output_width();
@@ -32,6 +36,7 @@ namespace decoding {
             int output_width = -1;
             int output_height = -1;
             int output_components = -1;
+            int num_components = -1;
             int max_v_samp_factor = -1;
             int max_h_samp_factor = -1;
             J_COLOR_SPACE jpeg_color_space;
@@ -39,10 +44,41 @@ namespace decoding {
         private:
             int count_quantization_tables();
 
-            FILE* infile;
+            FILE* infile = NULL;
+            // In-memory JPEG, read in place: the buffer must outlive the decoder
+            const unsigned char* buffer = NULL;
+            unsigned long buffer_size = 0;
+            bool loaded = false;
             struct jpeg_decompress_struct cinfo;
             struct jpeg_error_mgr jerr;
     };
+
+    class CoefficientEncoder {
+        public:
+            std::string filename;
+            CoefficientEncoder();
+            CoefficientEncoder(std::string filename, int image_width, int image_height, J_COLOR_SPACE jpeg_color_space);
+            ~CoefficientEncoder();
+
+            void set_quantization_table(int table, unsigned short int* input);
+            void add_component(int16_t* input, int width_in_blocks, int height_in_blocks,
+                               int h_samp_factor, int v_samp_factor, int table);
+            void write(bool optimize_coding);
+
+            int image_width = -1;
+            int image_height = -1;
+            int num_components = 0;
+            J_COLOR_SPACE jpeg_color_space;
+
+        private:
+            std::vector<std::vector<unsigned int>> quantization_tables;
+            std::vector<std::vector<JCOEF>> coefficients;
+            std::vector<int> width_in_blocks;
+            std::vector<int> height_in_blocks;
+            std::vector<int> h_samp_factor;
+            std::vector<int> v_samp_factor;
+            std::vector<int> quantization_table_index;
+    };
 }
 
 #endif
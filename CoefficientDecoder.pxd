@@ -9,13 +9,15 @@ cdef extern from "CoefficientDecoder.h" namespace "decoding":
     cdef cppclass CoefficientDecoder:
         CoefficientDecoder() except +
         CoefficientDecoder(string) except +
-        void load(bint, bint, bint) except +
+        CoefficientDecoder(const unsigned char*, unsigned long) except +
+        void load(bint, bint, bint) nogil except +
         void unload() except +
-        void get_quantization_table(int, unsigned short int *) except +
+        void get_quantization_table(int, unsigned short int *) nogil except +
         int get_width_in_blocks(int) except +
         int get_height_in_blocks(int) except +
-        void get_dct_coefficients(int, int16_t*) except +
-        void get_decompressed_image(uint8_t*) except +
+        void get_dct_coefficients(int, int16_t*) nogil except +
+        void get_dct_coefficient_rows(int, int, int, int16_t*) nogil except +
+        void get_decompressed_image(uint8_t*) nogil except +
         int get_MCU_height(int) except +
         int get_MCU_width(int) except +
         int get_h_samp_factor(int) except +
@@ -27,10 +29,24 @@ cdef extern from "CoefficientDecoder.h" namespace "decoding":
         int output_width
         int output_height
         int output_components
+        int num_components
         int max_h_samp_factor
         int max_v_samp_factor
         _JColorSpace jpeg_color_space
 
+    cdef cppclass CoefficientEncoder:
+        CoefficientEncoder() except +
+        CoefficientEncoder(string, int, int, _JColorSpace) except +
+        void set_quantization_table(int, unsigned short int *) except +
+        void add_component(int16_t*, int, int, int, int, int) except +
+        void write(bint) nogil except +
+
+        string filename
+        int image_width
+        int image_height
+        int num_components
+        _JColorSpace jpeg_color_space
+
 # Enum workaround: see https://github.com/cython/cython/issues/1529
 cdef extern from "jpeglib.h":
     ctypedef enum _JColorSpace "J_COLOR_SPACE":
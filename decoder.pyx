@@ -1,21 +1,52 @@
 # distutils: language = c++
+import os
+import threading
 import numpy as np
 cimport numpy as np
 
-from CoefficientDecoder cimport CoefficientDecoder, _JColorSpace
+from CoefficientDecoder cimport CoefficientDecoder, CoefficientEncoder, _JColorSpace
 from libcpp.string cimport string
 
 
 cdef class PyCoefficientDecoder:
+    """Reads the quantization tables and quantized DCT coefficients of a JPEG image
+
+    The image is either a file, given by its path, or a JPEG in memory, given by any object
+    supporting the buffer protocol (bytes, bytearray, memoryview, mmap). A buffer is read in place,
+    without any copy, and is kept alive by the decoder.
+
+    Thread safety: the GIL is released while libjpeg reads the image (loading, quantization tables,
+    coefficients and decompressed image), so distinct decoders run in parallel in threads. The calls
+    on one decoder are serialized by its lock, a decoder can be shared but is never read concurrently.
+    A buffer must not be modified while a decoder reads it.
+    """
     cdef CoefficientDecoder decoder
+    cdef object buffer
+    cdef object lock
 
     def __cinit__(self, filename, use_float_dct=False, do_fancy_upsampling=True, do_block_smoothing=True):
-        self.decoder = CoefficientDecoder(<string> filename.encode('utf-8'))
-        self.decoder.load(use_float_dct, do_fancy_upsampling, do_block_smoothing)
+        cdef const unsigned char[::1] data
+        cdef bint float_dct = use_float_dct, fancy_upsampling = do_fancy_upsampling, block_smoothing = do_block_smoothing
+        self.lock = threading.Lock()
+        if isinstance(filename, (str, os.PathLike)):
+            self.decoder = CoefficientDecoder(<string> os.fspath(filename).encode('utf-8'))
+        else:
+            data = memoryview(filename).cast('B')
+            if data.shape[0] == 0:
+                raise ValueError("Empty JPEG buffer")
+            self.buffer = data
+            self.decoder = CoefficientDecoder(&data[0], data.shape[0])
+        with nogil:
+            self.decoder.load(float_dct, fancy_upsampling, block_smoothing)
 
     def __dealloc__(self):
         self.decoder.unload()
 
+    cdef int check_channel(self, channel) except -1:
+        if not 0 <= channel < self.decoder.num_components:
+            raise ValueError(f"Illegal color channel {channel}, the image has {self.decoder.num_components} components")
+        return 0
+
     # Attribute access
     @property
     def filename(self):
@@ -41,6 +72,10 @@ cdef class PyCoefficientDecoder:
     def output_components(self):
         return self.decoder.output_components
 
+    @property
+    def num_components(self):
+        return self.decoder.num_components
+
     @property
     def max_v_samp_factor(self):
         return self.decoder.max_v_samp_factor
@@ -54,46 +89,177 @@ cdef class PyCoefficientDecoder:
         return self.decoder.jpeg_color_space
 
     def h_samp_factor(self, channel):
+        self.check_channel(channel)
         return self.decoder.get_h_samp_factor(channel)
 
     def v_samp_factor(self, channel):
+        self.check_channel(channel)
         return self.decoder.get_v_samp_factor(channel)
 
     def get_quantization_table(self, channel):
+        self.check_channel(channel)
         cdef np.ndarray[np.uint16_t, ndim=1, mode="c"] output = np.zeros(64, dtype=np.uint16)
-        self.decoder.get_quantization_table(channel, &output[0])
+        cdef int component = channel
+        with self.lock, nogil:
+            self.decoder.get_quantization_table(component, &output[0])
         return output.reshape((8, 8))
 
     def get_width_in_blocks(self, channel):
+        self.check_channel(channel)
         return self.decoder.get_width_in_blocks(channel)
 
     def get_height_in_blocks(self, channel):
+        self.check_channel(channel)
         return self.decoder.get_height_in_blocks(channel)
 
     def get_MCU_height(self, channel):
+        self.check_channel(channel)
         return self.decoder.get_MCU_height(channel)
 
     def get_MCU_width(self, channel):
+        self.check_channel(channel)
         return self.decoder.get_MCU_width(channel)
 
     def get_dct_coefficients(self, channel):
+        self.check_channel(channel)
         width_in_blocks = self.decoder.get_width_in_blocks(channel)
         height_in_blocks = self.decoder.get_height_in_blocks(channel)
         num_blocks = width_in_blocks * height_in_blocks
         cdef np.ndarray[np.int16_t, ndim=2, mode="c"] output = np.zeros((num_blocks, 64), dtype=np.int16)
-        self.decoder.get_dct_coefficients(channel, &output[0, 0])
+        cdef int component = channel
+        with self.lock, nogil:
+            self.decoder.get_dct_coefficients(component, &output[0, 0])
         return output
 
+    def get_dct_coefficient_rows(self, channel, start_row, num_rows):
+        """Copies the coefficients of num_rows rows of blocks of a component, from the row start_row
+
+        The first call decodes the whole image with jpeg_read_coefficients, libjpeg keeping the
+        coefficients of all the components in memory until the decoder is released.
+        """
+        self.check_channel(channel)
+        num_blocks = num_rows * self.decoder.get_width_in_blocks(channel)
+        cdef np.ndarray[np.int16_t, ndim=2, mode="c"] output = np.empty((num_blocks, 64), dtype=np.int16)
+        cdef int component = channel, start = start_row, count = num_rows
+        if num_blocks == 0:
+            return output
+        with self.lock, nogil:
+            self.decoder.get_dct_coefficient_rows(component, start, count, &output[0, 0])
+        return output
+
+    def iter_dct_coefficient_rows(self, channel, rows_per_step=1):
+        """Yields the coefficients of a component rows_per_step rows of blocks at a time
+
+        Only the rows yielded are copied, e.g. one row of MCUs with rows_per_step = v_samp_factor(channel).
+        This bounds the copies made on the Python side, not the memory of the decoder: libjpeg still holds
+        the coefficients of the whole image, so the peak memory is at least one full copy of them.
+        """
+        self.check_channel(channel)
+        height_in_blocks = self.decoder.get_height_in_blocks(channel)
+        return (self.get_dct_coefficient_rows(channel, start_row, min(rows_per_step, height_in_blocks - start_row))
+                for start_row in range(0, height_in_blocks, rows_per_step))
+
+    def get_coefficient_layout(self):
+        """Layout of the coefficients of all the components in the buffer of get_all_dct_coefficients
+
+        Returns, for each component, its offset in blocks in the buffer, its height and width in blocks,
+        and its horizontal and vertical sampling factors.
+        """
+        layout = []
+        offset = 0
+        for channel in range(self.decoder.num_components):
+            shape = (self.decoder.get_height_in_blocks(channel), self.decoder.get_width_in_blocks(channel))
+            layout.append((offset, shape, (self.decoder.get_h_samp_factor(channel), self.decoder.get_v_samp_factor(channel))))
+            offset += shape[0] * shape[1]
+        return layout
+
+    def get_all_dct_coefficients(self, out=None):
+        """Copies the coefficients of all the components into a single (num_blocks, 64) int16 buffer
+
+        The buffer is allocated, or given by out (C-contiguous, at least as many blocks as the image).
+        Returns the buffer and, for each component, a view of its coefficients in the buffer.
+        """
+        layout = self.get_coefficient_layout()
+        num_blocks = sum(shape[0] * shape[1] for _, shape, _ in layout)
+        if out is None:
+            out = np.empty((num_blocks, 64), dtype=np.int16)
+        cdef np.ndarray[np.int16_t, ndim=2, mode="c"] output = out
+        if output.shape[0] < num_blocks or output.shape[1] != 64:
+            raise ValueError(f"The buffer of shape {out.shape} cannot hold the coefficients of {num_blocks} blocks")
+        cdef int component
+        cdef Py_ssize_t offset
+        with self.lock:
+            for component in range(len(layout)):
+                offset = layout[component][0]
+                with nogil:
+                    self.decoder.get_dct_coefficients(component, &output[offset, 0])
+        return out, [out[offset:offset + shape[0] * shape[1]] for offset, shape, _ in layout]
+
     def get_decompressed_image(self):
         row_stride = self.output_width * self.output_components
         # Add singleton dimension for color channel reshaping later
         output_shape = (self.output_height, row_stride, 1)
         cdef np.ndarray[np.uint8_t, ndim=3, mode="c"] output = np.zeros(output_shape, dtype=np.uint8)
-        self.decoder.get_decompressed_image(&output[0, 0, 0])
+        with self.lock, nogil:
+            self.decoder.get_decompressed_image(&output[0, 0, 0])
         output = output.reshape((self.output_height, self.output_width, self.output_components))
         return output
 
 
+
+cdef class PyCoefficientEncoder:
+    """Writes quantized DCT coefficients and quantization tables to a JPEG file, without any pixel transform
+
+    The tables are set with set_quantization_table and the channels added in order with add_component
+    before calling write. The arrays have the layout returned by PyCoefficientDecoder.
+
+    Thread safety: the GIL is released while libjpeg writes the file, and the calls on one encoder
+    are serialized by its lock, as for PyCoefficientDecoder.
+    """
+    cdef CoefficientEncoder encoder
+    cdef object lock
+
+    def __cinit__(self, filename, image_width, image_height, jpeg_color_space=JColorSpace.JCS_YCbCr):
+        self.lock = threading.Lock()
+        self.encoder = CoefficientEncoder(<string> filename.encode('utf-8'), image_width, image_height,
+                                          <_JColorSpace> jpeg_color_space)
+
+    # Attribute access
+    @property
+    def filename(self):
+        return self.encoder.filename.decode("utf-8")
+
+    @property
+    def image_width(self):
+        return self.encoder.image_width
+
+    @property
+    def image_height(self):
+        return self.encoder.image_height
+
+    @property
+    def num_components(self):
+        return self.encoder.num_components
+
+    def set_quantization_table(self, table, quantization_table):
+        cdef np.ndarray[np.uint16_t, ndim=1, mode="c"] values = np.ascontiguousarray(quantization_table, dtype=np.uint16).reshape(64)
+        with self.lock:
+            self.encoder.set_quantization_table(table, &values[0])
+
+    def add_component(self, dct_coefficients, width_in_blocks, height_in_blocks, h_samp_factor=1, v_samp_factor=1, table=0):
+        num_blocks = width_in_blocks * height_in_blocks
+        cdef np.ndarray[np.int16_t, ndim=2, mode="c"] coefficients = np.ascontiguousarray(dct_coefficients, dtype=np.int16).reshape((num_blocks, 64))
+        if num_blocks == 0:
+            raise ValueError("Empty color channel")
+        with self.lock:
+            self.encoder.add_component(&coefficients[0, 0], width_in_blocks, height_in_blocks, h_samp_factor, v_samp_factor, table)
+
+    def write(self, optimize_coding=True):
+        cdef bint optimize = optimize_coding
+        with self.lock, nogil:
+            self.encoder.write(optimize)
+
+
 cpdef enum JColorSpace:
     JCS_UNKNOWN = _JColorSpace.JCS_UNKNOWN, # error/unspecified
     JCS_GRAYSCALE = _JColorSpace.JCS_GRAYSCALE, # monochrome
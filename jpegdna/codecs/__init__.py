@@ -1,5 +1,7 @@
 """Codecs collection"""
 
+from jpegdna.codecs.jpeg_session import JPEGSession
+from jpegdna.codecs.jpeg_dna_channel import ChannelPlan, get_channel_plan, encode_channel, decode_channel
 from jpegdna.codecs.jpeg_dna_rgb import JPEGDNARGB
 from jpegdna.codecs.jpeg_dna_gray import JPEGDNAGray
 from jpegdna.codecs.jpeg_dna import JpegDNA
@@ -0,0 +1,88 @@
+"""Stateless encoding and decoding of the quantized coefficients of a channel
+
+The functions only read the plan they are given and build their coders on each call, so
+that a single plan can serve concurrent requests, e.g. from the threads of a shared pool.
+"""
+
+from collections import namedtuple
+import numpy as np
+from jpegdna.transforms import ZigZag
+from jpegdna.coders import ACCoefficientCoder, DCCoefficientCoder, ChannelCoder
+from jpegdna.coders import get_codec_plan
+from jpegdna.coders.categorycoder import validate_channel_coefficients
+from jpegdna.tools.loader import get_package_lut, get_package_codebook
+
+ChannelPlan = namedtuple("ChannelPlan", ["codec_plan", "lut", "codebook"])
+EncodedChannel = namedtuple("EncodedChannel", ["strand", "row_offsets", "runlength_nts", "dropped_coefficients"])
+DecodedChannel = namedtuple("DecodedChannel", ["coefficients", "decoded_blocks", "pos"])
+_ZIGZAG = ZigZag(verbose=False)
+
+
+def get_channel_plan(freq_dc, freq_ac):
+    """Returns the plan of a couple of frequency tables
+
+    The coding tables come from the cache of codec plans and the lut and codebooks are
+    loaded once per process. The frequency tables are used as they are, the shift of
+    the frequency of #EOB applied by the codecs must be done beforehand.
+
+    :param freq_dc: DC coefficients frequencies table
+    :type freq_dc: array
+    :param freq_ac: AC coefficients frequencies table
+    :type freq_ac: array
+    :return: Channel plan
+    :rtype: jpegdna.codecs.jpeg_dna_channel.ChannelPlan
+    """
+    return ChannelPlan(get_codec_plan(freq_dc, freq_ac), get_package_lut(), get_package_codebook())
+
+def encode_channel(coeffs, plan):
+    """Encodes the quantized coefficients of a channel into a DNA-like bitstream
+
+    Gives the strand of JPEGDNAGray.encode_coefficients for the frequencies of the plan
+
+    :param coeffs: quantized coefficients of the blocks, DC first
+    :type coeffs: np.array of shape (nb_row_blocks, nb_col_blocks, 64) or (nb_row_blocks, nb_col_blocks, 8, 8)
+    :param plan: Coding tables of the channel
+    :type plan: jpegdna.codecs.jpeg_dna_channel.ChannelPlan
+    :raises ValueError: if a DC difference or an AC coefficient is out of the range of the codebooks
+    :return: Strand, position of the first nucleotide of each row of blocks in the strand, length of the
+             encoded words for the categories and number of nonzero AC coefficients which cannot be coded
+    :rtype: jpegdna.codecs.jpeg_dna_channel.EncodedChannel
+    """
+    coeffs = np.asarray(coeffs)
+    nb_row_blocks, nb_col_blocks = coeffs.shape[:2]
+    coeffs = coeffs.reshape((nb_row_blocks*nb_col_blocks,) + coeffs.shape[2:])
+    validate_channel_coefficients(coeffs, nb_row_blocks, nb_col_blocks)
+    channel_coder = ChannelCoder(plan.lut, plan.codebook)
+    strand, runlength_nts = channel_coder.full_encode(_ZIGZAG.forward_blocks(coeffs), plan.codec_plan.gold_code_dc,
+                                                      plan.codec_plan.gold_code_ac, nb_col_blocks)
+    return EncodedChannel(strand, channel_coder.row_offsets, runlength_nts, channel_coder.dropped_coefficients)
+
+def decode_channel(strand, plan, shape, pos=0, row_offsets=None):
+    """Decodes the quantized coefficients of a channel from a DNA-like bitstream
+
+    :param strand: DNA-like bitstream
+    :type strand: str
+    :param plan: Coding tables of the channel
+    :type plan: jpegdna.codecs.jpeg_dna_channel.ChannelPlan
+    :param shape: number of rows of blocks and number of blocks in a row of blocks
+    :type shape: tuple
+    :param pos: Read position of the first block in the bitstream (default: 0)
+    :type pos: int
+    :param row_offsets: Positions of the rows of blocks from the read position, to decode the rows
+                        independently (default: None)
+    :type row_offsets: np.array
+    :return: Coefficients of the blocks of shape (nb_row_blocks, nb_col_blocks, 64) DC first, False for the blocks
+             that could not be decoded, left at zero, and read position after the last block
+    :rtype: jpegdna.codecs.jpeg_dna_channel.DecodedChannel
+    """
+    nb_row_blocks, nb_col_blocks = shape
+    codec_plan = plan.codec_plan
+    dc_coeff_coder = DCCoefficientCoder(codec_plan.huffman_dc_coder.dic, plan.codebook, trie=codec_plan.trie_dc)
+    ac_coeff_coder = ACCoefficientCoder(codec_plan.huffman_ac_coder.dic, plan.lut, plan.codebook, trie=codec_plan.trie_ac)
+    decode_args = (strand, codec_plan.gold_code_ac, nb_col_blocks, dc_coeff_coder, ac_coeff_coder,
+                   nb_row_blocks*nb_col_blocks, pos)
+    if row_offsets is not None:
+        decode_args += (pos + np.asarray(row_offsets, dtype=np.int64),)
+    seq_coeffs, (pos, decoded_blocks) = ChannelCoder(plan.lut, plan.codebook).full_decode(*decode_args)
+    coeffs = _ZIGZAG.inverse_blocks(seq_coeffs).reshape((nb_row_blocks, nb_col_blocks, 64))
+    return DecodedChannel(coeffs, np.asarray(decoded_blocks).reshape((nb_row_blocks, nb_col_blocks)), pos)
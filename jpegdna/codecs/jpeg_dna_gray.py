@@ -7,17 +7,13 @@ import jpegdna
 from jpegdna.transforms import DCT
 from jpegdna.transforms import ZigZag
 from jpegdna.coders import AbstractCoder
-from jpegdna.coders import ACCoefficientCoder, DCCoefficientCoder
-from jpegdna.coders import GoldmanCoderDNA
-from jpegdna.coders import HuffmanCoder
+from jpegdna.coders import ACCoefficientCoder, DCCoefficientCoder, ChannelCoder
+from jpegdna.coders import get_codec_plan
 from jpegdna.format import JpegDNAFormatter
-from jpegdna.coders.categorycoder import NonDecodableCategory, find_category_dc, count_run_cat
-from jpegdna.tools.loader import load_lut_matrix, load_codebook_matrix
-
-# Imports for Transcoder
-import pyximport
-pyximport.install()
-from decoder import PyCoefficientDecoder 
+from jpegdna.coders.categorycoder import find_categories, count_run_cat_blocks
+from jpegdna.coders.categorycoder import DC_CATEGORY_BOUNDS, validate_channel_coefficients
+from jpegdna.tools.loader import get_package_lut, get_package_codebook
+from jpegdna.codecs.jpeg_session import JPEGSession
 
 
 BLOCK_VERBOSITY_THRESHOLD = 1
@@ -32,11 +28,44 @@ VALUE_CODER_DEBUG_THRESHOLD = 5
 EOB_SHIFT_IDX = 15
 
 
+def image_to_blocks(img, nb_row_blocks, nb_col_blocks):
+    """Splits an image into its 8x8 blocks, row of blocks by row of blocks
+
+    :param img: image of shape (nb_row_blocks*8, nb_col_blocks*8)
+    :type img: np.array
+    :param nb_row_blocks: number of rows of blocks
+    :type nb_row_blocks: int
+    :param nb_col_blocks: number of blocks in a row of blocks
+    :type nb_col_blocks: int
+    :return: blocks
+    :rtype: np.array of shape (nb_row_blocks*nb_col_blocks, 8, 8)
+    """
+    blocks = np.asarray(img).reshape((nb_row_blocks, 8, nb_col_blocks, 8)).transpose((0, 2, 1, 3))
+    return blocks.reshape((-1, 8, 8))
+
+def blocks_to_image(blocks, nb_row_blocks, nb_col_blocks):
+    """Assembles 8x8 blocks into an image, row of blocks by row of blocks
+
+    :param blocks: blocks
+    :type blocks: np.array of shape (nb_row_blocks*nb_col_blocks, 8, 8)
+    :param nb_row_blocks: number of rows of blocks
+    :type nb_row_blocks: int
+    :param nb_col_blocks: number of blocks in a row of blocks
+    :type nb_col_blocks: int
+    :return: image of shape (nb_row_blocks*8, nb_col_blocks*8)
+    :rtype: np.array
+    """
+    img = np.asarray(blocks).reshape((nb_row_blocks, nb_col_blocks, 8, 8)).transpose((0, 2, 1, 3))
+    return img.reshape((nb_row_blocks*8, nb_col_blocks*8))
+
+
 class JPEGDNAGray(AbstractCoder):
     """JPEG-DNA codec for gray-level images
 
     :param aplha: Alpha value (quantization step multiplier)
     :type alpha: float
+    :param img_fpath: Path of the JPEG image, the JPEG image in memory, or its JPEGSession
+    :type img_fpath: str | bytes | jpegdna.codecs.jpeg_session.JPEGSession
     :param formatting: Formatting enabler
     :type formatting: bool
     :param channel_type: Channel type choice ('luma' or 'chroma')
@@ -45,6 +74,11 @@ class JPEGDNAGray(AbstractCoder):
     :param verbose: bool
     :var verbosity: Verbosity level
     :param verbosity: int
+    :param n_workers: Number of processes coding the rows of blocks of a channel in parallel (default: 1)
+    :type n_workers: int
+    :param indexing: Formats the positions of the rows of blocks in the strand as a row index,
+                     for decoding the rows in parallel (default: False)
+    :type indexing: bool
     :ivar alpha: alpha value (compression rate?)
     :vartype alpha: float
     :ivar lut: hexa codes for the categories
@@ -57,6 +91,14 @@ class JPEGDNAGray(AbstractCoder):
     :vartype dc_coeff_coder: jpegdna.coders.coefficientcoder.DCCoefficientCoder
     :ivar ac_coeff_coder: AC coefficient coder
     :vartype ac_coeff_coder: jpegdna.coders.coefficientcoder.ACCoefficientCoder
+    :ivar channel_coder: coder of all the blocks of a channel
+    :vartype channel_coder: jpegdna.coders.channelcoder.ChannelCoder
+    :ivar session: JPEG image loaded once, on first use when a path is given
+    :vartype session: jpegdna.codecs.jpeg_session.JPEGSession
+    :ivar row_offsets: positions of the rows of blocks in the strand of the last channel encoded
+    :vartype row_offsets: np.array
+    :ivar row_index: positions of the rows of blocks of each channel of the last image encoded
+    :vartype row_index: list(np.array)
     """
 
     GAMMAS = np.array([[16, 11, 10, 16, 24, 40, 51, 61],
@@ -76,21 +118,29 @@ class JPEGDNAGray(AbstractCoder):
                               [99, 99, 99, 99, 99, 99, 99, 99],
                               [99, 99, 99, 99, 99, 99, 99, 99]])
     EOB_SHIFT = False
-    def __init__(self, alpha, img_fpath, encoding, formatting=False, primer=None, channel_type="luma", verbose=False, verbosity=0):
-        self.path = self.path = img_fpath # Remember path of image for quantization tables of JPEG image
+    def __init__(self, alpha, img_fpath, encoding, formatting=False, primer=None, channel_type="luma", verbose=False, verbosity=0,
+                 n_workers=1, indexing=False):
+        # Remember the JPEG image for its quantization tables, it is only read once
+        if isinstance(img_fpath, JPEGSession):
+            self.session, self.path = img_fpath, img_fpath.path
+        else:
+            self.session, self.path = None, img_fpath
         self.encoding = encoding # Boolean value used in set_alpha method
         self.channel_type = channel_type
         self.formatting = formatting
         self.primer = primer
         self.gammas = None
         self.set_alpha(alpha, encoding)
-        self.lut = load_lut_matrix(Path(jpegdna.__path__[0] + "/data/lut.mat"))
-        self.codebook = load_codebook_matrix(Path(jpegdna.__path__[0] + "/data/codebook.pkl"))
+        self.lut = get_package_lut()
+        self.codebook = get_package_codebook()
         self.dct = DCT()
         self.zigzag = ZigZag(verbose=False)
         self.total_runlength_nts, self.freq_dc, self.freq_ac, self.m, self.n = None, None, None, None, None
         self.verbose = verbose
         self.verbosity = verbosity
+        self.n_workers = n_workers
+        self.indexing = indexing
+        self.row_offsets, self.row_index = None, None
         self.remain = ""
         if self.formatting:
             self.formatter = JpegDNAFormatter(self.gammas, "gray", None, primer=self.primer, oligo_length=200, debug=False)
@@ -98,6 +148,7 @@ class JPEGDNAGray(AbstractCoder):
             self.formatter = None
         self.dc_coeff_coder = None
         self.ac_coeff_coder = None
+        self.channel_coder = None
         self.huffman_dc_coder = None
         self.huffman_ac_coder = None
 
@@ -107,7 +158,7 @@ class JPEGDNAGray(AbstractCoder):
             quantization tables of the JPEG image
         """
         if encoding:
-            dec = PyCoefficientDecoder(self.path)
+            dec = self.get_session()
             self.alpha = alpha
             if self.channel_type == "luma":
                 self.gammas = np.array(dec.get_quantization_table(0))
@@ -118,6 +169,16 @@ class JPEGDNAGray(AbstractCoder):
             if self.formatting:
                 self.formatter = JpegDNAFormatter(self.alpha, "RGB", None, primer=self.primer, oligo_length=200, debug=False)
             
+    def get_session(self):
+        """Getter for the JPEG session of the image, the image is loaded on the first call
+
+        :return: JPEG session
+        :rtype: jpegdna.codecs.jpeg_session.JPEGSession
+        """
+        if self.session is None:
+            self.session = JPEGSession(self.path)
+        return self.session
+
     def get_alpha(self):
         """Getter for alpha value
 
@@ -168,9 +229,6 @@ class JPEGDNAGray(AbstractCoder):
         if len(args) == 0:
             raise ValueError
         if case == 'encode':
-            min_alpha = self.compute_min_dynamic(args[0])
-            if self.alpha < min_alpha:
-                raise ValueError(f"Invalid alpha value, minimal possible value for this image: {min_alpha}")
             if len(args) < 2:
                 raise ValueError
             if args[1] == "from_img":
@@ -207,46 +265,20 @@ class JPEGDNAGray(AbstractCoder):
             raise ValueError
         return self.total_runlength_nts, self.m, self.n, self.freq_dc, self.freq_ac, self.gammas
 
-    def compute_min_dynamic(self, img, channel_type="luma"):
-        """Compute the minimum possible alpha value for a given image
-
-        :param img: input image
-        :type img: np.array
-        :return: minimum possible alpha value
-        :rtype: float
+    def validate_coefficients(self, DCT_coeffs, nb_row_blocks, nb_col_blocks):
+        """Checks that the quantized coefficients of an image can be coded with the codebooks
+
+        :param DCT_coeffs: quantized coefficients of the blocks, row of blocks by row of blocks, DC first
+        :type DCT_coeffs: np.array of shape (N, 64) or (N, 8, 8)
+        :param nb_row_blocks: number of rows of blocks
+        :type nb_row_blocks: int
+        :param nb_col_blocks: number of blocks in a row of blocks
+        :type nb_col_blocks: int
+        :raises ValueError: if a DC difference or an AC coefficient is out of the range of the codebooks
+        :return: Largest absolute DC difference and AC coefficient, blocks out of range
+        :rtype: jpegdna.coders.categorycoder.CoefficientRanges
         """
-
-        n, m = np.shape(img)[0:2]
-        nb_row_blocks = int(n/8)
-        nb_col_blocks = int(m/8)
-        max_dc_coeff = 0
-        max_ac_coeff = 0
-        for i in range(nb_row_blocks):
-            for j in range(nb_col_blocks):
-                # block definition
-                block = (img[i*8:(i+1)*8, j*8:(j+1)*8]).copy()
-                block = block.astype(int) - 128
-                # dct transform
-                block_dct = self.dct.full_forward(block, "ortho")
-                # quantization
-                if channel_type == "luma":
-                    coeff = np.divide(block_dct, self.GAMMAS).round().astype(int)
-                elif channel_type == "chroma":
-                    coeff = np.divide(block_dct, self.GAMMAS_CHROMA).round().astype(int)
-                else:
-                    raise ValueError("Wrong channel type, either pick 'luma' or 'chroma'")
-                # zigag transform -> sequence of quantized values
-                seq_coeff = self.zigzag.forward(coeff)
-                # computing max DC and AC coefficient
-                if abs(seq_coeff[0]) > max_dc_coeff:
-                    max_dc_coeff = abs(seq_coeff[0])
-                for el in seq_coeff[1:]:
-                    if abs(el) > max_ac_coeff:
-                        max_ac_coeff = abs(el)
-        min_alpha = max_dc_coeff / 72909
-        if min_alpha > max_ac_coeff / 17579:
-            min_alpha = max_ac_coeff / 17579
-        return min_alpha
+        return validate_channel_coefficients(DCT_coeffs, nb_row_blocks, nb_col_blocks)
 
     def set_frequencies_default(self):
         """Sets the frequencies to the package's default frequency tables
@@ -277,46 +309,72 @@ class JPEGDNAGray(AbstractCoder):
         :param inp: input image
         :type inp: np.array
         """
-        self.zigzag.verbose = False
         self.n, self.m = np.shape(inp)[0:2]
-        nb_row_blocks = height_in_blocks # Read from JPEG file instead of computed
-        nb_col_blocks = width_in_blocks # # Read from JPEG file instead of computed
+        self.set_frequencies_from_coefficients(DCT_coeffs, height_in_blocks, width_in_blocks)
+
+    def set_frequencies_from_coefficients(self, DCT_coeffs, nb_row_blocks, nb_col_blocks):
+        """Computes the frenquencies in function of DCT quantized coefficients
+
+        :param DCT_coeffs: quantized coefficients of the blocks, row of blocks by row of blocks
+        :type DCT_coeffs: np.array of shape (N, 64)
+        :param nb_row_blocks: number of rows of blocks
+        :type nb_row_blocks: int
+        :param nb_col_blocks: number of blocks in a row of blocks
+        :type nb_col_blocks: int
+        """
+        self.zigzag.verbose = False
+        self.validate_coefficients(DCT_coeffs, nb_row_blocks, nb_col_blocks)
+
+        # zigag transform of all the blocks at once -> sequences of quantized values
+        seq_coeffs = self.zigzag.forward_blocks(np.asarray(DCT_coeffs, dtype=np.int64)[:nb_row_blocks*nb_col_blocks])
+        # differential coding of the dc values, the prediction restarts on each row of blocks
+        dc_coeffs = seq_coeffs[:, 0].reshape((nb_row_blocks, nb_col_blocks))
+        diffs = np.diff(dc_coeffs, axis=1, prepend=0)
+        # counting categories
         count_cat_dc = np.zeros((11))
-        run_cat_count_tot = np.zeros((160))
-        count_run_end_tot = 0
-        count_run16_tot = 0
-
-        idx = 0 
-        # computing stats on each block
-        for i in range(nb_row_blocks):
-            dc_prev_coeff = 0
-            for j in range(nb_col_blocks):
-
-                # Read quantized DCT coefficients, and reshape them into 8x8 blocks
-                coeff = DCT_coeffs[idx,:].reshape((8,8))
-                idx = idx + 1
-                # Now continue JPEG DNA encoding
-
-                # zigag transform -> sequence of quantized values
-                seq_coeff = self.zigzag.forward(coeff)
-                # differential coding of the dc value
-                diff = seq_coeff[0] - dc_prev_coeff
-                dc_prev_coeff = seq_coeff[0]
-                # counting categories
-                cat_dc = find_category_dc(diff)
-                count_cat_dc[cat_dc] += 1
-                (count_run_end, run_cat_count, count_run16) = count_run_cat(seq_coeff, self.lut)
-                count_run16_tot += count_run16
-                count_run_end_tot += count_run_end
-                run_cat_count_tot += run_cat_count
+        np.add.at(count_cat_dc, find_categories(diffs.ravel(), DC_CATEGORY_BOUNDS), 1)
+        (count_run_end_tot, run_cat_count_tot, count_run16_tot) = count_run_cat_blocks(seq_coeffs, self.lut)
         self.freq_dc = count_cat_dc
         self.freq_ac = np.append(run_cat_count_tot, np.array([count_run16_tot, count_run_end_tot]))
 
+    @staticmethod
+    def count_block_rows(coeffs, nb_col_blocks):
+        """Number of rows of blocks of a group of whole rows of blocks
+
+        :param coeffs: quantized coefficients of a group of rows of blocks
+        :type coeffs: np.array of shape (k*nb_col_blocks, 64)
+        :param nb_col_blocks: number of blocks in a row of blocks
+        :type nb_col_blocks: int
+        :raises ValueError: if the group is not made of whole rows of blocks
+        :return: number of rows of blocks k
+        :rtype: int
+        """
+        if len(coeffs) % nb_col_blocks:
+            raise ValueError(f"A group of {len(coeffs)} blocks is not made of whole rows of {nb_col_blocks} blocks")
+        return len(coeffs) // nb_col_blocks
+
+    def set_frequencies_from_coefficient_rows(self, rows, nb_col_blocks):
+        """Computes the frenquencies in function of DCT quantized coefficients given a few rows of blocks at a time
+
+        :param rows: quantized coefficients of groups of whole rows of blocks
+        :type rows: iterable(np.array of shape (k*nb_col_blocks, 64))
+        :param nb_col_blocks: number of blocks in a row of blocks
+        :type nb_col_blocks: int
+        :raises ValueError: if a group is not made of whole rows of blocks
+        """
+        freq_dc, freq_ac = 0, 0
+        for coeffs in rows:
+            self.set_frequencies_from_coefficients(coeffs, self.count_block_rows(coeffs, nb_col_blocks), nb_col_blocks)
+            freq_dc, freq_ac = freq_dc + self.freq_dc, freq_ac + self.freq_ac
+        self.freq_dc, self.freq_ac = freq_dc, freq_ac
+
     def full_encode(self, inp, *args):
         self.set_state(inp, *args, case='encode')
         out = self.encode(inp)
+        self.row_index = [self.row_offsets]
         if self.formatting:
-            return self.formatter.full_format(out, args[0], *self.get_state()[1:-1])
+            return self.formatter.full_format(out, args[0], *self.get_state()[1:-1],
+                                              row_index=(self.row_index if self.indexing else None))
         else:
             return (out, self.get_state())
 
@@ -333,9 +391,6 @@ class JPEGDNAGray(AbstractCoder):
             #print(f"========================\nEncoding input image:\n{inp}\n========================")
         self.zigzag.verbose = (self.verbose and self.verbosity >= ZIG_ZAG_VERBOSITY_THRESHOLD)
 
-        total_cat_len_count = 0
-        total_run_len_count = 0
-
         self.total_runlength_nts = 0
         self.n, self.m = np.shape(inp)[0:2]
         if self.n%8 != 0:
@@ -345,15 +400,34 @@ class JPEGDNAGray(AbstractCoder):
         nb_row_blocks = int(np.shape(inp)[0]/8)
         nb_col_blocks = int(np.shape(inp)[1]/8)
 
-        gold_coder = GoldmanCoderDNA()
-        if self.verbose and self.verbosity >= HUFFMAN_VERBOSITY_THRESHOLD:
-            print("Building Huffman Coder for DC values")
-            print(f"Frequencies:\n{self.freq_dc}")
-        self.huffman_dc_coder = HuffmanCoder(range(11), self.freq_dc, 3,
-                                             verbose=(self.verbose and self.verbosity >= HUFFMAN_VERBOSITY_THRESHOLD))
+        # centering values of all the blocks
+        centered_blocks = image_to_blocks(inp, nb_row_blocks, nb_col_blocks).astype(int) - 128
+        if self.verbose and self.verbosity >= BLOCK_CENTERING_VERBOSITY_THRESHOLD:
+            print(f"----------\nCentered blocks:\n{centered_blocks}")
+        # dct transform
+        blocks_dct = self.dct.forward_blocks(centered_blocks, "ortho")
+        if self.verbose and self.verbosity >= DCT_VERBOSITY_THRESHOLD:
+            print(f"----------\nForward dct:\n{blocks_dct}")
+        # quantization
+        coeffs = np.divide(blocks_dct, self.gammas)
+        if self.verbose and self.verbosity >= QUANTIZATION_VERBOSITY_THRESHOLD:
+            print(f"----------\nDivided blocks:\n{coeffs}")
+        coeffs = coeffs.round().astype(int)
+        if self.verbose and self.verbosity >= QUANTIZATION_VERBOSITY_THRESHOLD:
+            print(f"----------\nQuantized blocks:\n{coeffs}")
+        return self.encode_coefficients(coeffs, nb_row_blocks, nb_col_blocks)
+
+    def set_encoding_coders(self, n_workers=1):
+        """Builds the Huffman coders from the frequencies, and the coefficient and channel coders
+
+        :param n_workers: Number of processes of the channel coder (default: 1)
+        :type n_workers: int
+        :return: goldman coded values for every DC category and every AC symbol
+        :rtype: list, list
+        """
         if self.verbose and self.verbosity >= HUFFMAN_VERBOSITY_THRESHOLD:
-            print("Building Huffman Coder for AC values")
-            print(f"Frequencies:\n{self.freq_ac}")
+            print("Building Huffman Coders for DC and AC values")
+            print(f"Frequencies:\n{self.freq_dc}\n{self.freq_ac}")
         if self.EOB_SHIFT:
             # Cheating with the position of the codeword for #EOB (the codeword should not be too short)
             dummy_freq_ac_idx = np.argpartition(self.freq_ac, -EOB_SHIFT_IDX)[-EOB_SHIFT_IDX:]
@@ -362,17 +436,9 @@ class JPEGDNAGray(AbstractCoder):
                 self.freq_ac[-1] = abs(val-1)
             else:
                 self.freq_ac[-1] = 1
-        self.huffman_ac_coder = HuffmanCoder(range(162), self.freq_ac, 3,
-                                             verbose=(self.verbose and self.verbosity >= HUFFMAN_VERBOSITY_THRESHOLD))
-
-        huffcode_ac, gold_code_ac = [], []
-        for i in range(162):
-            huffcode_ac.append(self.huffman_ac_coder.encode([str(i)]))
-            gold_code_ac.append(gold_coder.encode(huffcode_ac[i]))
-        huffcode_dc, gold_code_dc = [], []
-        for i in range(11):
-            huffcode_dc.append(self.huffman_dc_coder.encode([str(i)]))
-            gold_code_dc.append(gold_coder.encode(huffcode_dc[i]))
+        plan = get_codec_plan(self.freq_dc, self.freq_ac)
+        self.huffman_dc_coder, self.huffman_ac_coder = plan.huffman_dc_coder, plan.huffman_ac_coder
+        gold_code_dc, gold_code_ac = plan.gold_code_dc, plan.gold_code_ac
 
         if self.verbose and self.verbosity >= GOLDMAN_VERBOSITY_THRESHOLD:
             print(f"DNA codes for DC categories: {gold_code_dc}")
@@ -380,57 +446,104 @@ class JPEGDNAGray(AbstractCoder):
             print("========================")
 
         self.dc_coeff_coder = DCCoefficientCoder(self.huffman_dc_coder.dic, self.codebook,
-                                                 verbose=(self.verbose and self.verbosity >= VALUE_CODER_VERBOSITY_THRESHOLD))
+                                                 verbose=(self.verbose and self.verbosity >= VALUE_CODER_VERBOSITY_THRESHOLD),
+                                                 trie=plan.trie_dc)
         self.ac_coeff_coder = ACCoefficientCoder(self.huffman_ac_coder.dic, self.lut, self.codebook,
-                                                 verbose=(self.verbose and self.verbosity >= VALUE_CODER_VERBOSITY_THRESHOLD))
-        jpeg_coded = ""
-        for i in range(nb_row_blocks):
-            dc_prev_coeff = 0
-            for j in range(nb_col_blocks):
-                # block definition
-                block = (inp[i*8:(i+1)*8, j*8:(j+1)*8]).copy()
-                if self.verbose and self.verbosity >= BLOCK_VERBOSITY_THRESHOLD:
-                    print(f"--------------------\nEncoding block ({i},{j}):\n{block}")
-                # centering values
-                centered_block = block.astype(int) - 128
-                if self.verbose and self.verbosity >= BLOCK_CENTERING_VERBOSITY_THRESHOLD:
-                    print(f"----------\nCentered block ({i},{j}):\n{centered_block}")
-                # dct transform
-                block_dct = self.dct.full_forward(centered_block, "ortho")
-                if self.verbose and self.verbosity >= DCT_VERBOSITY_THRESHOLD:
-                    print(f"----------\nForward dct:\n{block_dct}")
-                # quantization
-                coeff = np.divide(block_dct, self.gammas)
-                if self.verbose and self.verbosity >= QUANTIZATION_VERBOSITY_THRESHOLD:
-                    print(f"----------\nDivided block:\n{coeff}")
-                coeff = coeff.round().astype(int)
-                if self.verbose and self.verbosity >= QUANTIZATION_VERBOSITY_THRESHOLD:
-                    print(f"----------\nQuantized block:\n{coeff}")
-                # zigag transform -> sequence of quantized values
-                seq_coeff = self.zigzag.forward(coeff)
-                # differential coding of the dc value
-                diff = seq_coeff[0] - dc_prev_coeff
-                dc_prev_coeff = seq_coeff[0]
-                # coding the dc and ac values
-                (code_dc, count_cat_len) = self.dc_coeff_coder.full_encode(diff, gold_code_dc)
-                (code_ac, count_runcat_len) = self.ac_coeff_coder.full_encode(seq_coeff, gold_code_ac)
-                # category length
-                total_cat_len_count += count_cat_len
-                total_run_len_count += count_runcat_len
-                # block data formatting
-                code_block = code_dc + code_ac
-                if self.verbose and self.verbosity >= BLOCK_VERBOSITY_THRESHOLD:
-                    print(f"----------\nEncoded block ({i},{j}):\n{code_block}")
-                # adding to stream
-                jpeg_coded += code_block
-        self.total_runlength_nts = total_cat_len_count + total_run_len_count
+                                                 verbose=(self.verbose and self.verbosity >= VALUE_CODER_VERBOSITY_THRESHOLD),
+                                                 trie=plan.trie_ac)
+        self.channel_coder = ChannelCoder(self.lut, self.codebook,
+                                          verbose=(self.verbose and self.verbosity >= BLOCK_VERBOSITY_THRESHOLD),
+                                          n_workers=n_workers)
+        return gold_code_dc, gold_code_ac
+
+    def encode_coefficients(self, coeffs, nb_row_blocks, nb_col_blocks):
+        """JPEG-DNA encoder: encodes quantized DCT coefficients into a DNA-like bitstream
+
+        The coefficients are coded as they are, they can be read from a JPEG file
+        without decoding its pixels
+
+        :param coeffs: quantized coefficients of the blocks, row of blocks by row of blocks
+        :type coeffs: np.array of shape (nb_row_blocks*nb_col_blocks, 8, 8) or (nb_row_blocks*nb_col_blocks, 64)
+        :param nb_row_blocks: number of rows of blocks
+        :type nb_row_blocks: int
+        :param nb_col_blocks: number of blocks in a row of blocks
+        :type nb_col_blocks: int
+        :return: DNA-like bitstream
+        :rtype: str
+        """
+        self.zigzag.verbose = (self.verbose and self.verbosity >= ZIG_ZAG_VERBOSITY_THRESHOLD)
+        self.total_runlength_nts = 0
+        self.validate_coefficients(coeffs, nb_row_blocks, nb_col_blocks)
+
+        gold_code_dc, gold_code_ac = self.set_encoding_coders(n_workers=self.n_workers)
+        # zigag transform -> sequences of quantized values
+        seq_coeffs = self.zigzag.forward_blocks(np.asarray(coeffs)[:nb_row_blocks*nb_col_blocks])
+        # coding the dc and ac values of all the blocks
+        jpeg_coded, self.total_runlength_nts = self.channel_coder.full_encode(seq_coeffs, gold_code_dc, gold_code_ac, nb_col_blocks)
+        self.row_offsets = self.channel_coder.row_offsets
         # if self.verbose:
         #     print(f"========================\nEncoded stream:\n{jpeg_coded}\n========================")
         return jpeg_coded
 
-    def full_decode(self, code, *args):
+    def encode_coefficient_rows(self, rows, nb_col_blocks):
+        """JPEG-DNA encoder: encodes quantized DCT coefficients given a few rows of blocks at a time
+
+        The DC prediction restarting on each row of blocks, the strands yielded for each group of rows
+        concatenate into the strand of encode_coefficients. The frequencies are set beforehand, e.g. by
+        set_frequencies_from_coefficient_rows. Only the coding of the coefficients works on one group of
+        rows at a time, the memory is not bounded: PyCoefficientDecoder keeps the coefficients of the
+        whole image in libjpeg, and the strands yielded make up the strand of the whole image.
+        The positions of the rows of blocks are in self.row_offsets once the generator is exhausted.
+
+        :param rows: quantized coefficients of groups of whole rows of blocks, in order, such as
+                     PyCoefficientDecoder.iter_dct_coefficient_rows
+        :type rows: iterable(np.array of shape (k*nb_col_blocks, 64))
+        :param nb_col_blocks: number of blocks in a row of blocks
+        :type nb_col_blocks: int
+        :raises ValueError: if a group is not made of whole rows of blocks
+        :return: DNA-like bitstream of each group of rows
+        :rtype: generator(str)
+        """
+        self.zigzag.verbose = (self.verbose and self.verbosity >= ZIG_ZAG_VERBOSITY_THRESHOLD)
+        self.total_runlength_nts = 0
+        gold_code_dc, gold_code_ac = self.set_encoding_coders()
+        row_offsets, length = [], 0
+        for coeffs in rows:
+            coeffs = np.asarray(coeffs)
+            nb_row_blocks = self.count_block_rows(coeffs, nb_col_blocks)
+            self.validate_coefficients(coeffs, nb_row_blocks, nb_col_blocks)
+            seq_coeffs = self.zigzag.forward_blocks(coeffs)
+            jpeg_coded, runlength_nts = self.channel_coder.full_encode(seq_coeffs, gold_code_dc, gold_code_ac, nb_col_blocks)
+            self.total_runlength_nts += runlength_nts
+            row_offsets.append(self.channel_coder.row_offsets + length)
+            length += len(jpeg_coded)
+            yield jpeg_coded
+        self.row_offsets = np.concatenate(row_offsets) if row_offsets else np.zeros(0, dtype=np.int64)
+
+    def full_decode(self, code, *args, position=None, coefficients=False, row_offsets=None):
+        """Decoding method
+
+        :param code: Input to decode
+        :type code: str
+        :param args: Decoding arguments
+        :type args: any
+        :param position: Read position in the strand, if given the strand is walked from
+                         this position and the position reached is returned with the image
+        :type position: int
+        :param coefficients: Returns the quantized coefficients of the blocks, with the layout of
+                             PyCoefficientDecoder.get_dct_coefficients, instead of the image (default: False)
+        :type coefficients: bool
+        :param row_offsets: Positions of the rows of blocks from the read position, to decode the rows
+                            independently with self.n_workers processes, read from the row index oligos
+                            when formatting (default: None)
+        :type row_offsets: np.array
+        :return: Decoded image or coefficients (and read position after decoding)
+        :rtype: np.array | (np.array, int)
+        """
         if self.formatting:
             code, (gammas, m, n, freq_dc, freq_ac) = self.formatter.full_deformat(code)
+            if self.formatter.row_index is not None:
+                row_offsets = self.formatter.row_index[0]
             freq_origin = self.formatter.freq_origin
             self.set_gammas(gammas)
             self.set_state(freq_origin, m, n, freq_dc, freq_ac, case='decode')
@@ -445,49 +558,98 @@ class JPEGDNAGray(AbstractCoder):
                 self.freq_ac[-1] = abs(val-1)
             else:
                 self.freq_ac[-1] = 1
-        return self.decode(code)
-
-    def decode(self, code):
+        if coefficients:
+            seq_coeffs, _, pos = self.decode_coefficients_at(code, 0 if position is None else position, row_offsets)
+            dct_coeffs = self.zigzag.inverse_blocks(seq_coeffs).reshape((-1, 64))
+            if position is None:
+                self.remain = code[pos:]
+                return dct_coeffs
+            return dct_coeffs, pos
+        if position is None:
+            return self.decode(code, row_offsets)
+        return self.decode_at(code, position, row_offsets)
+
+    def decode(self, code, row_offsets=None):
         """JPEG-DNA decoder: decodes the input DNA-like bitstream into an block image of size self.n x self.m
 
         :param code: DNA-like bitstream
         :type code: str
+        :param row_offsets: Positions of the rows of blocks in the bitstream (default: None)
+        :type row_offsets: np.array
         :return: block image
         :rtype: np.array
         """
+        jpeg_decoded, pos = self.decode_at(code, 0, row_offsets)
+        # For channel synchronisation in RGB
+        self.remain = code[pos:]
+        return jpeg_decoded
+
+    def reconstruct(self, seq_coeffs, decoded_blocks, nb_row_blocks, nb_col_blocks):
+        """Reconstructs the image from the decoded coefficients of all its blocks
+
+        The inverse zig-zag, dequantization, inverse dct, decentering and clipping
+        are applied to all the blocks at once
+
+        :param seq_coeffs: Sequences of coefficients of the blocks in zig-zag order
+        :type seq_coeffs: np.array of shape (nb_row_blocks*nb_col_blocks, 64)
+        :param decoded_blocks: False for the blocks that could not be decoded, left at zero
+        :type decoded_blocks: np.array
+        :param nb_row_blocks: number of rows of blocks
+        :type nb_row_blocks: int
+        :param nb_col_blocks: number of blocks in a row of blocks
+        :type nb_col_blocks: int
+        :return: Reconstructed image
+        :rtype: np.array
+        """
+        # inverse zigzag transform and inverse quantization
+        blocks = self.zigzag.inverse_blocks(seq_coeffs) * self.gammas
+        if self.verbose and self.verbosity >= QUANTIZATION_VERBOSITY_THRESHOLD:
+            print(f"----------\nDequantized blocks:\n{blocks}")
+        # inverse dct transform + rounding
+        blocks = self.dct.inverse_blocks(blocks, "ortho").round()
+        if self.verbose and self.verbosity >= DCT_VERBOSITY_THRESHOLD:
+            print(f"----------\nInverse dct:\n{blocks}")
+        # decentering values
+        blocks += 128
+        blocks[~decoded_blocks] = 0
+        # adding decoded blocks to image
+        jpeg_decoded = blocks_to_image(blocks, nb_row_blocks, nb_col_blocks)
+        return np.clip(jpeg_decoded[:self.n, :self.m], 0, 255).astype(np.uint8)
+
+    def get_block_dimensions(self):
+        """Getter for the number of rows of blocks and of blocks in a row of blocks of the image
+
+        :return: number of rows of blocks, number of blocks in a row of blocks
+        :rtype: int, int
+        """
+        return -(-self.n // 8), -(-self.m // 8)
+
+    def decode_coefficients_at(self, code, pos, row_offsets=None):
+        """JPEG-DNA entropy decoder: decodes the quantized coefficients of all the blocks from a read position
+
+        With the positions of the rows of blocks, the rows are decoded independently,
+        in parallel with self.n_workers processes.
+
+        :param code: DNA-like bitstream
+        :type code: str
+        :param pos: Read position of the first block in the bitstream
+        :type pos: int
+        :param row_offsets: Positions of the rows of blocks from the read position (default: None)
+        :type row_offsets: np.array
+        :return: sequences of coefficients of the blocks in zig-zag order, False for the blocks
+                 that could not be decoded, read position after the last block
+        :rtype: np.array, np.array, int
+        """
 
         # if self.verbose:
         #     print(f"========================\nDecoding DNA stream:\n{code}\n========================")
         self.zigzag.verbose = (self.verbose and self.verbosity >= ZIG_ZAG_VERBOSITY_THRESHOLD)
-        if self.n%8 == 0:
-            nb_row_blocks = int(self.n/8)
-        else:
-            nb_row_blocks = int(self.n/8) + 1
-        if self.m%8 == 0:
-            nb_col_blocks = int(self.m/8)
-        else:
-            nb_col_blocks = int(self.m/8) + 1
-        jpeg_decoded = np.zeros((nb_row_blocks*8, nb_col_blocks*8))
-
-        gold_coder = GoldmanCoderDNA()
+        nb_row_blocks, nb_col_blocks = self.get_block_dimensions()
         if self.verbose and self.verbosity >= HUFFMAN_VERBOSITY_THRESHOLD:
-            print("Building Huffman Coder for DC values")
-        self.huffman_dc_coder = HuffmanCoder(range(11), self.freq_dc, 3,
-                                             verbose=(self.verbose and self.verbosity >= HUFFMAN_VERBOSITY_THRESHOLD))
-        if self.verbose and self.verbosity >= HUFFMAN_VERBOSITY_THRESHOLD:
-            print("Building Huffman Coder for AC values")
-        self.huffman_ac_coder = HuffmanCoder(range(162), self.freq_ac, 3,
-                                             verbose=(self.verbose and self.verbosity >= HUFFMAN_VERBOSITY_THRESHOLD))
-
-        huffcode_ac, gold_code_ac = [], []
-        for i in range(162):
-            huffcode_ac.append(self.huffman_ac_coder.encode([str(i)]))
-            gold_code_ac.append(gold_coder.encode(huffcode_ac[i]))
-
-        huffcode_dc, gold_code_dc = [], []
-        for i in range(11):
-            huffcode_dc.append(self.huffman_dc_coder.encode([str(i)]))
-            gold_code_dc.append(gold_coder.encode(huffcode_dc[i]))
+            print("Building Huffman Coders for DC and AC values")
+        plan = get_codec_plan(self.freq_dc, self.freq_ac)
+        self.huffman_dc_coder, self.huffman_ac_coder = plan.huffman_dc_coder, plan.huffman_ac_coder
+        gold_code_dc, gold_code_ac = plan.gold_code_dc, plan.gold_code_ac
 
         if self.verbose and self.verbosity >= GOLDMAN_VERBOSITY_THRESHOLD:
             print(f"DNA codes for DC categories: {gold_code_dc}")
@@ -495,72 +657,42 @@ class JPEGDNAGray(AbstractCoder):
             print("========================")
 
         self.dc_coeff_coder = DCCoefficientCoder(self.huffman_dc_coder.dic, self.codebook,
-                                                 verbose=(self.verbose and self.verbosity >= VALUE_CODER_VERBOSITY_THRESHOLD))
+                                                 verbose=(self.verbose and self.verbosity >= VALUE_CODER_VERBOSITY_THRESHOLD),
+                                                 trie=plan.trie_dc)
         self.ac_coeff_coder = ACCoefficientCoder(self.huffman_ac_coder.dic, self.lut, self.codebook,
-                                                 verbose=(self.verbose and self.verbosity >= VALUE_CODER_VERBOSITY_THRESHOLD))
-
-        for i in range(nb_row_blocks):
-            dc_prev_coeff = 0
-            for j in range(nb_col_blocks):
-                # decoding block from bitstream
-                try:
-                    if self.verbose and self.verbosity >= BLOCK_VERBOSITY_THRESHOLD:
-                        print(f"--------------------\nDecoding block ({i},{j}):")
-                    seq_coeff = []
-                    if code == "":
-                        seq_coeff = [0]*64
-                    else:
-                        (value, (num_bits)) = self.dc_coeff_coder.full_decode(code)
-                        code = code[num_bits:]
-                        coefficient = dc_prev_coeff + value
-                        seq_coeff = [coefficient]
-                        dc_prev_coeff = coefficient
-                        while len(seq_coeff) < 64:
-                            if code == "":
-                                for _ in range(64-len(seq_coeff)):
-                                    seq_coeff.append(0)
-                            else:
-                                (coeff, (num_zeros, num_bits, end_of_block)) = self.ac_coeff_coder.full_decode(code)
-                                if end_of_block:
-                                    for _ in range(64-len(seq_coeff)):
-                                        seq_coeff.append(0)
-                                    length = len(gold_code_ac[161])
-                                    code = code[length:]
-                                else:
-                                    for _ in range(num_zeros):
-                                        seq_coeff.append(0)
-                                    seq_coeff.append(coeff)
-                                    code = code[num_bits:]
-                except NonDecodableCategory:
-                    print("Category undecodable, synchronising to next block")
-                    eob_str = gold_code_ac[161]
-                    for l in range(len(code)-len(eob_str)):
-                        if code[l:l+len(eob_str)] == eob_str:
-                            code = code[l+len(eob_str):]
-                            break
-                    continue
-                # inverse zigzag transform
-                block = self.zigzag.full_inverse(seq_coeff, 8, 8)
-                # inverse quantization
-                block = block * self.gammas
-                if self.verbose and self.verbosity >= QUANTIZATION_VERBOSITY_THRESHOLD:
-                    print(f"----------\nDequantized block:\n{block}")
-                # inverse dct transform + rounding
-                block = (self.dct.full_inverse(block, "ortho")).round()
-                if self.verbose and self.verbosity >= DCT_VERBOSITY_THRESHOLD:
-                    print(f"----------\nInverse dct:\n{block}")
-                # decentering values
-                block += 128
-                if self.verbose and self.verbosity >= BLOCK_CENTERING_VERBOSITY_THRESHOLD:
-                    print(f"--------------------\nDecentered block ({i},{j}):\n{block}")
-                # adding decoded block to image
-                jpeg_decoded[i*8:(i+1)*8, j*8:(j+1)*8] = block
-                if self.verbose and self.verbosity >= BLOCK_VERBOSITY_THRESHOLD:
-                    print(f"--------------------\nDecoded block ({i},{j}):\n{block}")
-        jpeg_decoded = np.clip(jpeg_decoded[:self.n, :self.m], 0, 255).astype(np.uint8)
-        # For channel synchronisation in RGB
-        self.remain = code
+                                                 verbose=(self.verbose and self.verbosity >= VALUE_CODER_VERBOSITY_THRESHOLD),
+                                                 trie=plan.trie_ac)
+
+        # Phase one: entropy decoding of the zig-zag sequences of all the blocks
+        self.channel_coder = ChannelCoder(self.lut, self.codebook,
+                                          verbose=(self.verbose and self.verbosity >= BLOCK_VERBOSITY_THRESHOLD),
+                                          n_workers=self.n_workers)
+        decode_args = (code, gold_code_ac, nb_col_blocks, self.dc_coeff_coder, self.ac_coeff_coder,
+                       nb_row_blocks*nb_col_blocks, pos)
+        if row_offsets is not None:
+            decode_args += (pos + np.asarray(row_offsets, dtype=np.int64),)
+        seq_coeffs, (pos, decoded_blocks) = self.channel_coder.full_decode(*decode_args)
+        self.zigzag.verbose = False
+        return seq_coeffs, decoded_blocks, pos
+
+    def decode_at(self, code, pos, row_offsets=None):
+        """JPEG-DNA decoder walking the bitstream with a read position instead of slicing it
+
+        :param code: DNA-like bitstream
+        :type code: str
+        :param pos: Read position of the first block in the bitstream
+        :type pos: int
+        :param row_offsets: Positions of the rows of blocks from the read position (default: None)
+        :type row_offsets: np.array
+        :return: block image, read position after the last block
+        :rtype: np.array, int
+        """
+        # Phase one: entropy decoding of the zig-zag sequences of all the blocks
+        seq_coeffs, decoded_blocks, pos = self.decode_coefficients_at(code, pos, row_offsets)
+        nb_row_blocks, nb_col_blocks = self.get_block_dimensions()
+        # Phase two: reconstruction of all the blocks
+        jpeg_decoded = self.reconstruct(seq_coeffs, decoded_blocks, nb_row_blocks, nb_col_blocks)
         #if self.verbose:
             #print(f"========================\nReconstructed image:\n{jpeg_decoded}\n========================")
         self.zigzag.verbose = False
-        return jpeg_decoded
+        return jpeg_decoded, pos
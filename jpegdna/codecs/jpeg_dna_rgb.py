@@ -1,7 +1,10 @@
 """Encoding and decoding main functions for JPEG-DNA in RGB"""
 
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
 import pickle
+import warnings
 import jpegdna
 from jpegdna.codecs.jpeg_dna_gray import JPEGDNAGray
 from jpegdna.transforms import RGBYCbCr, ChannelSampler
@@ -10,7 +13,7 @@ from jpegdna.format import JpegDNAFormatter
 # Imports for Transcoder
 import pyximport
 pyximport.install()
-from decoder import PyCoefficientDecoder 
+from decoder import PyCoefficientEncoder
 import numpy as np
 
 CHANNEL_VERBOSITY_THRESHOLD = 0
@@ -20,6 +23,55 @@ CHANNEL_SAMPLER_VERBOSITY_THRESHOLD = 1
 GRAY_CODEC_VERBOSITY_THRESHOLD = 3
 
 
+def _encode_channel(codec, data, from_img, freqs, coefficients):
+    """Encodes a channel on a gray-level codec set up with the quantization table of the channel
+
+    :param codec: codec of the channel
+    :type codec: jpegdna.codecs.jpeg_dna_gray.JPEGDNAGray
+    :param data: coefficients, height and width in blocks, height and width of the channel (coefficients),
+                 or the channel and, for the frequencies from the image, its coefficients, height and width in blocks
+    :type data: tuple
+    :param from_img: Computes the frequencies from the channel
+    :type from_img: bool
+    :param freqs: DC and AC frequencies otherwise
+    :type freqs: tuple
+    :param coefficients: Codes the quantized coefficients instead of transforming the channel
+    :type coefficients: bool
+    :return: strand, state of the codec, positions of the rows of blocks, number of dropped AC coefficients
+    :rtype: str, tuple, np.array, int
+    """
+    if coefficients:
+        coeffs, nb_row_blocks, nb_col_blocks, codec.n, codec.m = data
+        if from_img:
+            codec.set_frequencies_from_coefficients(coeffs, nb_row_blocks, nb_col_blocks)
+    elif from_img:
+        codec.set_frequencies_from_img(*data)
+    if freqs is not None:
+        codec.set_frequencies_from_array(*freqs)
+    if coefficients:
+        strand = JPEGDNAGray.encode_coefficients(codec, coeffs, nb_row_blocks, nb_col_blocks)
+        dropped = codec.channel_coder.dropped_coefficients
+    else:
+        strand, dropped = JPEGDNAGray.encode(codec, data[0]), 0
+    return strand, JPEGDNAGray.get_state(codec), codec.row_offsets, dropped
+
+def _encode_channel_in_worker(options, job):
+    """Encodes a channel in a worker process, on a gray-level codec of its own"""
+    alpha, channel_type, gammas, verbose, verbosity, n_workers = options
+    codec = JPEGDNAGray(alpha, None, False, channel_type=channel_type, verbose=verbose, verbosity=verbosity,
+                        n_workers=n_workers)
+    codec.set_gammas(gammas)
+    return _encode_channel(codec, *job)
+
+def _decode_channel_in_worker(options, job):
+    """Decodes the strand of a channel in a worker process, on a gray-level codec of its own"""
+    verbose, verbosity, n_workers = options
+    strand, channel_args, row_offsets, coefficients = job
+    codec = JPEGDNAGray(None, None, False, verbose=verbose, verbosity=verbosity, n_workers=n_workers)
+    decoded, _ = codec.full_decode(strand, *channel_args, position=0, coefficients=coefficients, row_offsets=row_offsets)
+    return decoded, (codec.n, codec.m)
+
+
 class JPEGDNARGB(JPEGDNAGray):
     """JPEG-DNA codec for RGB images
 
@@ -27,12 +79,26 @@ class JPEGDNARGB(JPEGDNAGray):
     :type alpha: float
     :param formatting: Formatting enabler
     :type formatting: bool
+    :param img_fpath: Path of the JPEG image, the JPEG image in memory, or its JPEGSession
+    :type img_fpath: str | bytes | jpegdna.codecs.jpeg_session.JPEGSession
     :param channel_sampler: Sampler name used to subsample chrominance channels
     :type channel_sampler: str
     :var verbose: Verbosity enabler
     :param verbose: bool
     :var verbosity: Verbosity level
     :param verbosity: int
+    :param n_workers: Number of processes coding the rows of blocks of a channel in parallel (default: 1)
+    :type n_workers: int
+    :param indexing: Formats the positions of the rows of blocks of each channel in the strand as a row index,
+                     for decoding the rows in parallel (default: False)
+    :type indexing: bool
+    :param channel_workers: Number of processes coding the Y, Cb and Cr channels concurrently,
+                            each one on a codec of its own (default: 1)
+    :type channel_workers: int
+    :param channel_indexing: Formats the lengths of the strands of the channels in a channel lengths oligo,
+                             for decoding the channels concurrently. Decoders not aware of this oligo
+                             cannot read the archive (default: False)
+    :type channel_indexing: bool
     :ivar alpha: alpha value (compression rate?)
     :vartype alpha: float
     :ivar lut: hexa codes for the categories
@@ -41,19 +107,26 @@ class JPEGDNARGB(JPEGDNAGray):
     :vartype dct: jpegdna.transforms.dctransform.DCT
     :ivar zigzag: Zigzag transform
     :vartype zigzag: jpegdna.transforms.zigzag.ZigZag
+    :ivar channel_lengths: lengths of the strands of the channels of the last image encoded
+    :vartype channel_lengths: list(int)
     """
 
     # Path of JPEG image, and type of subsampling passed as additional arguments
-    def __init__(self, alpha, img_fpath, channel_sampler, encoding, formatting=False, primer=None, verbose=False, verbosity=0):
-        self.path = img_fpath # Remember path of image for reading DCT coefficients and quantization tables of JPEG image
+    def __init__(self, alpha, img_fpath, channel_sampler, encoding, formatting=False, primer=None, verbose=False, verbosity=0,
+                 n_workers=1, indexing=False, channel_workers=1, channel_indexing=False):
         self.sampler_name = channel_sampler # Now passed as an argument
+        self.channel_workers = channel_workers
+        self.channel_indexing = channel_indexing
+        self.channel_lengths = None
         self.encoding = encoding # Boolean value used in set_alpha method
         self.primer = primer
         super().__init__(alpha, img_fpath, encoding,
                          formatting=formatting,
                          primer=self.primer,
                          verbose=(verbose and verbosity >= GRAY_CODEC_VERBOSITY_THRESHOLD),
-                         verbosity=verbosity-3)
+                         verbosity=verbosity-3,
+                         n_workers=n_workers,
+                         indexing=indexing)
         self.verbose_rgb = verbose
         if formatting:
             self.formatter = JpegDNAFormatter(None,
@@ -72,7 +145,7 @@ class JPEGDNARGB(JPEGDNAGray):
             quantization tables of the JPEG image
         """
         if encoding:
-            dec = PyCoefficientDecoder(self.path)
+            dec = self.get_session()
             self.alpha = alpha
             if self.channel_type == "luma":
                 self.gammas = np.array(dec.get_quantization_table(0))
@@ -96,14 +169,6 @@ class JPEGDNARGB(JPEGDNAGray):
             self.formatter = JpegDNAFormatter(self.gammas, "RGB", sampler=self.sampler_name,
                                               primer=self.primer, oligo_length=200, debug=False)
 
-    # pylint: disable=invalid-name
-    def compute_min_dynamic(self, img, channel_type=None):
-        alphamin_Y = super().compute_min_dynamic(img[0], channel_type="luma")
-        alphamin_Cb = super().compute_min_dynamic(img[1], channel_type="chroma")
-        alphamin_Cr = super().compute_min_dynamic(img[2], channel_type="chroma")
-        return max(alphamin_Y, alphamin_Cb, alphamin_Cr)
-    # pylint: enable=invalid-name
-
     def set_frequencies_default_rgb(self, channel):
         """Sets the frequencies to the package's default frequency tables
         """
@@ -121,159 +186,211 @@ class JPEGDNARGB(JPEGDNAGray):
             freqs = pickle.load(file)
         return freqs[channel]['freq_dc'], freqs[channel]['freq_ac']
 
+    def read_coefficients(self, dec):
+        """Reads the quantized coefficients of the 3 channels of the JPEG image, without decoding its pixels
+
+        :param dec: JPEG session of the image
+        :type dec: jpegdna.codecs.jpeg_session.JPEGSession
+        :return: for each channel, the coefficients of its blocks, its height and width in blocks,
+                 and its height and width in pixels
+        :rtype: list(tuple)
+        """
+        channels = []
+        for channel in range(3):
+            # dimensions of the downsampled channel
+            height = -(-dec.image_height * dec.v_samp_factor(channel) // dec.max_v_samp_factor)
+            width = -(-dec.image_width * dec.h_samp_factor(channel) // dec.max_h_samp_factor)
+            channels.append((dec.get_dct_coefficients(channel), dec.get_height_in_blocks(channel),
+                             dec.get_width_in_blocks(channel), height, width))
+        # the channels must be sampled as the channel sampler expects it for the decoding,
+        # the sampling factors being compared relatively to the largest ones
+        factors = self.channel_sampler.get_sampling_factors()
+        max_h, max_v = max(h for h, _ in factors), max(v for _, v in factors)
+        if any(Fraction(h, max_h) != Fraction(dec.h_samp_factor(channel), dec.max_h_samp_factor) or
+               Fraction(v, max_v) != Fraction(dec.v_samp_factor(channel), dec.max_v_samp_factor)
+               for channel, (h, v) in enumerate(factors)):
+            raise ValueError(f"The sampling of the JPEG image does not match the channel sampler {self.sampler_name}")
+        return channels
+
+    def write_coefficients(self, jpeg_fpath, channels, dimensions, gamma_tables):
+        """Writes the quantized coefficients of the 3 channels to a baseline JPEG file, without any pixel transform
+
+        :param jpeg_fpath: Path of the JPEG file
+        :type jpeg_fpath: str
+        :param channels: coefficients of the blocks of each channel, in natural order
+        :type channels: tuple(np.array)
+        :param dimensions: height and width in pixels of each channel
+        :type dimensions: list(tuple)
+        :param gamma_tables: quantization table of each channel
+        :type gamma_tables: list
+        """
+        enc = PyCoefficientEncoder(jpeg_fpath, dimensions[0][1], dimensions[0][0])
+        # Cb and Cr share the chroma table unless they were coded with different ones
+        tables = [0, 1, 1 if np.array_equal(gamma_tables[1], gamma_tables[2]) else 2]
+        for table in sorted(set(tables)):
+            enc.set_quantization_table(table, gamma_tables[tables.index(table)])
+        for coeffs, (height, width), (h_samp, v_samp), table in zip(channels, dimensions,
+                                                                    self.channel_sampler.get_sampling_factors(), tables):
+            enc.add_component(coeffs, -(-width // 8), -(-height // 8), h_samp, v_samp, table)
+        enc.write()
+
     # pylint: disable=invalid-name
-    def full_encode(self, inp, *args):
+    def full_encode(self, inp, *args, coefficients=False):
+        """Encoding method
+
+        :param inp: Input image (ignored when coding the coefficients of the JPEG image)
+        :type inp: np.array
+        :param args: Encoding arguments
+        :type args: any
+        :param coefficients: Codes the quantized coefficients read from the JPEG image, whose pixels
+                             are never decoded, instead of transforming the input image (default: False)
+        :type coefficients: bool
+        :return: Encoded image (formatted or with the state of the channels and the quantization tables)
+        :rtype: list | (str, tuple, list)
+        """
         if self.verbose_rgb:
             print(f"========================\nTranscoding input image\n========================")
         if len(args) == 0:
             raise ValueError
-        YCbCr = self.channel_sampler.forward(self.color_converter.forward(inp))
-        #Computing min dynamic
-        min_alpha = self.compute_min_dynamic(YCbCr)
-        if self.alpha < min_alpha:
-            raise ValueError(f"Invalid alpha value, minimal possible value for this image: {min_alpha}")
-        #Computing frequencies
-        Y, Cb, Cr = YCbCr # Ignore, kept to avoid errors with the original code
-        gamma_tables = [None, None, None]
-
-        # Transcoder: Init. coefficient decoder
-        dec = PyCoefficientDecoder(self.path)
-
-        # Encoding Y
-        self.set_channel_type("luma")
-        gamma_tables[0] = self.get_gammas()
-        if args[0] == "from_img":
-            # Read DCT coefficients of L channel and also its height and width in blocks
-            self.set_frequencies_from_img(Y, np.array(dec.get_dct_coefficients(0)), dec.get_height_in_blocks(0), dec.get_width_in_blocks(0))
-        # Not relevant to Transcoder
-        elif args[0] == "default":
-            if len(args) != 1:
-                raise ValueError
-            self.set_frequencies_default_rgb("Y")
-        elif args[0] == "from_file":
-            if len(args) <= 3:
-                raise ValueError
-            self.set_frequencies_from_array(args[1][0], args[1][1])
-        else:
-            raise ValueError
-        str_Y = super().encode(Y)
-        res_Y = super().get_state()
-
-        # Encoding Cb
-        self.set_channel_type("chroma")
-        gamma_tables[1] = self.get_gammas()
-        if args[0] == "from_img":
-            # Read DCT coefficients of Cb channel and also its height and width in blocks
-            self.set_frequencies_from_img(Cb, np.array(dec.get_dct_coefficients(1)), dec.get_height_in_blocks(1), dec.get_width_in_blocks(1))
-        # Not relevant to Transcoder
-        elif args[0] == "default":
-            if len(args) != 1:
-                raise ValueError
-            self.set_frequencies_default_rgb("Cb")
-        elif args[0] == "from_file":
-            if len(args) <= 3:
-                raise ValueError
-            self.set_frequencies_from_array(args[2][0], args[2][1])
+        # Transcoder: the JPEG image is read once by its session
+        dec = self.get_session()
+        # The coefficients are checked against the range of the codebooks when they are coded
+        if coefficients:
+            channels = self.read_coefficients(dec)
         else:
-            raise ValueError
-        str_Cb = super().encode(Cb)
-        res_Cb = super().get_state()
-
-        # Encoding Cr
-        self.set_channel_type("chroma")
-        gamma_tables[2] = self.get_gammas()
-        if args[0] == "from_img":
-            # Read DCT coefficients of Cr channel and also its height and width in blocks
-            self.set_frequencies_from_img(Cr, np.array(dec.get_dct_coefficients(2)), dec.get_height_in_blocks(2), dec.get_width_in_blocks(2))
-        # Not relevant to Transcoder
-        elif args[0] == "default":
-            if len(args) != 1:
-                raise ValueError
-            self.set_frequencies_default_rgb("Cr")
-        elif args[0] == "from_file":
-            if len(args) <= 3:
+            YCbCr = self.channel_sampler.forward(self.color_converter.forward(inp))
+        gamma_tables = [None, None, None]
+        outputs, jobs = [], []
+        for channel, (name, channel_type) in enumerate(zip(["Y", "Cb", "Cr"], ["luma", "chroma", "chroma"])):
+            self.set_channel_type(channel_type)
+            gamma_tables[channel] = self.get_gammas()
+            freqs = None
+            # Not relevant to Transcoder
+            if args[0] == "default":
+                if len(args) != 1:
+                    raise ValueError
+                freqs = self.get_default_frequencies_rgb(name)
+            elif args[0] == "from_file":
+                if len(args) <= 3:
+                    raise ValueError
+                freqs = (args[channel+1][0], args[channel+1][1])
+            elif args[0] != "from_img":
                 raise ValueError
-            self.set_frequencies_from_array(args[3][0], args[3][1])
-        else:
-            raise ValueError
-        str_Cr = super().encode(Cr)
-        res_Cr = super().get_state()
+            if coefficients:
+                data = channels[channel]
+            elif args[0] == "from_img":
+                # Read DCT coefficients of the channel and also its height and width in blocks
+                data = (YCbCr[channel], dec.get_dct_coefficients(channel),
+                        dec.get_height_in_blocks(channel), dec.get_width_in_blocks(channel))
+            else:
+                data = (YCbCr[channel],)
+            job = (data, args[0] == "from_img", freqs, coefficients)
+            if self.channel_workers > 1:
+                jobs.append(((self.alpha, channel_type, gamma_tables[channel], self.verbose, self.verbosity, self.n_workers), job))
+            else:
+                outputs.append(_encode_channel(self, *job))
+        # The channels share nothing but the concatenation of their strands
+        if jobs:
+            with ProcessPoolExecutor(min(self.channel_workers, len(jobs))) as executor:
+                outputs = list(executor.map(_encode_channel_in_worker, *zip(*jobs)))
+        strands, results, row_index, dropped = zip(*outputs)
+        for name, count in zip(["Y", "Cb", "Cr"], dropped):
+            if count:
+                warnings.warn(f"{count} AC coefficients of the channel {name} follow " +
+                              "16 modulo 17 zeros, they cannot be coded and will be decoded as zeros", RuntimeWarning)
+        res_Y, res_Cb, res_Cr = results
+        self.row_index = list(row_index)
+        self.channel_lengths = [len(strand) for strand in strands]
         if self.formatting:
             self.set_gammas(gamma_tables)
-            return self.formatter.full_format(str_Y + str_Cb + str_Cr, args[0],
+            return self.formatter.full_format("".join(strands), args[0],
                                               res_Y[1], res_Y[2],
                                               (res_Y[3], res_Cb[3], res_Cr[3]),
-                                              (res_Y[4], res_Cb[4], res_Cr[4]))
+                                              (res_Y[4], res_Cb[4], res_Cr[4]),
+                                              row_index=(self.row_index if self.indexing else None),
+                                              channel_lengths=(self.channel_lengths if self.channel_indexing else None))
         else:
-            return (str_Y + str_Cb + str_Cr, (res_Y, res_Cb, res_Cr), gamma_tables)
+            return ("".join(strands), (res_Y, res_Cb, res_Cr), gamma_tables)
+
+    def full_decode(self, code, *args, jpeg_fpath=None, row_index=None, channel_lengths=None):
+        """Decoding method
 
-    def full_decode(self, code, *args):
+        The channels are decoded one after the other, each one from the end of the previous one,
+        or from its start in the data strand when the lengths of their strands are known. With the
+        lengths and channel_workers > 1, the data strand is cut into the strands of the channels,
+        decoded concurrently.
+
+        :param code: Input to decode
+        :type code: str | list
+        :param args: Decoding arguments
+        :type args: any
+        :param jpeg_fpath: Path of a JPEG file where the decoded quantized coefficients are written
+                           without reconstructing the pixels (default: None)
+        :type jpeg_fpath: str
+        :param row_index: Positions of the rows of blocks of each channel from the start of the channel,
+                          to decode the rows independently with self.n_workers processes, read from the
+                          row index oligos when formatting (default: None)
+        :type row_index: list(np.array)
+        :param channel_lengths: Lengths of the strands of the channels, read from the channel lengths
+                                oligo when formatting (default: None)
+        :type channel_lengths: list(int)
+        :return: Decoded image, or path of the JPEG file
+        :rtype: np.array | str
+        """
         if self.formatting:
             code, (gamma_tables, m, n, freq_dc_out, freq_ac_out) = self.formatter.full_deformat(code)
             freq_origin = self.formatter.freq_origin
+            row_index = self.formatter.row_index
+            channel_lengths = self.formatter.channel_lengths
         else:
             gamma_tables = args[-1]
+        if row_index is None:
+            row_index = [None, None, None]
+        coefficients = jpeg_fpath is not None
 
-        self.set_gammas(gamma_tables[0])
-        formatting = self.formatting
-        self.formatting = False
-
-        if formatting:
-            if freq_origin == "from_img" or freq_origin == "from_array":
-                Y = super().full_decode(code, freq_origin, m[0], n[0], freq_dc_out[0], freq_ac_out[0], gamma_tables[0])
-            elif freq_origin == "default":
-                freq_dc, freq_ac = self.get_default_frequencies_rgb('Y')
-                Y = super().full_decode(code, "from_file", m[0], n[0], freq_dc, freq_ac, gamma_tables[0])
-            else:
-                raise ValueError("Wrong parameters")
-        else:
-            if args[0] == "from_img" or args[0] == "from_array":
-                Y = super().full_decode(code, args[0], args[1][0][0], args[1][0][1], args[1][0][2], args[1][0][3], gamma_tables[0])
-            elif args[0] == "default":
-                freq_dc, freq_ac = self.get_default_frequencies_rgb('Y')
-                Y = super().full_decode(code, "from_file", args[1][0][0], args[1][0][1], freq_dc, freq_ac, gamma_tables[0])
-            else:
-                raise ValueError("Wrong parameters")
-        code = self.remain
-
-        self.set_gammas(gamma_tables[1])
-        if formatting:
-            if freq_origin == "from_img" or freq_origin == "from_array":
-                Cb = super().full_decode(code, freq_origin, m[1], n[1], freq_dc_out[1], freq_ac_out[1], gamma_tables[1])
-            elif freq_origin == "default":
-                freq_dc, freq_ac = self.get_default_frequencies_rgb('Cb')
-                Cb = super().full_decode(code, "from_file", m[1], n[1], freq_dc, freq_ac, gamma_tables[1])
-            else:
-                raise ValueError("Wrong parameters")
-        else:
-            if args[0] == "from_img" or args[0] == "from_array":
-                Cb = super().full_decode(code, args[0], args[1][1][0], args[1][1][1], args[1][1][2], args[1][1][3], gamma_tables[1])
-            elif args[0] == "default":
-                freq_dc, freq_ac = self.get_default_frequencies_rgb('Cb')
-                Cb = super().full_decode(code, "from_file", args[1][1][0], args[1][1][1], freq_dc, freq_ac, gamma_tables[1])
+        channel_args = []
+        for channel, name in enumerate(["Y", "Cb", "Cr"]):
+            if self.formatting:
+                if freq_origin == "from_img" or freq_origin == "from_array":
+                    channel_args.append((freq_origin, m[channel], n[channel], freq_dc_out[channel], freq_ac_out[channel]))
+                elif freq_origin == "default":
+                    freq_dc, freq_ac = self.get_default_frequencies_rgb(name)
+                    channel_args.append(("from_file", m[channel], n[channel], freq_dc, freq_ac))
+                else:
+                    raise ValueError("Wrong parameters")
             else:
-                raise ValueError("Wrong parameters")
-        code = self.remain
+                if args[0] == "from_img" or args[0] == "from_array":
+                    channel_args.append((args[0], *args[1][channel][:4]))
+                elif args[0] == "default":
+                    freq_dc, freq_ac = self.get_default_frequencies_rgb(name)
+                    channel_args.append(("from_file", args[1][channel][0], args[1][channel][1], freq_dc, freq_ac))
+                else:
+                    raise ValueError("Wrong parameters")
+            channel_args[-1] += (gamma_tables[channel],)
 
-        self.set_gammas(gamma_tables[2])
-        if formatting:
-            if freq_origin == "from_img" or freq_origin == "from_array":
-                Cr = super().full_decode(code, freq_origin, m[2], n[2], freq_dc_out[2], freq_ac_out[2], gamma_tables[2])
-            elif freq_origin == "default":
-                freq_dc, freq_ac = self.get_default_frequencies_rgb('Cr')
-                Cr = super().full_decode(code, "from_file", m[2], n[2], freq_dc, freq_ac, gamma_tables[2])
-            else:
-                raise ValueError("Wrong parameters")
+        if channel_lengths is not None and self.channel_workers > 1:
+            starts = np.cumsum([0] + list(channel_lengths[:-1]))
+            jobs = [(code[start:start + length], channel_args[channel], row_index[channel], coefficients)
+                    for channel, (start, length) in enumerate(zip(starts, channel_lengths))]
+            options = (self.verbose, self.verbosity, self.n_workers)
+            with ProcessPoolExecutor(min(self.channel_workers, len(jobs))) as executor:
+                outputs = list(executor.map(_decode_channel_in_worker, [options] * len(jobs), jobs))
         else:
-            if args[0] == "from_img" or args[0] == "from_array":
-                Cr = super().full_decode(code, args[0], args[1][2][0], args[1][2][1], args[1][2][2], args[1][2][3], gamma_tables[2])
-            elif args[0] == "default":
-                freq_dc, freq_ac = self.get_default_frequencies_rgb('Cr')
-                Cr = super().full_decode(code, "from_file", args[1][2][0], args[1][2][1], freq_dc, freq_ac, gamma_tables[2])
-            else:
-                raise ValueError("Wrong parameters")
-        self.formatting = formatting
+            formatting = self.formatting
+            self.formatting = False
+            outputs, pos = [], 0
+            for channel in range(3):
+                if channel_lengths is not None:
+                    pos = sum(channel_lengths[:channel])
+                decoded, pos = super().full_decode(code, *channel_args[channel], position=pos,
+                                                   coefficients=coefficients, row_offsets=row_index[channel])
+                outputs.append((decoded, (self.n, self.m)))
+            self.formatting = formatting
+        (Y, Cb, Cr), dimensions = zip(*outputs)
 
+        if coefficients:
+            self.write_coefficients(jpeg_fpath, (Y, Cb, Cr), list(dimensions), gamma_tables)
+            return jpeg_fpath
         jpeg_decoded =  self.color_converter.inverse(self.channel_sampler.inverse((Y, Cb, Cr)))
         if self.verbose_rgb:
             print(f"========================\nDecoding DNA\n========================")
@@ -0,0 +1,102 @@
+"""JPEG image loaded once for the transcoding"""
+
+import os
+import numpy as np
+
+# Imports for Transcoder
+import pyximport
+pyximport.install()
+from decoder import PyCoefficientDecoder
+
+
+class JPEGSession:
+    """JPEG image whose quantization tables, block dimensions and quantized coefficients are read once
+
+    The image, a file or a JPEG in memory, is parsed by a single PyCoefficientDecoder,
+    released once everything has been copied. The coefficients of all the components are held
+    in a single buffer, each component being a view of it.
+    The session has the reading interface of PyCoefficientDecoder, and the codecs accept it
+    instead of the path of the image. The cached coefficients are read-only. The coefficients of the
+    whole image are held in memory, twice while they are copied from libjpeg.
+
+    The GIL is released while libjpeg reads the image, so sessions can be loaded in parallel in a
+    thread pool, and a session is never modified once loaded: it can be shared by several threads.
+
+    :param img_fpath: Path of the JPEG image, or the JPEG image in memory
+    :type img_fpath: str | bytes | memoryview
+    :param out: Preallocated buffer of the coefficients, allocated if None, made read-only (default: None)
+    :type out: np.array of shape (num_blocks, 64) and type np.int16
+    :ivar path: path of the JPEG image, None for a JPEG in memory
+    :vartype path: str
+    :ivar image_width: width of the image
+    :vartype image_width: int
+    :ivar image_height: height of the image
+    :vartype image_height: int
+    :ivar num_components: number of components of the image
+    :vartype num_components: int
+    :ivar max_h_samp_factor: largest horizontal sampling factor of the components
+    :vartype max_h_samp_factor: int
+    :ivar max_v_samp_factor: largest vertical sampling factor of the components
+    :vartype max_v_samp_factor: int
+    :ivar sampling_factors: horizontal and vertical sampling factors of each component
+    :vartype sampling_factors: list(tuple)
+    :ivar block_dimensions: height and width in blocks of each component
+    :vartype block_dimensions: list(tuple)
+    :ivar quantization_tables: quantization table of each component
+    :vartype quantization_tables: list(np.array)
+    :ivar offsets: offset in blocks of each component in the buffer
+    :vartype offsets: list(int)
+    :ivar coefficient_buffer: quantized coefficients of the blocks of all the components
+    :vartype coefficient_buffer: np.array
+    :ivar coefficients: quantized coefficients of the blocks of each component, in natural order
+    :vartype coefficients: list(np.array)
+    """
+
+    def __init__(self, img_fpath, out=None):
+        dec = PyCoefficientDecoder(img_fpath)
+        self.path = img_fpath if isinstance(img_fpath, (str, os.PathLike)) else None
+        self.image_width, self.image_height = dec.image_width, dec.image_height
+        self.num_components = dec.num_components
+        self.max_h_samp_factor, self.max_v_samp_factor = dec.max_h_samp_factor, dec.max_v_samp_factor
+        self.offsets, self.block_dimensions, self.sampling_factors = map(list, zip(*dec.get_coefficient_layout()))
+        self.quantization_tables = [dec.get_quantization_table(channel) for channel in range(self.num_components)]
+        self.coefficient_buffer, self.coefficients = dec.get_all_dct_coefficients(out)
+        self.coefficient_buffer.flags.writeable = False
+        for coeffs in self.coefficients:
+            coeffs.flags.writeable = False
+
+    def h_samp_factor(self, channel):
+        """Getter for the horizontal sampling factor of a component"""
+        return self.sampling_factors[channel][0]
+
+    def v_samp_factor(self, channel):
+        """Getter for the vertical sampling factor of a component"""
+        return self.sampling_factors[channel][1]
+
+    def get_quantization_table(self, channel):
+        """Getter for the quantization table of a component
+
+        :param channel: component
+        :type channel: int
+        :return: quantization table
+        :rtype: np.array of shape (8, 8)
+        """
+        return np.array(self.quantization_tables[channel])
+
+    def get_height_in_blocks(self, channel):
+        """Getter for the height in blocks of a component"""
+        return self.block_dimensions[channel][0]
+
+    def get_width_in_blocks(self, channel):
+        """Getter for the width in blocks of a component"""
+        return self.block_dimensions[channel][1]
+
+    def get_dct_coefficients(self, channel):
+        """Getter for the quantized coefficients of the blocks of a component, without any copy
+
+        :param channel: component
+        :type channel: int
+        :return: coefficients, row of blocks by row of blocks
+        :rtype: read-only np.array of shape (num_blocks, 64) and type np.int16
+        """
+        return self.coefficients[channel]
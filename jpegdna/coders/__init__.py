@@ -86,3 +86,5 @@ from jpegdna.coders.hexcoder import HexCoder
 from jpegdna.coders.categorycoder import ACCategoryCoder, DCCategoryCoder, NonDecodableCategory
 from jpegdna.coders.valuecoder import ValueCoder
 from jpegdna.coders.coefficientcoder import ACCoefficientCoder, DCCoefficientCoder
+from jpegdna.coders.channelcoder import ChannelCoder
+from jpegdna.coders.codecplan import CodecPlan, get_codec_plan, codec_plan_cache_info, clear_codec_plan_cache
@@ -1,11 +1,12 @@
 """Coder for categories"""
 
+import threading
+from collections import OrderedDict, namedtuple
 import numpy as np
 from jpegdna.coders import AbstractCoder
 from jpegdna.coders.huffmancoder import HuffmanCoder
-from jpegdna.coders.goldmancoder import GoldmanCoderDNA, NonDecodableGoldman
-from jpegdna.coders.hexcoder import HexCoder
-from jpegdna.coders import AutomataGetterException
+from jpegdna.coders.goldmancoder import GoldmanCoderDNA
+from jpegdna.coders import AutomataGetterException, AutomataSetterException, AutomataSetterExceptionDecode
 
 def find_category_ac(value):
     """Find the category of an ac value
@@ -33,11 +34,118 @@ def find_category_ac(value):
         return 7
     return -1
 
+# Lowest absolute value of each nonzero category, the last bound closes the range
+AC_CATEGORY_BOUNDS = np.array([1, 6, 18, 83, 376, 1264, 5263, 17580])
+DC_CATEGORY_BOUNDS = np.array([1, 6, 18, 83, 376, 1264, 5263, 17580, 72910])
+
+CoefficientRanges = namedtuple("CoefficientRanges", ["max_dc_diff", "max_ac", "dc_blocks", "ac_blocks"])
+
+def find_categories(values, bounds):
+    """Finds the categories of an array of values
+
+    Vectorized version of find_category_ac and find_category_dc
+
+    :param values: Values for which we want the categories
+    :type values: np.array
+    :param bounds: AC_CATEGORY_BOUNDS or DC_CATEGORY_BOUNDS
+    :type bounds: np.array
+    :return: Categories corresponding to the values (-1 when out of range)
+    :rtype: np.array
+    """
+    categories = np.searchsorted(bounds, np.abs(values), side='right')
+    categories[categories == len(bounds)] = -1
+    return categories
+
 # pylint: disable=missing-class-docstring
 class NonDecodableCategory(KeyError):
     pass
 # pylint: enable=missing-class-docstring
 
+def build_codeword_trie(d, goldman_coder):
+    """Builds the prefix tree of the Goldman encoded Huffman codewords
+
+    The tree is keyed directly on nucleotides, so that a codeword can be read from
+    the stream without Goldman decoding it first
+
+    :param d: Huffman n-ary dictionnary
+    :type d: dict
+    :param goldman_coder: Goldman coder used to encode the Huffman codewords
+    :type goldman_coder: jpegdna.coders.goldmancoder.GoldmanCoder
+    :return: Nested dictionnaries keyed on nucleotides, the leaves are the symbols
+    :rtype: dict
+    """
+    trie = {}
+    for symbol, gold_code in zip(d.keys(), goldman_coder.encode_codewords(list(d.values()))):
+        node = trie
+        for nucleotide in gold_code[:-1]:
+            node = node.setdefault(nucleotide, {})
+        node[gold_code[-1]] = int(symbol)
+    return trie
+
+def search_codeword_trie(trie, code, pos):
+    """Reads the codeword starting at a given position of the stream
+
+    :param trie: Prefix tree built with build_codeword_trie
+    :type trie: dict
+    :param code: Stream of nucleotides
+    :type code: str
+    :param pos: Read position of the codeword in the stream
+    :type pos: int
+    :return: Decoded symbol, length of the codeword
+    :rtype: int, int
+    """
+    node = trie
+    end = pos
+    try:
+        while isinstance(node, dict):
+            node = node[code[end]]
+            end += 1
+    except (KeyError, IndexError) as exc:
+        raise NonDecodableCategory() from exc
+    return node, end - pos
+
+
+ZRL_SYMBOL = 160
+EOB_SYMBOL = 161
+
+DEFAULT_RUNCAT_CACHE_SIZE = 2
+
+# Run/category tables of the last luts used, keyed by the id of their lut
+_RUNCAT_TABLES = OrderedDict()
+_RUNCAT_TABLES_LOCK = threading.Lock()
+
+def get_runcat_tables(lut):
+    """Returns the integer tables between (zero run, category) couples and symbols
+
+    The symbol of a couple is its index in the lut, ZRL ('F0') and EOB ('00')
+    are mapped to the symbols 160 and 161. The tables of the DEFAULT_RUNCAT_CACHE_SIZE
+    luts used last are kept.
+
+    :param lut: list of hexadecimal codes for categories
+    :type lut: list
+    :return: (16, 11) table of the symbol of each (zero run, category) couple (-1 if none),
+             (162, 2) table of the (zero run, category) couple of each symbol
+    :rtype: np.array, np.array
+    """
+    with _RUNCAT_TABLES_LOCK:
+        entry = _RUNCAT_TABLES.get(id(lut))
+        if entry is not None and entry[0] is lut:
+            _RUNCAT_TABLES.move_to_end(id(lut))
+            return entry[1], entry[2]
+    runcat_table = np.full((16, 11), -1, dtype=int)
+    symbol_table = np.zeros((EOB_SYMBOL+1, 2), dtype=int)
+    for symbol, runsize in enumerate(list(lut) + ['F0', '00']):
+        run, cat = int(runsize[0], 16), int(runsize[1], 16)
+        runcat_table[run, cat] = symbol
+        symbol_table[symbol] = (run, cat)
+    # The lut is stored next to its tables so that its id cannot be reused while they are kept
+    entry = (lut, runcat_table, symbol_table)
+    with _RUNCAT_TABLES_LOCK:
+        _RUNCAT_TABLES[id(lut)] = entry
+        while len(_RUNCAT_TABLES) > DEFAULT_RUNCAT_CACHE_SIZE:
+            _RUNCAT_TABLES.popitem(last=False)
+    return entry[1], entry[2]
+
 
 class ACCategoryCoder(AbstractCoder):
     """AC Category value coder
@@ -48,22 +156,51 @@ class ACCategoryCoder(AbstractCoder):
     :type lut: list
     :var verbose: Verbosity enabler
     :param verbose: bool
+    :param trie: prefix tree of the Goldman encoded codewords, built from d if None (default: None)
+    :type trie: dict
     :ivar goldman_coder: Goldman Coder
     :vartype goldman_coder: jpegdna.coders.goldmancoder.GoldmanCoderDNA
+    :ivar trie: prefix tree of the Goldman encoded codewords
+    :vartype trie: dict
+    :ivar runcat_table: symbol of each (zero run, category) couple
+    :vartype runcat_table: np.array
+    :ivar symbol_table: (zero run, category) couple of each symbol
+    :vartype symbol_table: np.array
     :ivar ad_bits: length of the codeword for the category (initial value: 0)
     :vartype ad_bits: int
     :ivar code_length: length of the codeword for the value (initial value: 0)
     :vartype code_length: int
+    :ivar pos: read position of the codeword in the stream (initial value: 0)
+    :vartype pos: int
+    :ivar symbol: last decoded symbol (initial value: None)
+    :vartype symbol: int
     """
 
-    def __init__(self, d, lut, verbose=False):
+    def __init__(self, d, lut, verbose=False, trie=None):
         self.dic = d
         self.goldman_coder = GoldmanCoderDNA()
+        self.trie = trie if trie is not None else build_codeword_trie(d, self.goldman_coder)
         self.ad_bits = 0
         self.code_length = 0
+        self.pos = 0
+        self.symbol = None
         self.lut = lut
+        self.runcat_table, self.symbol_table = get_runcat_tables(lut)
         self.verbose = verbose
 
+    def set_state(self, *args, case=None):
+        """Sets the read position for the decoding
+
+        :param pos: read position of the codeword in the stream (default: 0)
+        :type pos: int
+        """
+        if case != 'decode':
+            raise AutomataSetterException("ACCategoryCoder: Invalid parameters, expected case parameter in {'decode'}" +
+                                          f" but got {case}")
+        if len(args) > 1:
+            raise AutomataSetterExceptionDecode(f"ACCategoryCoder: Invalid number of parameters, 0 or 1 expected, {len(args)} given.")
+        self.pos = args[0] if len(args) == 1 else 0
+
     def get_state(self, case=None):
         """Return new state after decoding
 
@@ -95,14 +232,15 @@ class ACCategoryCoder(AbstractCoder):
         :return: The encoded message for the category
         :rtype: str
         """
-
-        idx = np.nonzero(np.in1d(self.lut, inp))[0][0]
+        runsize = "".join(inp)
+        idx = self.runcat_table[int(runsize[0], 16), int(runsize[1], 16)]
         huffcoder = HuffmanCoder(self.dic)
         huffcode = huffcoder.encode([str(idx)])
         goldman_inp_stream = "".join(huffcode)
         return self.goldman_coder.encode(goldman_inp_stream)
 
     def full_decode(self, code, *args):
+        self.set_state(*args, case='decode')
         try:
             out = self.decode(code)
         except NonDecodableCategory as exc:
@@ -112,56 +250,27 @@ class ACCategoryCoder(AbstractCoder):
     def decode(self, code):
         """Decode the category of an AC value
 
-        Stores the number of bits it took in the stream and
-        stores the length of the codeword for this category
+        Stores the number of bits it took in the stream,
+        stores the length of the codeword for this category and
+        stores the decoded symbol, the codeword is read from the read position self.pos
 
         :param code: Sequence to be decoded
         :type code: str
         :return: Decoded sequence
         :rtype: str
         """
-        #print(code)
-        category = 0
-        max_huff = max(map(len, self.dic.values()))
-        d_items = list(self.dic.items())
-        try:
-            if len(code) < max_huff:
-                gold_dec = self.goldman_coder.decode(code)
-            else:
-                gold_dec = self.goldman_coder.decode(code[:max_huff])
-        except NonDecodableGoldman:
-            raise NonDecodableCategory()
-        found = False
-        for i in range(len(d_items)):
-            diff_len = len(gold_dec) - len(d_items[i][1])
-            if diff_len > 0:
-                if d_items[i][1] == gold_dec[:-diff_len]:
-                    category = int(d_items[i][0])
-                    code_length = len(d_items[i][1])
-                    found = True
-                    break
-            elif diff_len == 0:
-                if d_items[i][1] == gold_dec:
-                    category = int(d_items[i][0])
-                    code_length = len(d_items[i][1])
-                    found = True
-                    break
-        if not found:
-            raise NonDecodableCategory()
+        category, code_length = search_codeword_trie(self.trie, code, self.pos)
         if category == 0:
             ad_bits = 0
         else:
             ad_bits = category+1
         self.ad_bits = ad_bits
         self.code_length = code_length
-        if category < 160:
-            return self.lut[category]
-        elif category == 160:
-            return 'F0'
-        elif category == 161:
-            return '00'
-        else:
+        if not 0 <= category <= EOB_SYMBOL:
             raise ValueError("ACCategoryCoder: Wrong category value")
+        self.symbol = category
+        run, cat = self.symbol_table[category]
+        return f"{run:X}{cat:X}"
 
 def find_category_dc(value):
     """Find the category of a dc value
@@ -199,21 +308,42 @@ class DCCategoryCoder(AbstractCoder):
     :type d: dict
     :var verbose: Verbosity enabler
     :param verbose: bool
+    :param trie: prefix tree of the Goldman encoded codewords, built from d if None (default: None)
+    :type trie: dict
     :ivar goldman_coder: Goldman Coder
     :vartype goldman_coder: jpegdna.coders.goldmancoder.GoldmanCoderDNA
+    :ivar trie: prefix tree of the Goldman encoded codewords
+    :vartype trie: dict
     :ivar ad_bits: length of the codeword for the category (initial value: 0)
     :vartype ad_bits: int
     :ivar code_length: length of the codeword for the value (initial value: 0)
     :vartype code_length: int
+    :ivar pos: read position of the codeword in the stream (initial value: 0)
+    :vartype pos: int
     """
 
-    def __init__(self, d, verbose=False):
+    def __init__(self, d, verbose=False, trie=None):
         self.dic = d
         self.goldman_coder = GoldmanCoderDNA()
+        self.trie = trie if trie is not None else build_codeword_trie(d, self.goldman_coder)
         self.ad_bits = 0
         self.code_length = 0
+        self.pos = 0
         self.verbose = verbose
 
+    def set_state(self, *args, case=None):
+        """Sets the read position for the decoding
+
+        :param pos: read position of the codeword in the stream (default: 0)
+        :type pos: int
+        """
+        if case != 'decode':
+            raise AutomataSetterException("DCCategoryCoder: Invalid parameters, expected case parameter in {'decode'}" +
+                                          f" but got {case}")
+        if len(args) > 1:
+            raise AutomataSetterExceptionDecode(f"DCCategoryCoder: Invalid number of parameters, 0 or 1 expected, {len(args)} given.")
+        self.pos = args[0] if len(args) == 1 else 0
+
     def get_state(self, case=None):
         """Return new state after decoding
 
@@ -251,6 +381,7 @@ class DCCategoryCoder(AbstractCoder):
         return self.goldman_coder.encode(goldman_inp_stream)
 
     def full_decode(self, code, *args):
+        self.set_state(*args, case='decode')
         try:
             out = self.decode(code)
         except NonDecodableCategory as exc:
@@ -265,37 +396,11 @@ class DCCategoryCoder(AbstractCoder):
         :return: The decoded category
         :rtype: str
         """
-        category = 0
-        max_huff = max(map(len, self.dic.values()))
-        d_items = list(self.dic.items())
-        # print(code)
-        try:
-            if len(code) < max_huff:
-                gold_dec = self.goldman_coder.decode(code)
-            else:
-                gold_dec = self.goldman_coder.decode(code[:max_huff])
-        except NonDecodableGoldman:
-            raise NonDecodableCategory()
-        found = False
-        for i in range(len(d_items)):
-            diff_len = len(gold_dec) - len(d_items[i][1])
-            if diff_len > 0:
-                if d_items[i][1] == gold_dec[:-diff_len]:
-                    category = int(d_items[i][0])
-                    found = True
-                    break
-            elif diff_len == 0:
-                if d_items[i][1] == gold_dec:
-                    category = int(d_items[i][0])
-                    found = True
-                    break
-        if not found:
-            raise NonDecodableCategory()
+        category, code_length = search_codeword_trie(self.trie, code, self.pos)
         if category == 0:
             ad_bits = 0
         else:
             ad_bits = category+1
-        code_length = len(d_items[category][1])
         self.ad_bits = ad_bits
         self.code_length = code_length
         return str(category)
@@ -308,6 +413,7 @@ def count_run_cat(seq_coeff, lut):
     :param lut: list of hexadecimal codes for categories
     :type lut: list
     """
+    runcat_table, _ = get_runcat_tables(lut)
     num_zeros = 0
     count_run_end = 0
     run_cat_count = np.zeros((160))
@@ -322,13 +428,100 @@ def count_run_cat(seq_coeff, lut):
         else:
             if seq_coeff[i] != 0:
                 cat_ac = find_category_ac(seq_coeff[i])
-                hexacoder = HexCoder()
-                cat_hex = hexacoder.encode(cat_ac)
-                zeros_hex = hexacoder.encode(num_zeros)
-                runsize = zeros_hex + cat_hex
-                idx = np.nonzero(np.in1d(lut, runsize))[0][0]
-                run_cat_count[idx] += 1
+                if cat_ac < 0:
+                    raise ValueError(f"count_run_cat: AC value {seq_coeff[i]} out of the category range")
+                run_cat_count[runcat_table[num_zeros, cat_ac]] += 1
                 num_zeros = 0
             else:
                 num_zeros += 1
     return count_run_end, run_cat_count, count_run16
+
+def find_run_cat_symbols(seq_coeffs, lut):
+    """Finds the AC symbols of a batch of blocks
+
+    The gap of zeros before each nonzero coefficient is split into ZRL symbols standing for
+    16 zeros and the zero coefficient following them, a coefficient reached by a ZRL is not coded
+
+    :param seq_coeffs: Sequences of coefficients of the blocks, in zig-zag order
+    :type seq_coeffs: np.array of shape (num_blocks, 64)
+    :param lut: list of hexadecimal codes for categories
+    :type lut: list
+    :return: Block and position of each nonzero AC coefficient, number of ZRL coded before it,
+             its (run, category) symbol (-1 if it is not coded)
+    :rtype: np.array, np.array, np.array, np.array
+    """
+    runcat_table, _ = get_runcat_tables(lut)
+    seq_ac = np.asarray(seq_coeffs)[:, 1:]
+    blocks, cols = np.nonzero(seq_ac)
+    positions = cols + 1
+    previous = np.zeros_like(positions)
+    if len(positions) > 1:
+        previous[1:] = np.where(blocks[1:] == blocks[:-1], positions[:-1], 0)
+    num_zrl, num_zeros = np.divmod(positions - previous - 1, 17)
+    coded = num_zeros < 16
+    num_zrl += ~coded
+    categories = find_categories(seq_ac[blocks, cols], AC_CATEGORY_BOUNDS)
+    if (categories[coded] < 0).any():
+        raise ValueError("find_run_cat_symbols: AC value out of the category range")
+    symbols = np.where(coded, runcat_table[np.minimum(num_zeros, 15), categories], -1)
+    return blocks, positions, num_zrl, symbols
+
+def check_coefficient_ranges(coeffs, nb_col_blocks):
+    """Checks that the coefficients of a batch of blocks are in the ranges of the categories
+
+    The DC differences, restarting on each row of blocks, and the AC coefficients are checked
+
+    :param coeffs: Coefficients of the blocks, row of blocks by row of blocks, DC first
+    :type coeffs: np.array of shape (num_blocks, 64) or (num_blocks, 8, 8)
+    :param nb_col_blocks: number of blocks in a row of blocks
+    :type nb_col_blocks: int
+    :return: Largest absolute DC difference and AC coefficient, blocks whose DC difference
+             and blocks with AC coefficients out of range
+    :rtype: jpegdna.coders.categorycoder.CoefficientRanges
+    """
+    coeffs = np.asarray(coeffs, dtype=np.int32)
+    coeffs = coeffs.reshape((len(coeffs), -1))
+    dc_diffs = np.abs(np.diff(coeffs[:, 0].reshape((-1, nb_col_blocks)), axis=1, prepend=0)).ravel()
+    max_ac = np.abs(coeffs[:, 1:]).max(axis=1, initial=0)
+    return CoefficientRanges(int(dc_diffs.max(initial=0)), int(max_ac.max(initial=0)),
+                             np.flatnonzero(dc_diffs >= DC_CATEGORY_BOUNDS[-1]),
+                             np.flatnonzero(max_ac >= AC_CATEGORY_BOUNDS[-1]))
+
+def validate_channel_coefficients(coeffs, nb_row_blocks, nb_col_blocks):
+    """Checks that the quantized coefficients of a channel can be coded with the codebooks
+
+    :param coeffs: quantized coefficients of the blocks, row of blocks by row of blocks, DC first
+    :type coeffs: np.array of shape (N, 64) or (N, 8, 8)
+    :param nb_row_blocks: number of rows of blocks
+    :type nb_row_blocks: int
+    :param nb_col_blocks: number of blocks in a row of blocks
+    :type nb_col_blocks: int
+    :raises ValueError: if a DC difference or an AC coefficient is out of the range of the codebooks
+    :return: Largest absolute DC difference and AC coefficient, blocks out of range
+    :rtype: jpegdna.coders.categorycoder.CoefficientRanges
+    """
+    ranges = check_coefficient_ranges(np.asarray(coeffs)[:nb_row_blocks*nb_col_blocks], nb_col_blocks)
+    if len(ranges.dc_blocks) or len(ranges.ac_blocks):
+        raise ValueError(f"Coefficients out of the range of the codebooks: DC differences above {DC_CATEGORY_BOUNDS[-1]-1} " +
+                         f"in blocks {ranges.dc_blocks.tolist()}, AC coefficients above {AC_CATEGORY_BOUNDS[-1]-1} " +
+                         f"in blocks {ranges.ac_blocks.tolist()}")
+    return ranges
+
+def count_run_cat_blocks(seq_coeffs, lut):
+    """Counts the number of categories over a batch of blocks
+
+    Vectorized version of count_run_cat, summed over all the blocks
+
+    :param seq_coeffs: Sequences of coefficients of the blocks, in zig-zag order
+    :type seq_coeffs: np.array of shape (num_blocks, 64)
+    :param lut: list of hexadecimal codes for categories
+    :type lut: list
+    :return: Number of EOB, number of each (run, category) symbol, number of ZRL
+    :rtype: int, np.array, int
+    """
+    seq_coeffs = np.asarray(seq_coeffs)
+    _, _, num_zrl, symbols = find_run_cat_symbols(seq_coeffs, lut)
+    run_cat_count = np.bincount(symbols[symbols >= 0], minlength=160)[:160].astype(float)
+    count_run16 = int(num_zrl.sum())
+    count_run_end = len(seq_coeffs) - int(np.count_nonzero(seq_coeffs[:, 63]))
+    return count_run_end, run_cat_count, count_run16
@@ -0,0 +1,401 @@
+"""Coder for the quantized coefficients of a whole channel"""
+
+from multiprocessing import Pool, shared_memory
+import numpy as np
+from jpegdna.coders import AbstractCoder
+from jpegdna.coders.categorycoder import find_categories, find_run_cat_symbols, get_runcat_tables, NonDecodableCategory
+from jpegdna.coders.categorycoder import DC_CATEGORY_BOUNDS, ZRL_SYMBOL, EOB_SYMBOL
+from jpegdna.coders.valuecoder import encode_values
+from jpegdna.coders.coefficientcoder import ACCoefficientCoder, DCCoefficientCoder
+from jpegdna.coders import AutomataSetterException, AutomataSetterExceptionDecode, AutomataGetterException
+from jpegdna.tools.loader import get_package_table, get_package_table_name
+
+# Channel coder and coefficients of a worker process of the parallel encoding
+_worker_state = None
+
+def _table_key(table):
+    """Key of a table sent to the worker processes: the name of a table of the package, loaded again
+    by the workers instead of being pickled, or any other table itself"""
+    name = get_package_table_name(table)
+    return (name, None) if name is not None else (None, table)
+
+def _load_table(key):
+    """Table of a key made by _table_key, in a worker process"""
+    name, table = key
+    return get_package_table(name) if name is not None else table
+
+def _init_encode_worker(lut_key, codebook_key, gold_code_dc, gold_code_ac, nb_col_blocks, shm_name, shape, dtype):
+    """Initializes a worker process: attaches the shared coefficients and builds its channel coder"""
+    global _worker_state # pylint: disable=global-statement
+    shm = shared_memory.SharedMemory(name=shm_name)
+    coder = ChannelCoder(_load_table(lut_key), _load_table(codebook_key))
+    coder.set_state(gold_code_dc, gold_code_ac, nb_col_blocks, case='encode')
+    _worker_state = (coder, shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+def _encode_rows(rows):
+    """Encodes the rows of blocks [start, stop[ in a worker process"""
+    coder, _, seq_coeffs = _worker_state
+    start, stop = rows
+    code = coder.encode(seq_coeffs[start*coder.nb_col_blocks:stop*coder.nb_col_blocks])
+    return code, coder.total_runlength_nts, coder.dropped_coefficients, coder.row_offsets
+
+def _init_decode_worker(lut_key, codebook_key, dict_dc, dict_ac, gold_code_ac, nb_col_blocks, num_blocks, row_offsets,
+                        shm_name, code_size):
+    """Initializes a worker process of the parallel decoding: reads the shared stream and builds its channel coder"""
+    global _worker_state # pylint: disable=global-statement
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        code = bytes(shm.buf[:code_size]).decode()
+    finally:
+        shm.close()
+    lut, codebook = _load_table(lut_key), _load_table(codebook_key)
+    coder = ChannelCoder(lut, codebook)
+    coder.set_state(gold_code_ac, nb_col_blocks, DCCoefficientCoder(dict_dc, codebook),
+                    ACCoefficientCoder(dict_ac, lut, codebook), num_blocks, 0, row_offsets, case='decode')
+    _worker_state = (coder, code)
+
+def _decode_rows(rows):
+    """Decodes the rows of blocks of a band from their read positions in a worker process"""
+    coder, code = _worker_state
+    return coder.decode_row_band(code, *rows)
+
+
+class ChannelCoder(AbstractCoder):
+    """Channel coder: codes all the blocks of a channel at once
+
+    The codewords of every symbol are looked up in the goldman coded tables,
+    and the strand is assembled with a single join. The decoding writes the
+    coefficients of all the blocks in a single array.
+
+    :param lut: Lut matrix
+    :type lut: list
+    :param codebook: Codebooks for every codeword length
+    :type codebook: list
+    :var verbose: Verbosity enabler
+    :param verbose: bool
+    :param n_workers: Number of processes encoding bands of rows of blocks in parallel, the DC prediction
+                      restarting on each row the strand is identical to the serial one (default: 1)
+    :type n_workers: int
+    :ivar gold_code_dc: goldman coded values for every DC category
+    :vartype gold_code_dc: list
+    :ivar gold_code_ac: goldman coded values for every AC symbol
+    :vartype gold_code_ac: list
+    :ivar nb_col_blocks: number of blocks in a row of blocks, the DC prediction restarts on each row
+    :vartype nb_col_blocks: int
+    :ivar total_runlength_nts: length of the encoded words for the categories
+    :vartype total_runlength_nts: int
+    :ivar row_offsets: position of the first nucleotide of each row of blocks in the stream (encoding),
+                       or read positions of the rows of blocks, decoded independently if not None (decoding)
+    :vartype row_offsets: np.array
+    :ivar dropped_coefficients: number of nonzero AC coefficients following 16 modulo 17 zeros,
+                                which cannot be coded and are decoded as zeros (encoding)
+    :vartype dropped_coefficients: int
+    :ivar dc_coeff_coder: DC coefficient coder (decoding)
+    :vartype dc_coeff_coder: jpegdna.coders.coefficientcoder.DCCoefficientCoder
+    :ivar ac_coeff_coder: AC coefficient coder (decoding)
+    :vartype ac_coeff_coder: jpegdna.coders.coefficientcoder.ACCoefficientCoder
+    :ivar num_blocks: number of blocks to decode
+    :vartype num_blocks: int
+    :ivar pos: read position in the stream (decoding)
+    :vartype pos: int
+    :ivar decoded_blocks: for each block, False if it could not be decoded (decoding)
+    :vartype decoded_blocks: np.array
+    """
+
+    def __init__(self, lut, codebook, verbose=False, n_workers=1):
+        self.lut = lut
+        self.codebook = codebook
+        self.symbol_table = get_runcat_tables(lut)[1]
+        self.gold_code_dc = None
+        self.gold_code_ac = None
+        self.nb_col_blocks = None
+        self.total_runlength_nts = None
+        self.dropped_coefficients = None
+        self.row_offsets = None
+        self.dc_coeff_coder, self.ac_coeff_coder = None, None
+        self.num_blocks, self.pos, self.decoded_blocks = None, 0, None
+        self.verbose = verbose
+        self.n_workers = n_workers
+
+    def set_state(self, *args, case=None):
+        """Sets the state of the coder
+
+        :param gold_code_dc: goldman coded values for every DC category (case None or 'encode')
+        :type gold_code_dc: list
+        :param gold_code_ac: goldman coded values for every AC symbol
+        :type gold_code_ac: list
+        :param nb_col_blocks: number of blocks in a row of blocks
+        :type nb_col_blocks: int
+        :param dc_coeff_coder: DC coefficient coder (case 'decode', after gold_code_ac)
+        :type dc_coeff_coder: jpegdna.coders.coefficientcoder.DCCoefficientCoder
+        :param ac_coeff_coder: AC coefficient coder (case 'decode')
+        :type ac_coeff_coder: jpegdna.coders.coefficientcoder.ACCoefficientCoder
+        :param num_blocks: number of blocks to decode (case 'decode')
+        :type num_blocks: int
+        :param pos: read position of the first block in the stream (case 'decode')
+        :type pos: int
+        :param row_offsets: read positions of the rows of blocks, to decode the rows independently and
+                            in parallel with several workers (case 'decode', optional)
+        :type row_offsets: np.array
+        """
+        if case is not None and case != 'encode' and case != 'decode':
+            raise AutomataSetterException("ChannelCoder: Invalid parameter, expected case parameter in {None|'encode'|'decode'}" +
+                                          f" but got {case}")
+        if case == 'decode':
+            if len(args) not in (6, 7):
+                raise AutomataSetterExceptionDecode("ChannelCoder: Invalid number of arguments, 6 or 7 expected " +
+                                                    "(gold_code_ac, nb_col_blocks, dc_coeff_coder, ac_coeff_coder, num_blocks, pos" +
+                                                    f"[, row_offsets]), {len(args)} given")
+            (self.gold_code_ac, self.nb_col_blocks, self.dc_coeff_coder,
+             self.ac_coeff_coder, self.num_blocks, self.pos) = args[:6]
+            self.row_offsets = args[6] if len(args) == 7 else None
+            return
+        if len(args) != 3:
+            raise AutomataSetterException("ChannelCoder: Invalid number of arguments, 3 expected " +
+                                          f"(gold_code_dc, gold_code_ac, nb_col_blocks), {len(args)} given")
+        self.gold_code_dc, self.gold_code_ac, self.nb_col_blocks = args
+
+    def get_state(self, case=None):
+        """Return new state
+
+        :return: The length of the codewords for the categories (case None or 'encode') or
+                 the read position after the last block and the decoded blocks (case 'decode')
+        :rtype: int | int, np.array
+        """
+        if case is not None and case != 'encode' and case != 'decode':
+            raise AutomataGetterException("ChannelCoder: Invalid parameter, expected case parameter in {None|'encode'|'decode'}" +
+                                          f" but got {case}")
+        if case == 'decode':
+            return self.pos, self.decoded_blocks
+        return self.total_runlength_nts
+
+    def full_encode(self, inp, *args):
+        self.set_state(*args, case='encode')
+        code = self.encode(inp)
+        return (code, self.get_state(case='encode'))
+
+    def encode(self, inp):
+        """Encodes the quantized coefficients of every block of the channel
+
+        :param inp: Sequences of coefficients of the blocks in zig-zag order, row of blocks by row of blocks
+        :type inp: np.array of shape (num_blocks, 64)
+        :return: Encoded stream
+        :rtype: str
+        """
+        if self.n_workers > 1 and len(inp) > self.nb_col_blocks:
+            return self.encode_parallel(inp)
+        seq_coeffs = np.asarray(inp, dtype=np.int64)
+        num_blocks = len(seq_coeffs)
+        gold_code_dc = np.array(self.gold_code_dc, dtype=object)
+        gold_code_ac = np.array(self.gold_code_ac, dtype=object)
+        len_dc = np.array([len(code) for code in self.gold_code_dc])
+        len_ac = np.array([len(code) for code in self.gold_code_ac])
+
+        # DC coefficients, differential coding restarting on each row of blocks
+        dc_coeffs = seq_coeffs[:, 0].reshape((-1, self.nb_col_blocks))
+        diffs = np.diff(dc_coeffs, axis=1, prepend=0).ravel()
+        cat_dc = find_categories(diffs, DC_CATEGORY_BOUNDS)
+        code_dc = gold_code_dc[cat_dc] + encode_values(diffs, cat_dc, self.codebook)
+
+        # AC coefficients: ZRLs and (run, category) symbol for each nonzero coefficient
+        blocks, positions, num_zrl, symbols = find_run_cat_symbols(seq_coeffs, self.lut)
+        coded = symbols >= 0
+        self.dropped_coefficients = int(len(coded) - np.count_nonzero(coded))
+        cat_ac = np.where(coded, self.symbol_table[symbols, 1], 0)
+        code_coeff = np.where(coded, gold_code_ac[symbols], "")
+        code_coeff = code_coeff + encode_values(seq_coeffs[blocks, positions], cat_ac, self.codebook)
+        code_ac = np.full(len(blocks), self.gold_code_ac[ZRL_SYMBOL], dtype=object) * num_zrl + code_coeff
+
+        # End of blocks, unless the last coefficient is nonzero
+        eob_blocks = np.nonzero(seq_coeffs[:, 63] == 0)[0]
+        code_eob = np.full(len(eob_blocks), self.gold_code_ac[EOB_SYMBOL], dtype=object)
+
+        self.total_runlength_nts = int(len_dc[cat_dc].sum() + len_ac[symbols[coded]].sum() +
+                                       len_ac[ZRL_SYMBOL] * num_zrl.sum() + len_ac[EOB_SYMBOL] * len(eob_blocks))
+        # Ordering the codewords block by block, DC first and EOB last
+        keys = np.concatenate((np.arange(num_blocks) * 65, blocks * 65 + positions, eob_blocks * 65 + 64))
+        codes = np.concatenate((code_dc, code_ac, code_eob))
+        order = np.argsort(keys, kind='stable')
+        codes = codes[order]
+        out = "".join(codes)
+        # Position of the DC codeword of the first block of each row of blocks
+        lengths = np.fromiter(map(len, codes), dtype=np.int64, count=len(codes))
+        row_starts = np.searchsorted(keys[order], np.arange(0, num_blocks, self.nb_col_blocks) * 65)
+        self.row_offsets = np.concatenate(([0], np.cumsum(lengths)))[row_starts]
+        if self.verbose:
+            print(f"Coded {num_blocks} blocks, {len(blocks)} nonzero AC coefficients: {len(out)} nts, " +
+                  f"{self.total_runlength_nts} nts of categories")
+        return out
+
+    def encode_parallel(self, inp):
+        """Encodes the quantized coefficients of every block of the channel in a pool of processes
+
+        The coefficients are shared with the workers through shared memory, each worker encodes
+        bands of rows of blocks and the strands of the bands are concatenated in order. The lut
+        and codebooks of the package are loaded by the workers, only their names are sent.
+
+        :param inp: Sequences of coefficients of the blocks in zig-zag order, row of blocks by row of blocks
+        :type inp: np.array of shape (num_blocks, 64)
+        :return: Encoded stream
+        :rtype: str
+        """
+        seq_coeffs = np.ascontiguousarray(inp)
+        nb_row_blocks = len(seq_coeffs) // self.nb_col_blocks
+        rows_per_band = -(-nb_row_blocks // (4 * self.n_workers))
+        bands = [(start, min(start + rows_per_band, nb_row_blocks)) for start in range(0, nb_row_blocks, rows_per_band)]
+        shm = shared_memory.SharedMemory(create=True, size=max(seq_coeffs.nbytes, 1))
+        try:
+            np.ndarray(seq_coeffs.shape, dtype=seq_coeffs.dtype, buffer=shm.buf)[:] = seq_coeffs
+            with Pool(self.n_workers, initializer=_init_encode_worker,
+                      initargs=(_table_key(self.lut), _table_key(self.codebook), self.gold_code_dc, self.gold_code_ac,
+                                self.nb_col_blocks, shm.name, seq_coeffs.shape, seq_coeffs.dtype)) as pool:
+                results = pool.map(_encode_rows, bands)
+        finally:
+            shm.close()
+            shm.unlink()
+        codes, runlength_nts, dropped, row_offsets = zip(*results)
+        self.total_runlength_nts = int(sum(runlength_nts))
+        self.dropped_coefficients = int(sum(dropped))
+        band_offsets = np.cumsum([0] + [len(code) for code in codes[:-1]])
+        self.row_offsets = np.concatenate([offsets + band_offset for offsets, band_offset in zip(row_offsets, band_offsets)])
+        out = "".join(codes)
+        if self.verbose:
+            print(f"Coded {len(seq_coeffs)} blocks in {len(bands)} bands of rows: {len(out)} nts, " +
+                  f"{self.total_runlength_nts} nts of categories")
+        return out
+
+    def full_decode(self, code, *args):
+        self.set_state(*args, case='decode')
+        out = self.decode(code)
+        return (out, self.get_state(case='decode'))
+
+    def decode(self, code):
+        """Decodes the quantized coefficients of every block of the channel
+
+        The stream is read from the read position self.pos. The blocks past the end
+        of the stream are left at zero, a block with an undecodable category is skipped
+        and the decoding resumes after the next end of block. With the read positions
+        of the rows of blocks, the rows are decoded independently by decode_rows.
+
+        :param code: Stream to be decoded
+        :type code: str
+        :return: Sequences of coefficients of the blocks in zig-zag order
+        :rtype: np.array of shape (num_blocks, 64) and type np.int16
+        """
+        if self.row_offsets is not None:
+            seq_coeffs = self.decode_rows(code)
+        else:
+            seq_coeffs, self.decoded_blocks, self.pos = self.decode_blocks(code, self.pos, self.num_blocks)
+        if self.verbose:
+            print(f"Decoded {self.num_blocks} blocks, {np.count_nonzero(~self.decoded_blocks)} undecodable")
+        return seq_coeffs
+
+    def decode_blocks(self, code, pos, num_blocks):
+        """Decodes the quantized coefficients of consecutive blocks, from the first block of a row of blocks
+
+        :param code: Stream to be decoded
+        :type code: str
+        :param pos: Read position of the first block
+        :type pos: int
+        :param num_blocks: Number of blocks to decode
+        :type num_blocks: int
+        :return: Sequences of coefficients of the blocks in zig-zag order, False for the blocks
+                 that could not be decoded, read position after the last block
+        :rtype: np.array of shape (num_blocks, 64) and type np.int16, np.array, int
+        """
+        seq_coeffs = np.zeros((num_blocks, 64), dtype=np.int16)
+        decoded_blocks = np.ones(num_blocks, dtype=bool)
+        eob_str = self.gold_code_ac[EOB_SYMBOL]
+        indexes, values = [], []
+        code_len = len(code)
+        dc_prev_coeff = 0
+        for block in range(num_blocks):
+            if block % self.nb_col_blocks == 0:
+                dc_prev_coeff = 0
+            if pos >= code_len:
+                continue
+            try:
+                (value, num_bits) = self.dc_coeff_coder.full_decode(code, pos)
+                pos += num_bits
+                dc_prev_coeff += value
+                block_indexes, block_values = [block*64], [dc_prev_coeff]
+                idx = 1
+                while idx < 64 and pos < code_len:
+                    (coeff, (num_zeros, num_bits, end_of_block)) = self.ac_coeff_coder.full_decode(code, pos)
+                    pos += num_bits
+                    if end_of_block:
+                        break
+                    idx += num_zeros
+                    if coeff != 0 and idx < 64:
+                        block_indexes.append(block*64 + idx)
+                        block_values.append(coeff)
+                    idx += 1
+            except NonDecodableCategory:
+                print("Category undecodable, synchronising to next block")
+                decoded_blocks[block] = False
+                sync = code.find(eob_str, pos, code_len-1)
+                if sync != -1:
+                    pos = sync + len(eob_str)
+                continue
+            indexes += block_indexes
+            values += block_values
+        seq_coeffs.ravel()[indexes] = np.clip(values, np.iinfo(np.int16).min, np.iinfo(np.int16).max)
+        return seq_coeffs, decoded_blocks, pos
+
+    def decode_row_band(self, code, start, stop):
+        """Decodes the rows of blocks [start, stop[, each one from its read position
+
+        :param code: Stream to be decoded
+        :type code: str
+        :param start: First row of blocks
+        :type start: int
+        :param stop: Row of blocks after the last one
+        :type stop: int
+        :return: Sequences of coefficients of the blocks in zig-zag order, False for the blocks
+                 that could not be decoded, read position after the last block
+        :rtype: np.array, np.array, int
+        """
+        seq_coeffs, decoded_blocks, pos = [], [], self.row_offsets[start]
+        for row in range(start, stop):
+            num_blocks = min(self.nb_col_blocks, self.num_blocks - row*self.nb_col_blocks)
+            row_coeffs, row_decoded, pos = self.decode_blocks(code, self.row_offsets[row], num_blocks)
+            seq_coeffs.append(row_coeffs)
+            decoded_blocks.append(row_decoded)
+        return np.concatenate(seq_coeffs), np.concatenate(decoded_blocks), pos
+
+    def decode_rows(self, code):
+        """Decodes the rows of blocks independently from their read positions self.row_offsets,
+        in a pool of processes with several workers
+
+        The stream is shared with the workers through shared memory, and the workers build their
+        coefficient coders from the Huffman dictionaries and the lut and codebooks of the package.
+
+        :param code: Stream to be decoded
+        :type code: str
+        :return: Sequences of coefficients of the blocks in zig-zag order
+        :rtype: np.array of shape (num_blocks, 64) and type np.int16
+        """
+        nb_row_blocks = -(-self.num_blocks // self.nb_col_blocks)
+        if len(self.row_offsets) != nb_row_blocks:
+            raise ValueError(f"ChannelCoder: {len(self.row_offsets)} row offsets for {nb_row_blocks} rows of blocks")
+        if self.n_workers > 1 and nb_row_blocks > 1:
+            rows_per_band = -(-nb_row_blocks // (4 * self.n_workers))
+            bands = [(start, min(start + rows_per_band, nb_row_blocks)) for start in range(0, nb_row_blocks, rows_per_band)]
+            data = code.encode()
+            shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+            try:
+                shm.buf[:len(data)] = data
+                with Pool(self.n_workers, initializer=_init_decode_worker,
+                          initargs=(_table_key(self.lut), _table_key(self.codebook), self.dc_coeff_coder.d,
+                                    self.ac_coeff_coder.d, self.gold_code_ac, self.nb_col_blocks, self.num_blocks,
+                                    self.row_offsets, shm.name, len(data))) as pool:
+                    results = pool.map(_decode_rows, bands)
+            finally:
+                shm.close()
+                shm.unlink()
+        else:
+            results = [self.decode_row_band(code, 0, nb_row_blocks)]
+        seq_coeffs, decoded_blocks, pos = zip(*results)
+        self.decoded_blocks = np.concatenate(decoded_blocks)
+        self.pos = pos[-1]
+        return np.concatenate(seq_coeffs)
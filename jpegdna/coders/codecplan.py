@@ -0,0 +1,127 @@
+"""Codec plans: coding tables derived from the frequency tables, shared by every codec of the process"""
+
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+import numpy as np
+from jpegdna.coders.huffmancoder import HuffmanCoder
+from jpegdna.coders.goldmancoder import GoldmanCoderDNA
+from jpegdna.coders.categorycoder import build_codeword_trie
+
+DEFAULT_PLAN_CACHE_SIZE = 32
+
+PlanCacheInfo = namedtuple("PlanCacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+_PLAN_CACHE = OrderedDict()
+_PLAN_CACHE_STATS = {"hits": 0, "misses": 0, "maxsize": DEFAULT_PLAN_CACHE_SIZE}
+_PLAN_CACHE_LOCK = threading.Lock()
+
+
+def frequencies_key(freq_dc, freq_ac):
+    """Computes the key of a couple of frequency tables
+
+    :param freq_dc: DC coefficients frequencies table
+    :type freq_dc: array
+    :param freq_ac: AC coefficients frequencies table
+    :type freq_ac: array
+    :return: Hash of the values of the tables
+    :rtype: str
+    """
+    sha = hashlib.sha1()
+    for freqs in (freq_dc, freq_ac):
+        freqs = np.ascontiguousarray(freqs, dtype=np.float64)
+        sha.update(str(freqs.shape).encode())
+        sha.update(freqs.tobytes())
+    return sha.hexdigest()
+
+
+class CodecPlan():
+    """Coding tables of a channel for a couple of frequency tables
+
+    The plans are shared between codecs, they must not be modified
+
+    :param freq_dc: DC coefficients frequencies table
+    :type freq_dc: array
+    :param freq_ac: AC coefficients frequencies table
+    :type freq_ac: array
+    :ivar key: hash of the frequency tables
+    :vartype key: str
+    :ivar huffman_dc_coder: Huffman coder of the DC categories
+    :vartype huffman_dc_coder: jpegdna.coders.huffmancoder.HuffmanCoder
+    :ivar huffman_ac_coder: Huffman coder of the AC symbols
+    :vartype huffman_ac_coder: jpegdna.coders.huffmancoder.HuffmanCoder
+    :ivar gold_code_dc: goldman coded values for every DC category
+    :vartype gold_code_dc: list
+    :ivar gold_code_ac: goldman coded values for every AC symbol
+    :vartype gold_code_ac: list
+    :ivar trie_dc: prefix tree of the DC codewords
+    :vartype trie_dc: dict
+    :ivar trie_ac: prefix tree of the AC codewords
+    :vartype trie_ac: dict
+    """
+
+    def __init__(self, freq_dc, freq_ac):
+        self.key = frequencies_key(freq_dc, freq_ac)
+        gold_coder = GoldmanCoderDNA()
+        self.huffman_dc_coder = HuffmanCoder(range(11), freq_dc, 3)
+        self.huffman_ac_coder = HuffmanCoder(range(162), freq_ac, 3)
+        self.gold_code_dc = gold_coder.encode_codewords([self.huffman_dc_coder.encode([str(i)]) for i in range(11)])
+        self.gold_code_ac = gold_coder.encode_codewords([self.huffman_ac_coder.encode([str(i)]) for i in range(162)])
+        self.trie_dc = build_codeword_trie(self.huffman_dc_coder.dic, gold_coder)
+        self.trie_ac = build_codeword_trie(self.huffman_ac_coder.dic, gold_coder)
+
+
+def get_codec_plan(freq_dc, freq_ac):
+    """Returns the plan of a couple of frequency tables, from the cache of the process if possible
+
+    The least recently used plan is dropped when the cache is full, the cache can be
+    shared by the threads of the process
+
+    :param freq_dc: DC coefficients frequencies table
+    :type freq_dc: array
+    :param freq_ac: AC coefficients frequencies table
+    :type freq_ac: array
+    :return: Codec plan
+    :rtype: jpegdna.coders.codecplan.CodecPlan
+    """
+    key = frequencies_key(freq_dc, freq_ac)
+    with _PLAN_CACHE_LOCK:
+        plan = _PLAN_CACHE.get(key)
+        if plan is not None:
+            _PLAN_CACHE_STATS["hits"] += 1
+            _PLAN_CACHE.move_to_end(key)
+            return plan
+        _PLAN_CACHE_STATS["misses"] += 1
+    # Built without holding the lock, a plan built meanwhile by another thread is kept
+    plan = CodecPlan(freq_dc, freq_ac)
+    with _PLAN_CACHE_LOCK:
+        if key in _PLAN_CACHE:
+            _PLAN_CACHE.move_to_end(key)
+            return _PLAN_CACHE[key]
+        if _PLAN_CACHE_STATS["maxsize"] > 0:
+            _PLAN_CACHE[key] = plan
+            while len(_PLAN_CACHE) > _PLAN_CACHE_STATS["maxsize"]:
+                _PLAN_CACHE.popitem(last=False)
+    return plan
+
+def codec_plan_cache_info():
+    """Returns the statistics of the cache of codec plans
+
+    :return: Number of hits, of misses, maximum and current number of plans
+    :rtype: jpegdna.coders.codecplan.PlanCacheInfo
+    """
+    return PlanCacheInfo(_PLAN_CACHE_STATS["hits"], _PLAN_CACHE_STATS["misses"],
+                         _PLAN_CACHE_STATS["maxsize"], len(_PLAN_CACHE))
+
+def clear_codec_plan_cache(maxsize=None):
+    """Empties the cache of codec plans and resets its statistics
+
+    :param maxsize: New maximum number of plans (default: None, unchanged)
+    :type maxsize: int
+    """
+    with _PLAN_CACHE_LOCK:
+        _PLAN_CACHE.clear()
+        _PLAN_CACHE_STATS["hits"] = 0
+        _PLAN_CACHE_STATS["misses"] = 0
+        if maxsize is not None:
+            _PLAN_CACHE_STATS["maxsize"] = maxsize
@@ -1,11 +1,10 @@
 """General AC and DC coefficients coder"""
 
-import numpy as np
 from jpegdna.coders import AbstractCoder
 from jpegdna.coders import ACCategoryCoder, DCCategoryCoder, NonDecodableCategory
-from jpegdna.coders import HexCoder
+from jpegdna.coders.categorycoder import ZRL_SYMBOL, EOB_SYMBOL
 from jpegdna.coders import ValueCoder
-from jpegdna.coders import AutomataSetterException, AutomataGetterException
+from jpegdna.coders import AutomataSetterException, AutomataSetterExceptionDecode, AutomataGetterException
 
 
 class ACCoefficientCoder(AbstractCoder):
@@ -17,6 +16,8 @@ class ACCoefficientCoder(AbstractCoder):
     :type lut: list
     :var verbose: Verbosity enabler
     :param verbose: bool
+    :param trie: prefix tree of the category codewords, built from d if None (default: None)
+    :type trie: dict
     :ivar category_coder: category coder associated with the value coder
     :vartype category_coder: jpegdna.coders.categorycoder.ACCategoryCoder
     :ivar value_coder: value coder
@@ -25,28 +26,43 @@ class ACCoefficientCoder(AbstractCoder):
     :vartype gold_code: list
     :ivar count_runcat_len: length of the encoded words for the categories
     :vartype count_runcat_len: int
+    :ivar pos: read position of the coefficient in the stream (decoding)
+    :vartype pos: int
+    :ivar runcat_table: symbol of each (zero run, category) couple
+    :vartype runcat_table: np.array
+    :ivar symbol_table: (zero run, category) couple of each symbol
+    :vartype symbol_table: np.array
     """
 
-    def __init__(self, d, lut, codebook, verbose=False):
+    def __init__(self, d, lut, codebook, verbose=False, trie=None):
         self.d = d
         self.lut = lut
-        self.category_coder = ACCategoryCoder(d, lut, verbose=verbose)
+        self.category_coder = ACCategoryCoder(d, lut, verbose=verbose, trie=trie)
         self.value_coder = ValueCoder(codebook)
         self.gold_code = None
         self.count_runcat_len = None
         self.num_zeros, self.num_bits, self.end_of_block = None, None, None
-        self.hexcoder = HexCoder()
+        self.pos = 0
+        self.runcat_table = self.category_coder.runcat_table
+        self.symbol_table = self.category_coder.symbol_table
         self.verbose = verbose
 
     def set_state(self, *args, case=None):
         """Sets the state of the coder
 
-        :param gold_code: goldman code
+        :param gold_code: goldman code (case None or 'encode')
         :type gold_code: str
+        :param pos: read position in the stream (case 'decode')
+        :type pos: int
         """
         if case is not None and case != 'encode' and case != 'decode':
             raise AutomataSetterException("ACCoefficientCoder: Invalid parameter, expected case parameter in {None|'encode'|'decode'}" +
                                           f" but got {case}")
+        if case == 'decode':
+            if len(args) != 1:
+                raise AutomataSetterExceptionDecode(f"ACCoefficientCoder: Invalid number of arguments, 1 expected (pos), {len(args)} given")
+            self.pos = args[0]
+            return
         if len(args) != 1:
             raise AutomataSetterException(f"ACCoefficientCoder: Invalid umber of arguments, 1 expected (gold_code), {len(args)} given")
         self.gold_code = args[0]
@@ -84,32 +100,30 @@ class ACCoefficientCoder(AbstractCoder):
         num_zeros = 0
         for i in range(1, 64):
             if (inp[i:] == [0]*len(inp[i:])).all():
-                ac_code = ac_code + self.gold_code[161]
-                count_runcat_len += len(self.gold_code[161])
+                ac_code = ac_code + self.gold_code[EOB_SYMBOL]
+                count_runcat_len += len(self.gold_code[EOB_SYMBOL])
                 if self.verbose:
-                    print(f"#EOB: {self.gold_code[161]}")
+                    print(f"#EOB: {self.gold_code[EOB_SYMBOL]}")
                 break
             if num_zeros == 16:
-                ac_code = ac_code + self.gold_code[160]
-                count_runcat_len += len(self.gold_code[160])
+                ac_code = ac_code + self.gold_code[ZRL_SYMBOL]
+                count_runcat_len += len(self.gold_code[ZRL_SYMBOL])
                 num_zeros = 0
                 if self.verbose:
-                    print(f"#16Z: {self.gold_code[160]}")
+                    print(f"#16Z: {self.gold_code[ZRL_SYMBOL]}")
             else:
                 if inp[i] != 0:
                     cat_ac = self.category_coder.find_category(inp[i])
-                    cathex = self.hexcoder.encode(cat_ac)
-                    zero_seq = self.hexcoder.encode(num_zeros)
-                    runsize = zero_seq + cathex
-
-                    idx = np.nonzero(np.in1d(self.lut, runsize))[0][0]
+                    if cat_ac < 0:
+                        raise ValueError(f"ACCoefficientCoder: AC value {inp[i]} out of the category range")
+                    idx = self.runcat_table[num_zeros, cat_ac]
                     code_cat_ac = self.gold_code[idx]
                     code_value_ac = self.value_coder.full_encode(inp[i], cat_ac)
                     count_runcat_len += len(code_cat_ac)
                     coeff_code_ac = code_cat_ac + code_value_ac
                     ac_code = ac_code + coeff_code_ac
                     if self.verbose:
-                        print(f"AC Coefficient {inp[i]}: category {cat_ac}, num_zeros {num_zeros}, runsize {runsize}, "\
+                        print(f"AC Coefficient {inp[i]}: category {cat_ac}, num_zeros {num_zeros}, symbol {idx}, "\
                               f"category code: {code_cat_ac}, value code: {code_value_ac}, coeff code: {coeff_code_ac}")
                     num_zeros = 0
                 else:
@@ -123,43 +137,49 @@ class ACCoefficientCoder(AbstractCoder):
         return ac_code
 
     def full_decode(self, code, *args):
+        if len(args) == 0:
+            self.set_state(0, case='decode')
+        else:
+            self.set_state(*args, case='decode')
         out = self.decode(code)
         return (out, self.get_state(case='decode'))
 
     def decode(self, code):
         """Function for decoding AC coefficients
 
+        The coefficient is read from the read position self.pos
+
         :param code: Sequence to be decoded
         :type code: str
         """
         try:
-            (runsize, (_, code_length_ac)) = self.category_coder.full_decode(code)
+            (_, (_, code_length_ac)) = self.category_coder.full_decode(code, self.pos)
         except NonDecodableCategory as exc:
             raise exc
-        if runsize == '00':
+        symbol = self.category_coder.symbol
+        if symbol == EOB_SYMBOL:
             self.end_of_block = True
             ac_value = 0
-            self.num_bits = len(self.d["161"])
+            self.num_bits = code_length_ac
             self.num_zeros = 0
-        elif runsize == 'F0':
+        elif symbol == ZRL_SYMBOL:
             self.end_of_block = False
             ac_value = 0
-            self.num_bits = len(self.d["160"])
+            self.num_bits = code_length_ac
             self.num_zeros = 16
         else:
             self.end_of_block = False
-            category = self.hexcoder.decode(runsize[1])
+            self.num_zeros, category = (int(x) for x in self.symbol_table[symbol])
             if category > 7:
                 raise NonDecodableCategory
-            self.num_zeros = self.hexcoder.decode(runsize[0])
             if category == 0:
                 ad_bits = 0
             else:
                 ad_bits = category + 1
-            ac_value = self.value_coder.full_decode(code, ad_bits, code_length_ac)
+            ac_value = self.value_coder.full_decode(code, ad_bits, code_length_ac, self.pos)
             self.num_bits = code_length_ac + ad_bits
         if self.verbose:
-            print(f"Decoding AC coefficient from codeword {code[:self.num_bits]}: runsize = {runsize}, value = {ac_value}")
+            print(f"Decoding AC coefficient from codeword {code[self.pos:self.pos+self.num_bits]}: symbol = {symbol}, value = {ac_value}")
         return ac_value
 
 
@@ -170,6 +190,8 @@ class DCCoefficientCoder(AbstractCoder):
     :type d: dict
     :var verbose: Verbosity enabler
     :param verbose: bool
+    :param trie: prefix tree of the category codewords, built from d if None (default: None)
+    :type trie: dict
     :ivar category_coder: category coder associated with the value coder
     :vartype category_coder: jpegdna.coders.categorycoder.DCCategoryCoder
     :ivar value_coder: value coder
@@ -178,26 +200,36 @@ class DCCoefficientCoder(AbstractCoder):
     :vartype gold_code: list
     :ivar count_cat_len: length of the encoded word for the category
     :vartype count_cat_len: int
+    :ivar pos: read position of the coefficient in the stream (decoding)
+    :vartype pos: int
     """
 
-    def __init__(self, d, codebook, verbose=False):
+    def __init__(self, d, codebook, verbose=False, trie=None):
         self.d = d
-        self.category_coder = DCCategoryCoder(d, verbose=verbose)
+        self.category_coder = DCCategoryCoder(d, verbose=verbose, trie=trie)
         self.value_coder = ValueCoder(codebook)
         self.count_cat_len = None
         self.num_bits = None
+        self.pos = 0
         self.gold_code = None
         self.verbose = verbose
 
     def set_state(self, *args, case=None):
         """Set new state
 
-        :param gold_code: Goldman code
+        :param gold_code: Goldman code (case None or 'encode')
         :type gold_code: str
+        :param pos: read position in the stream (case 'decode')
+        :type pos: int
         """
         if case is not None and case != 'encode' and case != 'decode':
             raise AutomataSetterException("DCCoefficientCoder: Invalid parameter, expected case parameter in {None|'encode'|'decode'}" +
                                           f" but got {case}")
+        if case == 'decode':
+            if len(args) != 1:
+                raise AutomataSetterExceptionDecode(f"DCCoefficientCoder: Invalid number of arguments, 1 expected (pos), {len(args)} given")
+            self.pos = args[0]
+            return
         if len(args) != 1:
             raise AutomataSetterException(f"DCCoefficientCoder: Invalid umber of arguments, 1 expected (gold_code), {len(args)} given")
         self.gold_code = args[0]
@@ -249,23 +281,29 @@ class DCCoefficientCoder(AbstractCoder):
         return dc_code
 
     def full_decode(self, code, *args):
+        if len(args) == 0:
+            self.set_state(0, case='decode')
+        else:
+            self.set_state(*args, case='decode')
         out = self.decode(code)
         return (out, self.get_state(case='decode'))
 
     def decode(self, code):
         """Function for decoding a DC coefficient
 
+        The coefficient is read from the read position self.pos
+
         :param code: Sequence to be decoded
         :type code: str
         """
         try:
-            (cat, (ad_bits, code_length)) = self.category_coder.full_decode(code)
+            (cat, (ad_bits, code_length)) = self.category_coder.full_decode(code, self.pos)
             if int(cat) > 8:
                 raise NonDecodableCategory
         except NonDecodableCategory as exc:
             raise exc
-        dc_value = self.value_coder.full_decode(code, ad_bits, code_length)
+        dc_value = self.value_coder.full_decode(code, ad_bits, code_length, self.pos)
         self.num_bits = code_length + ad_bits
         if self.verbose:
-            print(f"----------\nDecoding DC differential coefficient from codeword {code[:self.num_bits]}: category = {cat}, diff value = {dc_value}")
+            print(f"----------\nDecoding DC differential coefficient from codeword {code[self.pos:self.pos+self.num_bits]}: category = {cat}, diff value = {dc_value}")
         return dc_value
@@ -1,5 +1,6 @@
 """Goldman coder"""
 
+import numpy as np
 from jpegdna.coders import AbstractCoder
 
 # pylint: disable=missing-class-docstring
@@ -7,19 +8,163 @@ class NonDecodableGoldman(KeyError):
     pass
 # pylint: enable=missing-class-docstring
 
+INVALID_NUCLEOTIDE = 255
+# Signals shorter than this are coded with the lookup tables in pure Python, which is faster than NumPy
+SHORT_SIGNAL_LENGTH = 256
+
+def codeword_starts(lengths, size):
+    """Computes the start index of consecutive codewords
+
+    :param lengths: lengths of the codewords (None for a single codeword)
+    :type lengths: list(int)|None
+    :param size: total length of the codewords
+    :type size: int
+    :return: start index of every non-empty codeword
+    :rtype: np.array
+    """
+    if lengths is None:
+        return np.zeros(1 if size else 0, dtype=int)
+    lengths = np.asarray(lengths, dtype=int)
+    if lengths.sum() != size:
+        raise ValueError("Goldman coder error: The codeword lengths do not match the input length")
+    return (np.cumsum(lengths) - lengths)[lengths > 0]
+
 
 class GoldmanCoder(AbstractCoder):
     """Goldman coder
 
+    Each trit selects one of the symbols of the alphabet differing from the previous one,
+    the first symbol is read as if it followed the last symbol of the alphabet
+
     :param alphabet: alphabet for encoding
     :type alphabet: list
+    :ivar encode_table: symbol index for each (previous symbol index, trit)
+    :vartype encode_table: np.array
+    :ivar decode_table: trit for each (previous symbol index, symbol index), -1 for a repeated symbol
+    :vartype decode_table: np.array
+    :ivar compose_table: composition of two transitions packed on a byte (alphabets of at most 4 symbols)
+    :vartype compose_table: np.array
+    :ivar packed_transitions: transition packed on a byte of each trit, following a symbol or starting a codeword
+    :vartype packed_transitions: np.array
     """
 
     def __init__(self, alphabet, verbose=False) -> None:
         if len(set(alphabet)) != len(alphabet):
             raise ValueError("Goldman coder error: All members of the alphabet must be unique")
+        if any(len(symbol) != 1 for symbol in alphabet):
+            raise ValueError("Goldman coder error: All members of the alphabet must be single characters")
         self.alphabet = alphabet
         self.verbose = verbose
+        size = len(alphabet)
+        self.start = size - 1
+        self.encode_table = np.array([[symbol for symbol in range(size) if symbol != previous]
+                                      for previous in range(size)], dtype=np.uint8)
+        self.decode_table = np.full((size, size), -1, dtype=np.int8)
+        for previous in range(size):
+            self.decode_table[previous, self.encode_table[previous]] = np.arange(size-1)
+        self.compose_table, self.packed_transitions = None, None
+        if size <= 4:
+            # A transition (previous symbol -> next symbol) is packed on a byte, 2 bits per previous symbol
+            weights = 4**np.arange(4)
+            transitions = (np.arange(256)[:, None] >> (2*np.arange(4))) & 3
+            self.compose_table = (transitions[:, transitions] @ weights).astype(np.uint8)
+            # transitions of each trit, following a symbol or starting a codeword
+            self.packed_transitions = np.array([weights[:size] @ self.encode_table,
+                                                85 * self.encode_table[self.start]], dtype=np.uint8)
+        # tables of the short signals
+        self.encode_lookup = [[alphabet[symbol] for symbol in row] for row in self.encode_table.tolist()]
+        self.encode_lookup = dict(zip([None]+alphabet, [self.encode_lookup[self.start]]+self.encode_lookup))
+        self.decode_lookup = {(previous, alphabet[symbol]): str(trit)
+                              for previous, row in zip([None]+alphabet, [self.decode_table[self.start]]+list(self.decode_table))
+                              for symbol, trit in enumerate(row.tolist()) if trit >= 0}
+        self.symbol_bytes = np.frombuffer("".join(alphabet).encode("latin-1"), dtype=np.uint8)
+        self.symbol_indexes = np.full(256, INVALID_NUCLEOTIDE, dtype=np.uint8)
+        self.symbol_indexes[self.symbol_bytes] = np.arange(size)
+
+    def encode_array(self, trits, lengths=None):
+        """Encodes trits into symbol indexes
+
+        The nucleotide of each trit depends on all the previous ones, the table lookups
+        are chained with a parallel prefix composition of the per-trit transitions
+
+        :param trits: Trits to be encoded
+        :type trits: np.array
+        :param lengths: Lengths of consecutive codewords to be encoded independently (default: one codeword)
+        :type lengths: list(int)
+        :return: Indexes of the encoded symbols in the alphabet
+        :rtype: np.array(np.uint8)
+        """
+        trits = np.asarray(trits, dtype=np.uint8).ravel()
+        if len(trits) == 0:
+            return np.zeros(0, dtype=np.uint8)
+        if trits.max() >= self.encode_table.shape[1]:
+            raise ValueError(f"Goldman coder error: Invalid trit, {self.encode_table.shape[1]} values expected")
+        starts = codeword_starts(lengths, len(trits))
+        if self.compose_table is not None:
+            transitions = self.packed_transitions[0, trits]
+            transitions[starts] = self.packed_transitions[1, trits[starts]]
+            step = 1
+            while step < len(trits):
+                transitions[step:] = self.compose_table[transitions[step:], transitions[:-step]]
+                step *= 2
+            return (transitions >> (2*self.start)) & 3
+        # transitions[i, previous] is the symbol coding trits[i] after the symbol previous
+        transitions = self.encode_table[:, trits].T.copy()
+        transitions[starts] = self.encode_table[self.start, trits[starts]][:, None]
+        step = 1
+        while step < len(trits):
+            transitions[step:] = np.take_along_axis(transitions[step:], transitions[:-step], axis=1)
+            step *= 2
+        return transitions[:, self.start].copy()
+
+    def decode_array(self, nucleotides, lengths=None):
+        """Decodes symbol indexes into trits
+
+        Repeated symbols carry no trit and are skipped
+
+        :param nucleotides: Indexes of the symbols in the alphabet
+        :type nucleotides: np.array
+        :param lengths: Lengths of consecutive codewords to be decoded independently (default: one codeword)
+        :type lengths: list(int)
+        :return: Decoded trits (and their number in each codeword if lengths is given)
+        :rtype: np.array(np.uint8) | np.array(np.uint8), np.array
+        """
+        nucleotides = np.asarray(nucleotides, dtype=np.uint8).ravel()
+        starts = codeword_starts(lengths, len(nucleotides))
+        if (nucleotides >= len(self.alphabet)).any():
+            raise NonDecodableGoldman()
+        previous = np.empty_like(nucleotides)
+        previous[1:] = nucleotides[:-1]
+        previous[starts] = self.start
+        trits = self.decode_table[previous, nucleotides]
+        if (trits[starts] < 0).any():
+            raise NonDecodableGoldman()
+        kept = trits >= 0
+        if lengths is None:
+            return trits[kept].astype(np.uint8)
+        counts = np.zeros(len(lengths), dtype=int)
+        counts[np.asarray(lengths) > 0] = np.add.reduceat(kept, starts) if len(starts) else []
+        return trits[kept].astype(np.uint8), counts
+
+    def to_indexes(self, code):
+        """Converts a string of symbols into symbol indexes
+
+        :param code: Symbols
+        :type code: str
+        :return: Indexes of the symbols in the alphabet (255 if not in the alphabet)
+        :rtype: np.array(np.uint8)
+        """
+        return self.symbol_indexes[np.frombuffer(code.encode("latin-1", errors="replace"), dtype=np.uint8)]
+
+    def to_symbols(self, indexes):
+        """Converts symbol indexes into a string of symbols
+
+        :param indexes: Indexes of the symbols in the alphabet
+        :type indexes: np.array
+        :return: Symbols
+        :rtype: str
+        """
+        return self.symbol_bytes[indexes].tobytes().decode("latin-1")
 
     def encode(self, inp):
         """Function that encodes data into DNA using Goldman coder
@@ -29,13 +174,13 @@ class GoldmanCoder(AbstractCoder):
         :return: Encoded signal
         :rtype: str
         """
-        d = self.alphabet.copy()
-        encoded = d[int(inp[0])]
-        for i in range(1, len(inp)):
-            d = self.alphabet.copy()
-            d.remove(encoded[i-1])
-            encoded += d[int(inp[i])]
-        return encoded
+        if len(inp) < SHORT_SIGNAL_LENGTH:
+            encoded, previous = [], None
+            for trit in inp:
+                previous = self.encode_lookup[previous][int(trit)]
+                encoded.append(previous)
+            return "".join(encoded)
+        return self.to_symbols(self.encode_array(to_trits(inp)))
 
     def decode(self, code):
         """Function that decodes DNA data using Goldman coder
@@ -45,23 +190,76 @@ class GoldmanCoder(AbstractCoder):
         :return: Decoded signal
         :rtype: str
         """
-        flag = -1
-        decoded = ""
-        if code[0] not in self.alphabet[:-1]:
-            raise NonDecodableGoldman()
+        if len(code) < SHORT_SIGNAL_LENGTH:
+            decoded, previous = [], None
+            for symbol in code:
+                trit = self.decode_lookup.get((previous, symbol))
+                if trit is not None:
+                    decoded.append(trit)
+                elif previous is None or symbol not in self.alphabet:
+                    raise NonDecodableGoldman()
+                previous = symbol
+            return "".join(decoded)
+        return from_trits(self.decode_array(self.to_indexes(code)))
+
+    def encode_codewords(self, codewords):
+        """Encodes several codewords independently in one call
+
+        :param codewords: Signals to be encoded
+        :type codewords: list(str)
+        :return: Encoded signals
+        :rtype: list(str)
+        """
+        lengths = [len(codeword) for codeword in codewords]
+        encoded = self.to_symbols(self.encode_array(to_trits("".join(codewords)), lengths))
+        return split_codewords(encoded, lengths)
+
+    def decode_codewords(self, codes):
+        """Decodes several codewords independently in one call
+
+        :param codes: Signals to be decoded
+        :type codes: list(str)
+        :return: Decoded signals
+        :rtype: list(str)
+        """
+        trits, counts = self.decode_array(self.to_indexes("".join(codes)), [len(code) for code in codes])
+        return split_codewords(from_trits(trits), counts)
 
-        decoded += str(self.alphabet.index(code[0]))
-
-        for i in range(1, len(code)):
-            b = self.alphabet.copy()
-            b.remove(code[i-1])
-            try:
-                flag = b.index(code[i])
-            except:
-                flag = -1
-            if flag != -1:
-                decoded += str(flag)
-        return decoded
+
+def to_trits(inp):
+    """Converts a signal of digits into an array of trits
+
+    :param inp: Signal
+    :type inp: str|list
+    :return: Trits
+    :rtype: np.array(np.uint8)
+    """
+    if isinstance(inp, str):
+        return np.frombuffer(inp.encode("latin-1"), dtype=np.uint8) - ord("0")
+    return np.array([int(trit) for trit in inp], dtype=np.uint8)
+
+def from_trits(trits):
+    """Converts an array of trits into a signal of digits
+
+    :param trits: Trits
+    :type trits: np.array
+    :return: Signal
+    :rtype: str
+    """
+    return (np.asarray(trits, dtype=np.uint8) + ord("0")).tobytes().decode("latin-1")
+
+def split_codewords(stream, lengths):
+    """Splits a stream into consecutive codewords
+
+    :param stream: Concatenated codewords
+    :type stream: str
+    :param lengths: Lengths of the codewords
+    :type lengths: list(int)
+    :return: Codewords
+    :rtype: list(str)
+    """
+    ends = np.cumsum(lengths)
+    return [stream[end-length:end] for end, length in zip(ends.tolist(), list(lengths))]
 
 
 class GoldmanCoderDNA(GoldmanCoder):
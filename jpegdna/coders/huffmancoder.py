@@ -5,6 +5,9 @@ import bisect
 # from collections import defaultdict
 from jpegdna.coders import AbstractCoder
 
+# Number of digits read by each level of the decoding tables
+DECODING_TABLE_DIGITS = 5
+
 def x_in_y(query, base):
     """Checks if query is a subsequence of base"""
     try:
@@ -232,6 +235,131 @@ def huffmandict(alphabet, freqs, n, verbose=False):
         print(f"Huffman dictionnary:\n{dic}\nCodeword lengths:\n{dict([(el[0], len(el[1])) for el in dic.items()])}\n========================")
     return dic
 
+def huffman_code_lengths(alphabet, freqs, n, verbose=False):
+    """Function that computes the codeword length of each element of the alphabet in the n-ary Huffman tree
+
+    :param alphabet: List of elements that can be encoded
+    :type alphabet: list
+    :param freqs: List of appearence frequencies for each element in the alphabet
+    :type freqs: list
+    :param n: base of the n-ary tree
+    :type n: int
+    :return: Codeword length for each element of the alphabet
+    :rtype: dict
+    """
+    probas = [el/sum(freqs) for el in freqs]
+    lengths = {}
+    def visit(node, depth):
+        if len(node.children) == 0:
+            lengths[node.data] = max(depth, 1)
+        else:
+            for child in node.children:
+                visit(child, depth+1)
+    visit(huffman_nary_tree(list(zip(alphabet, probas)), n, verbose=verbose), 0)
+    return lengths
+
+def limit_code_lengths(lengths, freqs, n, max_length):
+    """Limits the codeword lengths while keeping a prefix code (Kraft inequality)
+
+    The codewords too long are shortened to max_length, then the least probable
+    codewords are lengthened until the code is complete, the remaining room is
+    used to shorten the most probable codewords
+
+    :param lengths: Codeword lengths
+    :type lengths: list(int)
+    :param freqs: Appearence frequencies of the codewords
+    :type freqs: list
+    :param n: base of the n-ary tree
+    :type n: int
+    :param max_length: Maximum codeword length
+    :type max_length: int
+    :return: Limited codeword lengths
+    :rtype: list(int)
+    """
+    if len(lengths) > n**max_length:
+        raise ValueError(f"Huffman coder : Cannot code {len(lengths)} symbols with codewords of at most {max_length} digits")
+    lengths = [min(length, max_length) for length in lengths]
+    # Kraft sum in units of n**-max_length
+    kraft = sum(n**(max_length-length) for length in lengths)
+    by_freq = sorted(range(len(lengths)), key=lambda i: freqs[i])
+    while kraft > n**max_length:
+        i = max((i for i in by_freq if lengths[i] < max_length), key=lambda i: lengths[i])
+        kraft -= n**(max_length-lengths[i]) - n**(max_length-lengths[i]-1)
+        lengths[i] += 1
+    for i in reversed(by_freq):
+        while lengths[i] > 1 and kraft + n**(max_length-lengths[i]+1) - n**(max_length-lengths[i]) <= n**max_length:
+            kraft += n**(max_length-lengths[i]+1) - n**(max_length-lengths[i])
+            lengths[i] -= 1
+    return lengths
+
+def canonical_huffmandict(alphabet, freqs, n, max_length=None, verbose=False):
+    """Function that creates the dictionnary for the huffman coder with canonical codewords
+
+    The codeword lengths are the ones of the n-ary Huffman tree (limited to max_length if given),
+    the codewords are then assigned in increasing order of length and of position in the alphabet
+
+    :param alphabet: List of elements that can be encoded
+    :type alphabet: list
+    :param freqs: List of appearence frequencies for each element in the alphabet
+    :type freqs: list
+    :param n: base of the n-ary tree
+    :type n: int
+    :param max_length: Maximum codeword length (default: None, no limit)
+    :type max_length: int
+    :var verbose: Verbosity enabler
+    :param verbose: bool
+
+    :return: Codewords for each element of the alphabet
+    :rtype: dict
+    """
+    tree_lengths = huffman_code_lengths(alphabet, freqs, n, verbose=verbose)
+    lengths = [tree_lengths[el] for el in alphabet]
+    if max_length is not None:
+        lengths = limit_code_lengths(lengths, freqs, n, max_length)
+    order = sorted(range(len(alphabet)), key=lambda i: (lengths[i], i))
+    codes = {}
+    code, prev_length = -1, lengths[order[0]]
+    for i in order:
+        code = (code+1) * n**(lengths[i]-prev_length)
+        prev_length = lengths[i]
+        codes[str(alphabet[i])] = base_n(code, n).rjust(lengths[i], "0")
+    dic = dict(sorted(codes.items(), key=lambda x: int(x[0])))
+    if verbose:
+        print(f"Huffman dictionnary:\n{dic}\nCodeword lengths:\n{dict([(el[0], len(el[1])) for el in dic.items()])}\n========================")
+    return dic
+
+def build_decoding_table(dic, n, digits=DECODING_TABLE_DIGITS):
+    """Builds the multi-level lookup table decoding the codewords of a prefix code
+
+    A level is indexed by its next digits (at most digits of them), its entries are either
+    the tuple (symbol, number of digits of the codeword read at this level) or the list
+    [digits, entries] of the next level for the codewords longer than the level
+
+    :param dic: Huffman dictionnary
+    :type dic: dict
+    :param n: base of the n-ary tree
+    :type n: int
+    :param digits: Maximum number of digits read by a level
+    :type digits: int
+    :return: First level of the table
+    :rtype: list
+    """
+    def build_level(codewords):
+        level_digits = min(digits, max(len(codeword) for codeword, _ in codewords))
+        entries = [None] * n**level_digits
+        longer = {}
+        for codeword, symbol in codewords:
+            if len(codeword) <= level_digits:
+                first = int(codeword, n) * n**(level_digits-len(codeword))
+                for idx in range(first, first + n**(level_digits-len(codeword))):
+                    entries[idx] = (symbol, len(codeword))
+            else:
+                longer.setdefault(int(codeword[:level_digits], n), []).append((codeword[level_digits:], symbol))
+        for idx, sub_codewords in longer.items():
+            entries[idx] = build_level(sub_codewords)
+        return [level_digits, entries]
+    return build_level([(codeword, symbol) for symbol, codeword in dic.items()])
+
 class HuffmanCoder(AbstractCoder):
     """Huffman n-ary tree coder
 
@@ -248,20 +376,36 @@ class HuffmanCoder(AbstractCoder):
     :var debug: Verbosity for debug enabler
     :param debug: bool
 
+    :param canonical: Canonical codewords enabler (case 1, default: False)
+    :type canonical: bool
+    :param max_length: Maximum codeword length for canonical codewords (case 1, default: None, no limit)
+    :type max_length: int
+
     case 2:
 
     :param dic: Huffman dictionnary
     :type dic: dict
+
+    :ivar n: base of the n-ary tree (default: 3 in case 2)
+    :vartype n: int
+    :ivar decoding_table: multi-level lookup table of the codewords, built on first decoding
+    :vartype decoding_table: list
     """
 
-    def __init__(self, *args, verbose=False):
+    def __init__(self, *args, canonical=False, max_length=None, verbose=False):
+        self.n = 3
         if len(args) == 3:
-            self.dic = huffmandict(*args, verbose=verbose)
+            self.n = args[2]
+            if canonical:
+                self.dic = canonical_huffmandict(*args, max_length=max_length, verbose=verbose)
+            else:
+                self.dic = huffmandict(*args, verbose=verbose)
         elif len(args) == 1:
             self.dic = args[0]
         else:
             raise ValueError("Huffman coder : Wrong number of arguments for Huffman instantiation, "\
                              "either use the Huffman dictionnary or the parameters for the huffmandict function as entry")
+        self.decoding_table = None
         self.verbose = verbose
 
     def find_codeword_key(self, word):
@@ -299,20 +443,29 @@ class HuffmanCoder(AbstractCoder):
     def decode(self, code):
         """Decode a signal using the Huffman n-ary dictionnary
 
+        Each codeword is read from the multi-level lookup table, in one probe
+        per level it spans (one or two for codewords of up to twice DECODING_TABLE_DIGITS digits)
+
         :param code: Signal to be decoded
         :type code: str
         :return: Decoded signal
         :rtype: list
         """
+        if self.decoding_table is None:
+            self.decoding_table = build_decoding_table(self.dic, self.n)
         decoded = []
-        max_len_codeword = 0
-        for el in self.dic.values():
-            if len(el) > max_len_codeword:
-                max_len_codeword = len(el)
-        while code != "":
-            for i in range(1, min(len(code)+1, max_len_codeword)):
-                res = self.find_codeword_key(code[0:i+1])
-                if res is not None:
-                    decoded.append(res)
-                    code = code[i+1:]
+        pos, code_len = 0, len(code)
+        # padding so that every level can read all its digits
+        padded = code + "0" * max(len(codeword) for codeword in self.dic.values())
+        while pos < code_len:
+            level_digits, entries = self.decoding_table
+            entry = entries[int(padded[pos:pos+level_digits], self.n)]
+            while isinstance(entry, list):
+                pos += level_digits
+                level_digits, entries = entry
+                entry = entries[int(padded[pos:pos+level_digits], self.n)]
+            if entry is None or pos + entry[1] > code_len:
+                raise ValueError(f"Huffman coder : Invalid code, no codeword at position {pos}")
+            decoded.append(entry[0])
+            pos += entry[1]
         return decoded
@@ -1,9 +1,17 @@
 """Value coder"""
 
+import threading
+from collections import OrderedDict
 import numpy as np
 from jpegdna.coders import AbstractCoder
 from jpegdna.coders import AutomataGetterException, AutomataSetterException, AutomataSetterExceptionEncode, AutomataSetterExceptionDecode
 
+DEFAULT_CODEBOOK_CACHE_SIZE = 2
+
+# Inverse indexes and arrays of the last codebooks used, keyed by the id of the codebook they were built from
+_CODEBOOK_TABLES = OrderedDict()
+_CODEBOOK_TABLES_LOCK = threading.Lock()
+
 def get_codebook(ad_bits, codebook):
     """Returns the exhaustive codebooks for a given codeword length
 
@@ -36,6 +44,96 @@ def compute_max_value(ad_bits):
     tab = [0, None, 5, 17, 82, 375, 1263, 5262, 17579, 72909, 305276]
     return tab[ad_bits]
 
+def get_codebook_tables(codebook):
+    """Returns the inverse indexes and the arrays built from a codebook, by codeword length
+
+    Only the tables of the DEFAULT_CODEBOOK_CACHE_SIZE codebooks used last are kept,
+    the codebook loaded once per process by jpegdna.tools.loader.get_package_codebook
+    is not rebuilt in a batch
+
+    :param codebook: Codebooks for every codeword length
+    :type codebook: list
+    :return: Inverse indexes and arrays of the codebook, keyed by codeword length
+    :rtype: dict, dict
+    """
+    with _CODEBOOK_TABLES_LOCK:
+        entry = _CODEBOOK_TABLES.get(id(codebook))
+        if entry is None or entry[0] is not codebook:
+            # The codebook is stored next to its tables so that its id cannot be reused while they are kept
+            entry = (codebook, {}, {})
+            _CODEBOOK_TABLES[id(codebook)] = entry
+            while len(_CODEBOOK_TABLES) > DEFAULT_CODEBOOK_CACHE_SIZE:
+                _CODEBOOK_TABLES.popitem(last=False)
+        else:
+            _CODEBOOK_TABLES.move_to_end(id(codebook))
+    return entry[1], entry[2]
+
+def get_codebook_index(ad_bits, codebook):
+    """Returns the inverse index (codeword -> value) of the codebook for a given codeword length
+
+    The index is built on first use and shared by every value coder using the same codebook,
+    see get_codebook_tables
+
+    :param ad_bits: codeword length
+    :type ad_bits: int
+    :param codebook: Codebooks for every codeword length
+    :type codebook: list
+    :return: Inverse index
+    :rtype: dict
+    """
+    indexes = get_codebook_tables(codebook)[0]
+    if ad_bits not in indexes:
+        min_val, max_val = compute_min_value(ad_bits), compute_max_value(ad_bits)
+        values = list(range(min_val, max_val+1)) + list(range(-max_val, -min_val+1))
+        index = {}
+        for codeword, value in zip(get_codebook(ad_bits, codebook), values):
+            index.setdefault(codeword, value)
+        indexes[ad_bits] = index
+    return indexes[ad_bits]
+
+def get_codebook_array(ad_bits, codebook):
+    """Returns the codebook for a given codeword length as an array of codewords
+
+    The array is built on first use and allows to encode many values with a single indexing
+
+    :param ad_bits: codeword length
+    :type ad_bits: int
+    :param codebook: Codebooks for every codeword length
+    :type codebook: list
+    :return: Codebook
+    :rtype: np.array
+    """
+    arrays = get_codebook_tables(codebook)[1]
+    if ad_bits not in arrays:
+        arrays[ad_bits] = np.array(get_codebook(ad_bits, codebook), dtype=object)
+    return arrays[ad_bits]
+
+def encode_values(values, categories, codebook):
+    """Encodes an array of values according to their categories
+
+    Vectorized version of ValueCoder.encode
+
+    :param values: Values to be encoded
+    :type values: np.array
+    :param categories: Categories of the values
+    :type categories: np.array
+    :param codebook: Codebooks for every codeword length
+    :type codebook: list
+    :return: Codewords of the values (empty for the category 0)
+    :rtype: np.array
+    """
+    if (categories < 0).any():
+        raise ValueError("ValueCoder: Invalid value, out of range, category = -1")
+    codes = np.full(len(values), "", dtype=object)
+    for category in np.unique(categories[categories > 0]):
+        mask = categories == category
+        ad_bits = int(category) + 1
+        words = get_codebook_array(ad_bits, codebook)
+        vals = values[mask]
+        offsets = np.abs(vals) - compute_min_value(ad_bits)
+        codes[mask] = words[np.where(vals > 0, offsets, len(words) - offsets - 1)]
+    return codes
+
 class ValueCoder(AbstractCoder):
     """Value Coder
 
@@ -45,12 +143,15 @@ class ValueCoder(AbstractCoder):
     :vartype category: int
     :ivar ad_bits: length of the word coding the value
     :vartype ad_bits: int
+    :ivar pos: read position of the current codeword in the stream (decoding)
+    :vartype pos: int
     """
 
     def __init__(self, codebook, verbose=False):
         self.category = 0
         self.ad_bits = 0
         self.code_length = 0
+        self.pos = 0
         self.verbose = verbose
         self.codebook = codebook
 
@@ -60,11 +161,12 @@ class ValueCoder(AbstractCoder):
             self.category = args[0]
         elif case == 'encode':
             raise AutomataSetterExceptionEncode(f"ValueCoder: Invalid number of parameters, 1 expected, {len(args)} given.")
-        elif len(args) == 2 and case == 'decode':
+        elif len(args) in (2, 3) and case == 'decode':
             self.ad_bits = args[0]
             self.code_length = args[1]
+            self.pos = args[2] if len(args) == 3 else 0
         elif case == 'decode':
-            raise AutomataSetterExceptionDecode(f"ValueCoder: Invalid number of parameters, 2 expected, {len(args)} given.")
+            raise AutomataSetterExceptionDecode(f"ValueCoder: Invalid number of parameters, 2 or 3 expected, {len(args)} given.")
         else:
             raise AutomataSetterException("ValueCoder: Invalid parameters, expected case parameter in {'encode'|'decode'}" +
                                           f" but got {case}")
@@ -119,24 +221,15 @@ class ValueCoder(AbstractCoder):
     def decode(self, code):
         """Decode a value
 
+        The codeword is read after the category codeword starting at
+        the read position of the stream (self.pos)
+
         :param code: Sequence to be decoded
         :type code: str
         """
         if self.ad_bits == 0:
             return 0
-        codebook = get_codebook(self.ad_bits, self.codebook)
-        code_value = code[self.code_length:self.code_length+self.ad_bits]
-        idx = np.nonzero(np.in1d(codebook, code_value))
-        try:
-            idx = idx[0][0]
-        except:
-            return 0 # Cdeword not directly decodable because not in the codebook
-        min_val, max_val = compute_min_value(self.ad_bits), compute_max_value(self.ad_bits)
-        vecpos = list(range(min_val, max_val+1))
-        vecneg = list(range(-max_val, -min_val+1))
-        vec = vecpos + vecneg
-        # print(vecpos)
-        # print(vecneg)
-        # print(len(vec))
-        # print(vec)
-        return vec[idx]
+        start = self.pos + self.code_length
+        code_value = code[start:start+self.ad_bits]
+        # 0 if the codeword is not directly decodable because not in the codebook
+        return get_codebook_index(self.ad_bits, self.codebook).get(code_value, 0)
@@ -85,4 +85,6 @@ from jpegdna.format.generalinfoformatter import GeneralInfoFormatter
 from jpegdna.format.frequenciesformatter import RGBFrequenciesFormatter
 from jpegdna.format.frequenciesformatter import GrayFrequenciesFormatter
 from jpegdna.format.quantizationtablesformatter import QuantizationTablesInfoFormatter
+from jpegdna.format.rowindexformatter import RowIndexFormatter
+from jpegdna.format.channellengthsformatter import ChannelLengthsFormatter
 from jpegdna.format.jpegdnaformatter import JpegDNAFormatter
@@ -0,0 +1,37 @@
+"""Formatting method for the channel lengths oligo"""
+
+import numpy as np
+
+from jpegdna.format.rowindexformatter import RowIndexFormatter
+
+class ChannelLengthsFormatter(RowIndexFormatter):
+    """Formatter for the lengths of the strands of the channels in the data strand
+
+    The lengths are encoded as a row index with a single entry, so that the data strand
+    can be cut into the strands of the channels before decoding them.
+
+    :ivar header: header for the channel lengths oligos
+    :type header: str
+    :ivar oligo_length: Size of the oligos used for formatting
+    :type oligo_length: int
+    """
+
+    def format(self, inp):
+        """Encodes and formats the channel lengths
+
+        :param inp: length of the strand of each channel
+        :type inp: list(int)
+        :returns: formatted channel lengths oligos
+        :rtype: list(str)
+        """
+        return super().format([np.array(inp, dtype=np.int64)])
+
+    def deformat(self, oligos):
+        """Deformats and decodes the channel lengths
+
+        :param oligos: formatted channel lengths
+        :type oligos: list(str)
+        :returns: length of the strand of each channel
+        :rtype: list(int)
+        """
+        return [int(length) for length in super().deformat(oligos)[0]]
@@ -1,10 +1,8 @@
 """Formatting method for data oligo"""
-from pathlib import Path
 
-import jpegdna
 from jpegdna.format import AbstractFormatter
 from jpegdna.tools.strand_tools import generate_random_strand, compute_length
-from jpegdna.tools.loader import load_codebook_matrix
+from jpegdna.tools.loader import get_package_codebook
 
 
 class DataFormatter(AbstractFormatter):
@@ -22,7 +20,7 @@ class DataFormatter(AbstractFormatter):
         else:
             self.data_info_header = header
         self.header_len = len(header)
-        self.codebook = load_codebook_matrix(Path(jpegdna.__path__[0] + "/data/codebook.pkl"))
+        self.codebook = get_package_codebook()
         self.debug = debug
 
     def format(self, inp):
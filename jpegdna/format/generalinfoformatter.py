@@ -1,12 +1,10 @@
 """Formatting method for general info oligo"""
 
-from pathlib import Path
 import numpy as np
 
-import jpegdna
 from jpegdna.format import AbstractFormatter
 from jpegdna.tools.strand_tools import generate_random_strand, compute_length
-from jpegdna.tools.loader import load_codebook_matrix
+from jpegdna.tools.loader import get_package_codebook
 from jpegdna.transforms import ChannelSampler
 
 
@@ -59,7 +57,7 @@ class GeneralInfoFormatter(AbstractFormatter):
         self.offset_size = offset_size
         self.dc_freq_len = dc_freq_len
         self.ac_freq_len = ac_freq_len
-        self.codebook = load_codebook_matrix(Path(jpegdna.__path__[0] + "/data/codebook.pkl"))
+        self.codebook = get_package_codebook()
         self.debug = debug
         if image_type is not None:
             self.image_type = self.IMAGE_TYPES.index(image_type)
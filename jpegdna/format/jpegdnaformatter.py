@@ -2,7 +2,7 @@
 
 import warnings
 import math
-from jpegdna.format import AbstractFormatter, GeneralInfoFormatter, GrayFrequenciesFormatter, RGBFrequenciesFormatter, QuantizationTablesInfoFormatter, DataFormatter
+from jpegdna.format import AbstractFormatter, GeneralInfoFormatter, GrayFrequenciesFormatter, RGBFrequenciesFormatter, QuantizationTablesInfoFormatter, RowIndexFormatter, ChannelLengthsFormatter, DataFormatter
 from jpegdna.tools.strand_tools import compute_length
 
 
@@ -28,6 +28,8 @@ class JpegDNAFormatter(AbstractFormatter):
     DEFAULT_FREQS_INFO_HEADER = "ATCCGTC"
     DEFAULT_QUANTIZATION_INFO_HEADER = "GGTGTTC"
     DEFAULT_DATA_INFO_HEADER = "TTGAGGA"
+    DEFAULT_ROW_INDEX_HEADER = "CTGACAG"
+    DEFAULT_CHANNEL_LENGTHS_HEADER = "GACTCTG"
     DEFAULT_DC_FREQ_HEADER = "ATTC"
     DEFAULT_AC_FREQ_HEADER = "AGAG"
     PRIMERS = {
@@ -45,6 +47,8 @@ class JpegDNAFormatter(AbstractFormatter):
         self.set_primer()
         self.quantization_tables = quantization_tables # TODO pass to quantization
         self.freq_dc, self.freq_ac, self.m, self.n = None, None, None, None
+        self.row_index = None
+        self.channel_lengths = None
         self.oligo_length = oligo_length
 
         if debug:
@@ -52,6 +56,8 @@ class JpegDNAFormatter(AbstractFormatter):
             self.freqs_info_header = "\033[33m" + self.DEFAULT_FREQS_INFO_HEADER + "\033[0m"
             self.data_info_header = "\033[33m" + self.DEFAULT_DATA_INFO_HEADER + "\033[0m"
             self.quantization_info_header = "\033[33m" + self.DEFAULT_QUANTIZATION_INFO_HEADER + "\033[0m"
+            self.row_index_header = "\033[33m" + self.DEFAULT_ROW_INDEX_HEADER + "\033[0m"
+            self.channel_lengths_header = "\033[33m" + self.DEFAULT_CHANNEL_LENGTHS_HEADER + "\033[0m"
             self.dc_freq_header = "\033[32m" + self.DEFAULT_DC_FREQ_HEADER + "\033[36m"
             self.ac_freq_header = "\033[32m" + self.DEFAULT_AC_FREQ_HEADER + "\033[36m"
         else:
@@ -59,6 +65,8 @@ class JpegDNAFormatter(AbstractFormatter):
             self.freqs_info_header = self.DEFAULT_FREQS_INFO_HEADER
             self.data_info_header = self.DEFAULT_DATA_INFO_HEADER
             self.quantization_info_header = self.DEFAULT_QUANTIZATION_INFO_HEADER
+            self.row_index_header = self.DEFAULT_ROW_INDEX_HEADER
+            self.channel_lengths_header = self.DEFAULT_CHANNEL_LENGTHS_HEADER
             self.dc_freq_header = self.DEFAULT_DC_FREQ_HEADER
             self.ac_freq_header = self.DEFAULT_AC_FREQ_HEADER
 
@@ -66,6 +74,8 @@ class JpegDNAFormatter(AbstractFormatter):
         self.freqs_info_header_len = len(self.DEFAULT_FREQS_INFO_HEADER)
         self.quantization_info_header_len = len(self.DEFAULT_QUANTIZATION_INFO_HEADER)
         self.data_info_header_len = len(self.DEFAULT_DATA_INFO_HEADER)
+        self.row_index_header_len = len(self.DEFAULT_ROW_INDEX_HEADER)
+        self.channel_lengths_header_len = len(self.DEFAULT_CHANNEL_LENGTHS_HEADER)
         self.freq_type_header_len = len(self.DEFAULT_AC_FREQ_HEADER)
 
         self.image_id = "AATTC"
@@ -155,6 +165,22 @@ class JpegDNAFormatter(AbstractFormatter):
                                                                                            self.parity_len -
                                                                                            self.sense_len),
                                                                              debug=debug)
+        self.row_index_formatter = RowIndexFormatter(self.DEFAULT_ROW_INDEX_HEADER,
+                                                     oligo_length=(self.oligo_length -
+                                                                   self.primer_length -
+                                                                   self.row_index_header_len -
+                                                                   self.image_id_len -
+                                                                   self.parity_len -
+                                                                   self.sense_len),
+                                                     debug=debug)
+        self.channel_lengths_formatter = ChannelLengthsFormatter(self.DEFAULT_CHANNEL_LENGTHS_HEADER,
+                                                                 oligo_length=(self.oligo_length -
+                                                                               self.primer_length -
+                                                                               self.channel_lengths_header_len -
+                                                                               self.image_id_len -
+                                                                               self.parity_len -
+                                                                               self.sense_len),
+                                                                 debug=debug)
         self.data_formatter = DataFormatter(self.DEFAULT_DATA_INFO_HEADER,
                                             self.DEFAULT_OFFSET_SIZE,
                                             oligo_length=(self.oligo_length -
@@ -291,7 +317,24 @@ class JpegDNAFormatter(AbstractFormatter):
         else:
             raise ValueError
 
-    def full_format(self, inp, *args):
+    def full_format(self, inp, *args, row_index=None, channel_lengths=None):
+        """Formats the data strand with the general info, frequencies and quantization tables oligos,
+        the channel lengths oligo if the lengths of the strands of the channels are given,
+        and the row index oligos if the positions of the rows of blocks are given
+
+        :param inp: Strand to format
+        :type inp: str
+        :param args: Header info
+        :type args: any
+        :param row_index: Positions of the rows of blocks of each channel in its stream (default: None)
+        :type row_index: list(np.array)
+        :param channel_lengths: Lengths of the strands of the channels in the data strand (default: None)
+        :type channel_lengths: list(int)
+        :return: Formatted oligos
+        :rtype: list
+        """
+        self.row_index = row_index
+        self.channel_lengths = channel_lengths
         args += tuple([len(inp)])
         self.set_state(*args, case="format")
         oligos = self.format(inp)
@@ -306,8 +349,10 @@ class JpegDNAFormatter(AbstractFormatter):
 
     def format(self, inp):
         oligos = ([self.general_info_formatter.format(None)] +
+                  (self.channel_lengths_formatter.format(self.channel_lengths) if self.channel_lengths is not None else []) +
                   self.frequency_formatter.format((self.freq_dc, self.freq_ac)) +
                   self.quantization_tables_formatter.format(self.quantization_tables) +
+                  (self.row_index_formatter.format(self.row_index) if self.row_index is not None else []) +
                   self.data_formatter.format(inp))
         if self.debug:
             for oligo in oligos:
@@ -325,7 +370,8 @@ class JpegDNAFormatter(AbstractFormatter):
             for oligo in oligos_cleanup:
                 print(oligo)
         payload_strands = self.get_payload(oligos_cleanup)
-        general_info_strand, freq_strands, tables_strands, data_strands = None, [], [], []
+        general_info_strand, freq_strands, tables_strands, row_index_strands, data_strands = None, [], [], [], []
+        channel_lengths_strands = []
         for strand in payload_strands:
             header = strand[:7]
             substrand = strand[7:]
@@ -339,6 +385,10 @@ class JpegDNAFormatter(AbstractFormatter):
                     tables_strands.append(substrand)
                 elif "\033[33m" + header + "\033[0m" == self.data_info_header:
                     data_strands.append(substrand)
+                elif "\033[33m" + header + "\033[0m" == self.row_index_header:
+                    row_index_strands.append(substrand)
+                elif "\033[33m" + header + "\033[0m" == self.channel_lengths_header:
+                    channel_lengths_strands.append(substrand)
                 else:
                     raise ValueError("Wrong header")
             else:
@@ -350,6 +400,10 @@ class JpegDNAFormatter(AbstractFormatter):
                     tables_strands.append(substrand)
                 elif header == self.data_info_header:
                     data_strands.append(substrand)
+                elif header == self.row_index_header:
+                    row_index_strands.append(substrand)
+                elif header == self.channel_lengths_header:
+                    channel_lengths_strands.append(substrand)
                 else:
                     raise ValueError("Wrong header")
 
@@ -428,6 +482,16 @@ class JpegDNAFormatter(AbstractFormatter):
         # Quantization tables
         self.quantization_tables = self.quantization_tables_formatter.deformat(tables_strands)
 
+        # Row index and channel lengths, absent from the archives formatted without them
+        if row_index_strands:
+            self.row_index = self.row_index_formatter.deformat(row_index_strands)
+        else:
+            self.row_index = None
+        if channel_lengths_strands:
+            self.channel_lengths = self.channel_lengths_formatter.deformat(channel_lengths_strands)
+        else:
+            self.channel_lengths = None
+
         # Data strand
         data_strand = self.data_formatter.deformat(data_strands)
         if self.debug:
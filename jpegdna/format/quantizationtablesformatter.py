@@ -1,12 +1,10 @@
 """Formatting method for general info oligo"""
 
-from pathlib import Path
 import numpy as np
 
-import jpegdna
 from jpegdna.format import AbstractFormatter
 from jpegdna.tools.strand_tools import generate_random_strand, compute_length
-from jpegdna.tools.loader import load_codebook_matrix
+from jpegdna.tools.loader import get_package_codebook
 
 class QuantizationTablesInfoFormatter(AbstractFormatter):
     """Formatter for the general information related to the compression
@@ -34,7 +32,7 @@ class QuantizationTablesInfoFormatter(AbstractFormatter):
         self.oligo_length = oligo_length
         self.cw_length = self.DEFAULT_QUANTIZATION_TABLES_CODE_LENGTH
         self.debug = debug
-        self.codebook = load_codebook_matrix(Path(jpegdna.__path__[0] + "/data/codebook.pkl"))
+        self.codebook = get_package_codebook()
 
     def format(self, inp):
         """Encodes and formats the quantization tables
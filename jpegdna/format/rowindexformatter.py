@@ -0,0 +1,182 @@
+"""Formatting method for the row index oligos"""
+
+import numpy as np
+
+from jpegdna.format import AbstractFormatter
+from jpegdna.tools.strand_tools import generate_random_strand, compute_length
+from jpegdna.tools.loader import get_package_codebook
+
+class RowIndexFormatter(AbstractFormatter):
+    """Formatter for the index of the positions of the rows of blocks in the data strand
+
+    The index strand holds the codeword length, the number of codewords per value, the number of channels,
+    and for each channel its number of rows of blocks followed by the position of each row of blocks
+    in the stream of the channel, all encoded with fixed-length codebooks. The values too large for
+    the largest codebook are written with several codewords, most significant first.
+
+    :ivar header: header for the row index oligos
+    :type header: str
+    :ivar oligo_length: Size of the oligos used for formatting
+    :type oligo_length: int
+    :ivar cw_length: codeword length for encoding the number of rows and the positions
+    :type cw_length: int
+    :ivar cw_count: number of codewords per value
+    :type cw_count: int
+    """
+    DEFAULT_ROW_INDEX_OFFSET_CODE_LENGTH = 7
+    def __init__(self, header, oligo_length=200, debug=False):
+        if debug:
+            self.header = "\033[33m" + header + "\033[0m"
+        else:
+            self.header = header
+        self.header_len = len(header)
+        self.oligo_length = oligo_length
+        self.cw_length = None
+        self.cw_count = None
+        self.debug = debug
+        self.codebook = get_package_codebook()
+
+    def format(self, inp):
+        """Encodes and formats the row index
+
+        :param inp: positions of the rows of blocks of each channel
+        :type inp: list(np.array)
+        :returns: formatted row index oligos
+        :rtype: list(str)
+        """
+        return self.format_index(self.encode_index(inp))
+
+    def deformat(self, oligos):
+        """Deformats and decodes the row index
+
+        :param oligos: formatted row index
+        :type oligos: list(str)
+        :returns: positions of the rows of blocks of each channel
+        :rtype: list(np.array)
+        """
+        return self.decode_index(self.deformat_index(oligos))
+
+    def format_index(self, inp):
+        """Format the strand encoding the row index
+
+        :param inp: strand to format
+        :type inp: str
+        :raises ValueError: if the strand needs more oligos than the offset codewords can number
+        :returns: formatted row index oligos
+        :rtype: list(str)
+        """
+        data_payload_length = self.oligo_length - self.DEFAULT_ROW_INDEX_OFFSET_CODE_LENGTH
+        offset_codebook = self.codebook[self.DEFAULT_ROW_INDEX_OFFSET_CODE_LENGTH - 2]
+        num_oligos = -(-len(inp) // data_payload_length)
+        if num_oligos > len(offset_codebook):
+            raise ValueError(f"The row index needs {num_oligos} oligos, the offset codewords of length " +
+                             f"{self.DEFAULT_ROW_INDEX_OFFSET_CODE_LENGTH} number at most {len(offset_codebook)} oligos")
+        oligos = [self.header +
+                  offset_codebook[i//data_payload_length] +
+                  inp[i:i+data_payload_length]
+                  for i in range(0, len(inp), data_payload_length)]
+        before = inp[-1]
+        if self.debug:
+            oligos[-1] = (oligos[-1] +
+                          "\033[30;47m" +
+                          generate_random_strand(data_payload_length-compute_length(oligos[-1]) + self.header_len + self.DEFAULT_ROW_INDEX_OFFSET_CODE_LENGTH,
+                                                 before,
+                                                 "A") +
+                          "\033[0;37;40m")
+        else:
+            oligos[-1] = (oligos[-1] +
+                          generate_random_strand(data_payload_length-len(oligos[-1]) + self.header_len + self.DEFAULT_ROW_INDEX_OFFSET_CODE_LENGTH,
+                                                 before,
+                                                 "A"))
+        return oligos
+
+    def deformat_index(self, oligos):
+        """Deformat the oligos describing the row index
+
+        :param oligos: oligos to deformat
+        :type inp: list(str)
+        :returns: strand encoding the row index
+        :rtype: str
+        """
+        end = self.DEFAULT_ROW_INDEX_OFFSET_CODE_LENGTH
+        offset_codebook = self.codebook[self.DEFAULT_ROW_INDEX_OFFSET_CODE_LENGTH - 2]
+        strands_index = {offset_codebook.index(oligo[:end]): oligo[end:] for oligo in oligos}
+        return "".join(strands_index[i] for i in sorted(strands_index))
+
+    def encode_index(self, inp):
+        """Encode the row index using fixed-length codebooks
+
+        :param inp: positions of the rows of blocks of each channel
+        :type inp: list(np.array)
+        :returns: strand encoding the row index
+        :rtype: str
+        """
+        maxi = max(max(len(offsets), int(np.max(offsets, initial=0))) for offsets in inp)
+        self.cw_count = 1
+        for ii in range(len(self.codebook)):
+            if len(self.codebook[ii]) > maxi:
+                self.cw_length = ii + 2
+                break
+        else:
+            self.cw_length = len(self.codebook) + 1
+            while len(self.codebook[-1]) ** self.cw_count <= maxi:
+                self.cw_count += 1
+        offset_codebook = self.codebook[self.DEFAULT_ROW_INDEX_OFFSET_CODE_LENGTH - 2]
+        strand = offset_codebook[self.cw_length] + offset_codebook[self.cw_count] + offset_codebook[len(inp)]
+        for offsets in inp:
+            strand += self.encode_value(len(offsets)) + "".join(self.encode_value(int(offset)) for offset in offsets)
+        return strand
+
+    def encode_value(self, value):
+        """Encode a value with self.cw_count codewords of length self.cw_length
+
+        :param value: value to encode
+        :type value: int
+        :returns: codewords
+        :rtype: str
+        """
+        codebook = self.codebook[self.cw_length - 2]
+        codewords = []
+        for _ in range(self.cw_count):
+            value, digit = divmod(value, len(codebook))
+            codewords.append(codebook[digit])
+        return "".join(reversed(codewords))
+
+    def decode_index(self, strand):
+        """Decode the row index using fixed-length codebooks
+
+        :param strand: encoded row index
+        :type strand: str
+        :returns: positions of the rows of blocks of each channel
+        :rtype: list(np.array)
+        """
+        end = self.DEFAULT_ROW_INDEX_OFFSET_CODE_LENGTH
+        offset_codebook = self.codebook[self.DEFAULT_ROW_INDEX_OFFSET_CODE_LENGTH - 2]
+        self.cw_length = offset_codebook.index(strand[:end])
+        self.cw_count = offset_codebook.index(strand[end:2*end])
+        num_channels = offset_codebook.index(strand[2*end:3*end])
+        codebook = {codeword: i for i, codeword in enumerate(self.codebook[self.cw_length - 2])}
+        value_length = self.cw_length * self.cw_count
+        pos, index = 3*end, []
+        for _ in range(num_channels):
+            num_rows = self.decode_value(strand[pos:pos+value_length], codebook)
+            pos += value_length
+            index.append(np.array([self.decode_value(strand[pos+i*value_length:pos+(i+1)*value_length], codebook)
+                                   for i in range(num_rows)], dtype=np.int64))
+            pos += num_rows * value_length
+        return index
+
+    def decode_value(self, strand, codebook):
+        """Decode a value written with self.cw_count codewords of length self.cw_length
+
+        :param strand: codewords
+        :type strand: str
+        :param codebook: index of each codeword of the codebook
+        :type codebook: dict
+        :returns: value
+        :rtype: int
+        """
+        value = 0
+        for i in range(0, len(strand), self.cw_length):
+            value = value * len(codebook) + codebook[strand[i:i+self.cw_length]]
+        return value
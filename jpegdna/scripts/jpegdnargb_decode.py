@@ -21,8 +21,8 @@ def stats(func):
     return inner
 
 @stats
-def decode_image(code, formatting, defaultfreq, freqfpath, infofpath, gammasfpath, verbosity, verbosity_level, channel_sampler):
-    """Decode an image"""
+def decode_image(code, formatting, defaultfreq, freqfpath, infofpath, gammasfpath, verbosity, verbosity_level, channel_sampler, jpeg_fpath=None):
+    """Decode an image, or write its quantized coefficients to the JPEG file jpeg_fpath if given"""
     if not formatting:
         with open(infofpath, 'rb') as f:
             info = pickle.load(f)
@@ -35,16 +35,16 @@ def decode_image(code, formatting, defaultfreq, freqfpath, infofpath, gammasfpat
     codec = JPEGDNARGB(1, "", channel_sampler, False, formatting=formatting, verbose=verbosity, verbosity=verbosity_level)
     if formatting:
         if defaultfreq:
-            decoded = codec.full_decode(code, "default")
+            decoded = codec.full_decode(code, "default", jpeg_fpath=jpeg_fpath)
         else:
-            decoded = codec.full_decode(code, "from_img")
+            decoded = codec.full_decode(code, "from_img", jpeg_fpath=jpeg_fpath)
     elif defaultfreq:
         decoded = codec.full_decode(code, "default", ((info["Y"]["m"],
                                                        info["Y"]["n"]),
                                                       (info["Cb"]["m"],
                                                        info["Cb"]["n"]),
                                                       (info["Cr"]["m"],
-                                                       info["Cr"]["n"])), gammas['gammas'])
+                                                       info["Cr"]["n"])), gammas['gammas'], jpeg_fpath=jpeg_fpath)
     else:
         decoded = codec.full_decode(code, "from_img", ((info["Y"]["m"],
                                                         info["Y"]["n"],
@@ -57,11 +57,12 @@ def decode_image(code, formatting, defaultfreq, freqfpath, infofpath, gammasfpat
                                                        (info["Cr"]["m"],
                                                         info["Cr"]["n"],
                                                         freqs["Cr"]["freq_dc"],
-                                                        freqs["Cr"]["freq_ac"])), gammas['gammas'])
+                                                        freqs["Cr"]["freq_ac"])), gammas['gammas'], jpeg_fpath=jpeg_fpath)
     return decoded
 
-def decode(formatting, default_freq, datafpath, imgoutpath, freqfpath, infofpath, gammasfpath, verbosity, verbosity_level, channel_sampler, extension):
-    """Full image decoder with stats and exception handling"""
+def decode(formatting, default_freq, datafpath, imgoutpath, freqfpath, infofpath, gammasfpath, verbosity, verbosity_level, channel_sampler, extension, jpeg=False):
+    """Full image decoder with stats and exception handling, the output is a JPEG file of the decoded coefficients if jpeg is set"""
+    jpeg_fpath = imgoutpath if jpeg else None
     if formatting:
         if extension in ["pickle", "pkl"]:
             with open(datafpath, 'rb') as f:
@@ -76,12 +77,13 @@ def decode(formatting, default_freq, datafpath, imgoutpath, freqfpath, infofpath
                         oligos.append(line)
         else:
             raise ValueError("Wring Extension")
-        decoded = decode_image(oligos, formatting, default_freq, freqfpath, infofpath, gammasfpath, verbosity, verbosity_level, channel_sampler)
+        decoded = decode_image(oligos, formatting, default_freq, freqfpath, infofpath, gammasfpath, verbosity, verbosity_level, channel_sampler, jpeg_fpath)
     else:
         with open(datafpath, 'r', encoding="UTF-8") as f:
             code = f.read()
-        decoded = decode_image(code, formatting, default_freq, freqfpath, infofpath, gammasfpath, verbosity, verbosity_level, channel_sampler)
-    io.imsave(imgoutpath, decoded)
+        decoded = decode_image(code, formatting, default_freq, freqfpath, infofpath, gammasfpath, verbosity, verbosity_level, channel_sampler, jpeg_fpath)
+    if not jpeg:
+        io.imsave(imgoutpath, decoded)
     return decoded
 
 # pylint: disable=missing-function-docstring
@@ -107,6 +109,8 @@ def main():
                         action="store_true", help="Enables the use of precalculated default frequencies")
     parser.add_argument('-f', '--enable_formatting',
                         action="store_true", help="Enables formatting into an oligo pull")
+    parser.add_argument('-j', '--jpeg',
+                        action="store_true", help="Writes the decoded quantized coefficients to a JPEG file, without reconstructing the pixels")
     args = parser.parse_args()
 
     channel_sampler = args.SubSamp # Remember type of subsampling of the original JPEG image
@@ -114,6 +118,7 @@ def main():
     imgoutpath = args.IMGOUTPATH
     formatting = args.enable_formatting
     defaultfreq = args.default_frequencies
+    jpeg = args.jpeg
     if defaultfreq or formatting:
         freqfpath = None
     else:
@@ -124,7 +129,7 @@ def main():
     else:
         infofpath = config['IO_DIR']["dir"] + config['IO_DECODE']["info_in_path"]
         gammasfpath = config['IO_DIR']["dir"] + config['IO_DECODE']["gammas_in_path"]
-    decode(formatting, defaultfreq, datafpath, imgoutpath, freqfpath, infofpath, gammasfpath, verbosity, verbosity_level, channel_sampler, extension)
+    decode(formatting, defaultfreq, datafpath, imgoutpath, freqfpath, infofpath, gammasfpath, verbosity, verbosity_level, channel_sampler, extension, jpeg)
 # pylint: enable=missing-function-docstring
 
 
@@ -7,12 +7,7 @@ import argparse
 import configparser
 from skimage import io
 import jpegdna
-from jpegdna.codecs import JPEGDNARGB
-
-# Imports for transcoder
-import pyximport
-pyximport.install()
-from decoder import PyCoefficientDecoder 
+from jpegdna.codecs import JPEGDNARGB, JPEGSession
 import numpy as np
 
 
@@ -32,10 +27,10 @@ def stats(func):
                 code_length = 0
                 for oligo in oligos:
                     code_length += len(oligo)
-                compression_rate = 24 * args[0].shape[0] * args[0].shape[1] / code_length
+                compression_rate = 24 * args[10].image_height * args[10].image_width / code_length
                 print(f"Compression rate: {compression_rate} bits/nt")
             else:
-                compression_rate = 24 * args[0].shape[0] * args[0].shape[1] / len(code)
+                compression_rate = 24 * args[10].image_height * args[10].image_width / len(code)
                 print(f"Compression rate: {compression_rate} bits/nt")
 
                 img_info_y = {"m": res[0][1], "n": res[0][2]}
@@ -49,10 +44,10 @@ def stats(func):
                 freq_info = {"Y": freq_info_y, "Cb": freq_info_cb, "Cr": freq_info_cr}
                 gammas_info = {"gammas": gammas}
             if args[2]:
-                if args[10] in ["pickle", "pkl"]:
+                if args[12] in ["pickle", "pkl"]:
                     with open(args[4], 'wb') as f:
                         pickle.dump(oligos, f)
-                elif args[10] in ["fasta", "fas"]:
+                elif args[12] in ["fasta", "fas"]:
                     fasta_file = open(args[4], "w+", encoding='utf-8')
                     out = '\n'.join(['>Oligo' + str(i) + "\n" + el for i, el in enumerate(oligos)])
                     fasta_file.write(out)
@@ -73,29 +68,30 @@ def stats(func):
 
 # pylint: disable=unused-argument
 @stats
-def encode_image(img, alpha, formatting, defaultfreq, datafpath, freqoutfpath, infofpath, gammasfpath, verbosity, verbosity_level, img_fpath, channel_sampler, extension):
-    """Function for encoding"""
+def encode_image(img, alpha, formatting, defaultfreq, datafpath, freqoutfpath, infofpath, gammasfpath, verbosity, verbosity_level, session, channel_sampler, extension, coefficients):
+    """Function for encoding, the quantized coefficients of the JPEG image are coded if coefficients is set"""
 
-    # Pass the img_fpath, and type of subsampling as an argument as well
-    codec = JPEGDNARGB(alpha, img_fpath, channel_sampler, True, formatting=formatting, verbose=verbosity, verbosity=verbosity_level)
+    # Pass the JPEG session of the image, and type of subsampling as an argument as well
+    codec = JPEGDNARGB(alpha, session, channel_sampler, True, formatting=formatting, verbose=verbosity, verbosity=verbosity_level)
     if formatting:
         if defaultfreq:
-            oligos = codec.full_encode(img, "default")
+            oligos = codec.full_encode(img, "default", coefficients=coefficients)
         else:
-            oligos = codec.full_encode(img, "from_img")
+            oligos = codec.full_encode(img, "from_img", coefficients=coefficients)
         return oligos
     elif defaultfreq:
-        (code, res, gammas) = codec.full_encode(img, "default")
+        (code, res, gammas) = codec.full_encode(img, "default", coefficients=coefficients)
     else:
-        (code, res, gammas) = codec.full_encode(img, "from_img")
+        (code, res, gammas) = codec.full_encode(img, "from_img", coefficients=coefficients)
     return code, res, gammas
 # pylint: enable=unused-argument
 
-def encode(alpha, formatting, defaultfreq, channel_sampler, img_fpath, datafpath, freqoutfpath, infofpath, gammasfpath, verbosity, verbosity_level, extension):
+def encode(alpha, formatting, defaultfreq, channel_sampler, session, datafpath, freqoutfpath, infofpath, gammasfpath, verbosity, verbosity_level, extension, coefficients=False):
     """Full image encoder with stats and exception handling"""
 
-    img = io.imread(img_fpath)
-    return encode_image(img, alpha, formatting, defaultfreq, datafpath, freqoutfpath, infofpath, gammasfpath, verbosity, verbosity_level, img_fpath, channel_sampler, extension)
+    # The pixels are not decoded when coding the coefficients of the JPEG image
+    img = None if coefficients else io.imread(session.path)
+    return encode_image(img, alpha, formatting, defaultfreq, datafpath, freqoutfpath, infofpath, gammasfpath, verbosity, verbosity_level, session, channel_sampler, extension, coefficients)
 
 # pylint: disable=missing-function-docstring
 def main():
@@ -120,6 +116,8 @@ def main():
                         action="store_true", help="Enables the use of precalculated default frequencies")
     parser.add_argument('-f', '--enable_formatting',
                         action="store_true", help="Enables formatting into an oligo pull")
+    parser.add_argument('-c', '--coefficients',
+                        action="store_true", help="Codes the quantized coefficients of the JPEG image, without decoding its pixels")
     args = parser.parse_args()
 
     img_fpath = args.IMG_FPATH
@@ -127,9 +125,10 @@ def main():
     #alpha = args.ALPHA
     formatting = args.enable_formatting
     defaultfreq = args.default_frequencies
+    coefficients = args.coefficients
 
-    # We read the sampling factors and pattern match to extract the type of Chroma subsampling
-    d = PyCoefficientDecoder(img_fpath) 
+    # The JPEG image is loaded once: we read the sampling factors and pattern match to extract the type of Chroma subsampling
+    d = JPEGSession(img_fpath)
     sampling_factors = (d.h_samp_factor(0), d.v_samp_factor(0), d.h_samp_factor(1), d.v_samp_factor(1), d.h_samp_factor(2), d.v_samp_factor(2))
     if  sampling_factors == (1,1,1,1,1,1):
         channel_sampler = '4:4:4'
@@ -157,7 +156,7 @@ def main():
         freqoutfpath = None
     else:
         freqoutfpath = io_dir + config['IO_ENCODE']["freqs_out_path"]
-    encode(1, formatting, defaultfreq, channel_sampler, img_fpath, datafpath, freqoutfpath, infofpath, gammasfpath, verbosity, verbosity_level, extension)
+    encode(1, formatting, defaultfreq, channel_sampler, d, datafpath, freqoutfpath, infofpath, gammasfpath, verbosity, verbosity_level, extension, coefficients)
     print(f'Please remember for decoding: Subsampling mode is {channel_sampler}')
 # pylint: enable=missing-function-docstring
 
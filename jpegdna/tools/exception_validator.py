@@ -35,6 +35,7 @@ def generate_decorator(exception):
 expected_value_error = generate_decorator(ValueError)
 expected_type_error = generate_decorator(TypeError)
 expected_index_error = generate_decorator(IndexError)
+expected_runtime_error = generate_decorator(RuntimeError)
 expected_non_decodable_category = generate_decorator(NonDecodableCategory)
 expected_non_decodable_goldman = generate_decorator(NonDecodableGoldman)
 expected_setter_encode_coder_error = generate_decorator(SetterEncodeCoderError)
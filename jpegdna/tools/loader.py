@@ -1,6 +1,13 @@
 """Helper functions for .mat data"""
 import pickle
+import threading
+from pathlib import Path
 from scipy.io import loadmat
+import jpegdna
+
+# Lut and codebook of the package, loaded once per process and shared by every codec
+_PACKAGE_TABLES = {}
+_PACKAGE_TABLES_LOCK = threading.Lock()
 
 def load_lut_matrix(string):
     """Loads matrix values saved in .mat file"""
@@ -11,3 +18,27 @@ def load_codebook_matrix(string):
     with open(string, "rb") as f:
         arr = pickle.load(f)
     return arr
+
+def _get_package_table(name, loader):
+    """Loads a data file of the package on the first call, returns the shared table afterwards"""
+    with _PACKAGE_TABLES_LOCK:
+        if name not in _PACKAGE_TABLES:
+            _PACKAGE_TABLES[name] = loader(Path(jpegdna.__path__[0] + "/data/" + name))
+        return _PACKAGE_TABLES[name]
+
+def get_package_lut():
+    """Returns the lut matrix of the package, shared by every codec of the process, it must not be modified"""
+    return _get_package_table("lut.mat", load_lut_matrix)
+
+def get_package_codebook():
+    """Returns the codebooks of the package, shared by every codec of the process, they must not be modified"""
+    return _get_package_table("codebook.pkl", load_codebook_matrix)
+
+def get_package_table(name):
+    """Returns a table of the package from the name of its data file, e.g. in a worker process"""
+    return {"lut.mat": get_package_lut, "codebook.pkl": get_package_codebook}[name]()
+
+def get_package_table_name(table):
+    """Returns the name of the data file of a table of the package already loaded, None for any other table"""
+    with _PACKAGE_TABLES_LOCK:
+        return next((name for name, package_table in _PACKAGE_TABLES.items() if package_table is table), None)
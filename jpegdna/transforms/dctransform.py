@@ -1,10 +1,43 @@
 """Discrete cosine forward and inverse transforms"""
 
+import numpy as np
 from scipy.fftpack import dctn, idctn
 from jpegdna.transforms import AbstractTransform
 
+DCT_BACKENDS = ("fftpack", "matmul")
+
+_DCT_BASES = {}
+
+
+def get_dct_basis(size):
+    """Returns the orthonormal DCT-II matrix of a size, computed once per size
+
+    :param size: length of the transformed signals
+    :type size: int
+    :return: DCT matrix, the coefficients of a signal x are basis @ x
+    :rtype: np.array
+    """
+    if size not in _DCT_BASES:
+        freqs, samples = np.meshgrid(np.arange(size), np.arange(size), indexing="ij")
+        basis = np.sqrt(2/size) * np.cos(np.pi * (2*samples+1) * freqs / (2*size))
+        basis[0] /= np.sqrt(2)
+        basis.flags.writeable = False
+        _DCT_BASES[size] = basis
+    return _DCT_BASES[size]
+
+
 class DCT(AbstractTransform):
-    """For Jpeg"""
+    """For Jpeg
+
+    :param backend: Backend of the transforms of stacks of blocks: 'fftpack' (default) or
+                    'matmul', products with the DCT matrices (orthonormal transforms only)
+    :type backend: str
+    """
+
+    def __init__(self, backend="fftpack"):
+        if backend not in DCT_BACKENDS:
+            raise ValueError(f"DCT: Invalid backend, expected one of {DCT_BACKENDS} but got {backend}")
+        self.backend = backend
 
     def full_forward(self, inp, *args):
         """
@@ -59,3 +92,42 @@ class DCT(AbstractTransform):
         :rtype: np.array
         """
         return idctn(inp)
+
+    def forward_blocks(self, inp, norm=None):
+        """
+        Forward 2D DCT of a stack of blocks, along the last two axes
+
+        :param inp: input image blocks
+        :type inp: np.array of shape (N, num_rows, num_cols)
+        :param norm: Type of DCT (default: None)
+        :type norm: str
+        :return: DCT coefficients of every block
+        :rtype: np.array of shape (N, num_rows, num_cols)
+        """
+        if self.backend == "matmul":
+            rows_basis, cols_basis = self.__bases(inp, norm)
+            return rows_basis @ inp @ cols_basis.T
+        return dctn(inp, axes=(-2, -1), norm=norm)
+
+    def inverse_blocks(self, inp, norm=None):
+        """
+        Inverse 2D DCT of a stack of blocks, along the last two axes
+
+        :param inp: DCT coefficients of the blocks
+        :type inp: np.array of shape (N, num_rows, num_cols)
+        :param norm: Type of DCT (default: None)
+        :type norm: str
+        :return: image blocks
+        :rtype: np.array of shape (N, num_rows, num_cols)
+        """
+        if self.backend == "matmul":
+            rows_basis, cols_basis = self.__bases(inp, norm)
+            return rows_basis.T @ inp @ cols_basis
+        return idctn(inp, axes=(-2, -1), norm=norm)
+
+    @staticmethod
+    def __bases(inp, norm):
+        if norm != "ortho":
+            raise ValueError("DCT: The matmul backend only computes orthonormal transforms, expected norm 'ortho'" +
+                             f" but got {norm}")
+        return get_dct_basis(np.shape(inp)[-2]), get_dct_basis(np.shape(inp)[-1])
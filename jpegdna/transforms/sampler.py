@@ -21,6 +21,15 @@ class ChannelSampler(AbstractTransform):
         """Set sampler from its name"""
         self.sampler = sampler.replace(":", "_")
 
+    def get_sampling_factors(self):
+        """Get the JPEG sampling factors of the channels
+
+        :returns: Horizontal and vertical sampling factors of the 3 channels
+        :rtype: list
+        """
+        luma = {"4_2_0": (2, 2), "4_2_2": (2, 1), "4_1_1": (4, 1), "4_4_0": (1, 2), "4_4_4": (1, 1)}[self.sampler]
+        return [luma, (1, 1), (1, 1)]
+
     def forward(self, inp):
         """Sampling method
 
@@ -4,6 +4,114 @@ import numpy as np
 from jpegdna.transforms import AbstractTransform
 from jpegdna.transforms import AutomataSetterException
 
+_ZIGZAG_ORDERS = {}
+
+
+def _forward_walk(inp):
+    """Reads a matrix following the zig-zag order, element by element"""
+    (num_rows, num_cols) = np.shape(inp)
+    out = np.zeros((num_rows*num_cols))
+    cur_row, cur_col, cur_ind = 0, 0, 0
+    while cur_row < num_rows and cur_col < num_cols:
+        if cur_row == 0 and (cur_row+cur_col)%2 == 0 and cur_col != num_cols-1:
+            out[cur_ind] = inp[cur_row, cur_col]
+            cur_col += 1
+            cur_ind += 1
+        elif cur_row == num_rows-1 and (cur_row+cur_col)%2 != 0 and cur_col != num_cols-1:
+            out[cur_ind] = inp[cur_row, cur_col]
+            cur_col += 1
+            cur_ind += 1
+        elif cur_col == 0 and (cur_row+cur_col)%2 != 0 and cur_row != num_rows-1:
+            out[cur_ind] = inp[cur_row, cur_col]
+            cur_row += 1
+            cur_ind += 1
+        elif cur_col == num_cols-1 and (cur_row+cur_col)%2 == 0 and cur_row != num_rows-1:
+            out[cur_ind] = inp[cur_row, cur_col]
+            cur_row += 1
+            cur_ind += 1
+        elif cur_col != 0 and cur_row != num_rows-1 and (cur_row+cur_col)%2 != 0:
+            out[cur_ind] = inp[cur_row, cur_col]
+            cur_row += 1
+            cur_col -= 1
+            cur_ind += 1
+        elif cur_row != 0 and cur_col != num_cols-1 and (cur_row+cur_col)%2 == 0:
+            out[cur_ind] = inp[cur_row, cur_col]
+            cur_row -= 1
+            cur_col += 1
+            cur_ind += 1
+        elif cur_row == num_rows-1 and cur_col == num_cols-1:
+            out[-1] = inp[-1, -1]
+            break
+    return out
+
+
+def _inverse_walk(inp, vmax, hmax):
+    """Fills a matrix following the zig-zag order, element by element"""
+    hor, ver, vmin, hmin = 0, 0, 0, 0
+    out = np.zeros((vmax, hmax))
+    i = 0
+    while ver < vmax and hor < hmax:
+        if (hor+ver)%2 == 0:
+            if ver == vmin:
+                out[ver, hor] = inp[i]
+                if hor == hmax-1:
+                    ver += 1
+                else:
+                    hor += 1
+                i += 1
+            elif hor == hmax-1 and ver < vmax-1:
+                out[ver, hor] = inp[i]
+                ver += 1
+                i += 1
+            elif ver > vmin and hor < hmax-1:
+                out[ver, hor] = inp[i]
+                ver -= 1
+                hor += 1
+                i += 1
+        else:
+            if ver == vmax-1 and hor <= hmax-1:
+                out[ver, hor] = inp[i]
+                hor += 1
+                i += 1
+            elif hor == hmin:
+                out[ver, hor] = inp[i]
+                if ver == vmax-1:
+                    hor += 1
+                else:
+                    ver += 1
+                i += 1
+            elif ver < vmax-1 and hor > hmin:
+                out[ver, hor] = inp[i]
+                ver += 1
+                hor -= 1
+                i += 1
+        if ver == vmax-1 and hor == hmax-1:
+            out[ver, hor] = inp[i]
+            break
+    return out
+
+
+def get_zigzag_order(num_rows, num_cols):
+    """Returns the zig-zag reading order of a block size, computed once per block size
+
+    :param num_rows: number of rows of the blocks
+    :type num_rows: int
+    :param num_cols: number of columns of the blocks
+    :type num_cols: int
+    :return: index in the flattened block of each element of the sequence,
+             index in the sequence of each element of the flattened block
+    :rtype: np.array, np.array
+    """
+    key = (num_rows, num_cols)
+    if key not in _ZIGZAG_ORDERS:
+        size = num_rows*num_cols
+        order = _forward_walk(np.arange(size).reshape(key)).astype(int)
+        inverse_order = _inverse_walk(np.arange(size), num_rows, num_cols).astype(int).ravel()
+        order.flags.writeable = False
+        inverse_order.flags.writeable = False
+        _ZIGZAG_ORDERS[key] = (order, inverse_order)
+    return _ZIGZAG_ORDERS[key]
+
 
 class ZigZag(AbstractTransform):
     """Zig-zag transform
@@ -43,39 +151,8 @@ class ZigZag(AbstractTransform):
         :return: Zig-zag read sequence
         :rtype: np.array
         """
-        (num_rows, num_cols) = np.shape(inp)
-        out = np.zeros((num_rows*num_cols))
-        cur_row, cur_col, cur_ind = 0, 0, 0
-        while cur_row < num_rows and cur_col < num_cols:
-            if cur_row == 0 and (cur_row+cur_col)%2 == 0 and cur_col != num_cols-1:
-                out[cur_ind] = inp[cur_row, cur_col]
-                cur_col += 1
-                cur_ind += 1
-            elif cur_row == num_rows-1 and (cur_row+cur_col)%2 != 0 and cur_col != num_cols-1:
-                out[cur_ind] = inp[cur_row, cur_col]
-                cur_col += 1
-                cur_ind += 1
-            elif cur_col == 0 and (cur_row+cur_col)%2 != 0 and cur_row != num_rows-1:
-                out[cur_ind] = inp[cur_row, cur_col]
-                cur_row += 1
-                cur_ind += 1
-            elif cur_col == num_cols-1 and (cur_row+cur_col)%2 == 0 and cur_row != num_rows-1:
-                out[cur_ind] = inp[cur_row, cur_col]
-                cur_row += 1
-                cur_ind += 1
-            elif cur_col != 0 and cur_row != num_rows-1 and (cur_row+cur_col)%2 != 0:
-                out[cur_ind] = inp[cur_row, cur_col]
-                cur_row += 1
-                cur_col -= 1
-                cur_ind += 1
-            elif cur_row != 0 and cur_col != num_cols-1 and (cur_row+cur_col)%2 == 0:
-                out[cur_ind] = inp[cur_row, cur_col]
-                cur_row -= 1
-                cur_col += 1
-                cur_ind += 1
-            elif cur_row == num_rows-1 and cur_col == num_cols-1:
-                out[-1] = inp[-1, -1]
-                break
+        inp = np.asarray(inp)
+        out = inp.ravel()[get_zigzag_order(*np.shape(inp))[0]]
         if self.verbose:
             print(f"----------\nZig-Zag forward:\n{out.astype(int)}")
         return out.astype(int)
@@ -92,47 +169,44 @@ class ZigZag(AbstractTransform):
         :return: reconstructed matrix
         :rtype: np.array
         """
-        hor, ver, vmin, hmin = 0, 0, 0, 0
-        out = np.zeros((self.vmax, self.hmax))
-        i = 0
-        while ver < self.vmax and hor < self.hmax:
-            if (hor+ver)%2 == 0:
-                if ver == vmin:
-                    out[ver, hor] = inp[i]
-                    if hor == self.hmax-1:
-                        ver += 1
-                    else:
-                        hor += 1
-                    i += 1
-                elif hor == self.hmax-1 and ver < self.vmax-1:
-                    out[ver, hor] = inp[i]
-                    ver += 1
-                    i += 1
-                elif ver > vmin and hor < self.hmax-1:
-                    out[ver, hor] = inp[i]
-                    ver -= 1
-                    hor += 1
-                    i += 1
-            else:
-                if ver == self.vmax-1 and hor <= self.hmax-1:
-                    out[ver, hor] = inp[i]
-                    hor += 1
-                    i += 1
-                elif hor == hmin:
-                    out[ver, hor] = inp[i]
-                    if ver == self.vmax-1:
-                        hor += 1
-                    else:
-                        ver += 1
-                    i += 1
-                elif ver < self.vmax-1 and hor > hmin:
-                    out[ver, hor] = inp[i]
-                    ver += 1
-                    hor -= 1
-                    i += 1
-            if ver == self.vmax-1 and hor == self.hmax-1:
-                out[ver, hor] = inp[i]
-                break
+        inverse_order = get_zigzag_order(self.vmax, self.hmax)[1]
+        out = np.asarray(inp, dtype=float)[inverse_order].reshape((self.vmax, self.hmax))
         if self.verbose:
             print(f"----------\nZig-Zag inverse:\n{out.astype(int)}")
         return out
+
+    def forward_blocks(self, inp, shape=(8, 8)):
+        """Transform a stack of blocks into their zig-zag read sequences, keeping the type of the values
+
+        :param inp: Blocks to be transformed
+        :type inp: np.array of shape (N, num_rows, num_cols), or (N, num_rows*num_cols) for flattened blocks
+        :param shape: Shape of the flattened blocks (default: (8, 8))
+        :type shape: tuple
+        :return: Zig-zag read sequences
+        :rtype: np.array of shape (N, num_rows*num_cols)
+        """
+        inp = np.asarray(inp)
+        if inp.ndim == 3:
+            shape = inp.shape[1:]
+        order = get_zigzag_order(*shape)[0]
+        out = inp.reshape((len(inp), shape[0]*shape[1]))[:, order]
+        if self.verbose:
+            print(f"----------\nZig-Zag forward:\n{out}")
+        return out
+
+    def inverse_blocks(self, inp, shape=(8, 8)):
+        """Reconstruct a stack of blocks from their zig-zag read sequences, keeping the type of the values
+
+        :param inp: Sequences of values
+        :type inp: np.array of shape (N, num_rows*num_cols)
+        :param shape: Shape of the blocks (default: (8, 8))
+        :type shape: tuple
+        :return: Reconstructed blocks
+        :rtype: np.array of shape (N, num_rows, num_cols)
+        """
+        inp = np.asarray(inp)
+        inverse_order = get_zigzag_order(*shape)[1]
+        out = inp[:, inverse_order].reshape((len(inp),) + tuple(shape))
+        if self.verbose:
+            print(f"----------\nZig-Zag inverse:\n{out}")
+        return out
@@ -1,9 +1,16 @@
 """Test module for the codecs"""
 
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import cv2
 import numpy as np
 from skimage import io
-from jpegdna.codecs import JPEGDNAGray, JPEGDNARGB, JpegDNA
+from jpegdna.codecs import JPEGDNAGray, JPEGDNARGB, JpegDNA, JPEGSession
+from jpegdna.codecs import get_channel_plan, encode_channel, decode_channel
 from jpegdna.transforms import RGBYCbCr
+from jpegdna.tools.exception_validator import expected_value_error, expected_runtime_error
+from decoder import PyCoefficientDecoder
 
 def jpegdna_test():
     """Functionnal tests for the general jpegdna codec"""
@@ -219,3 +226,253 @@ def jpegdnargb_test():
               res[2][1:])
     code = code[25:]
     decoded = codec.full_decode(code, "from_img", params, gammas)
+
+def jpegdnargb_jpeg_output_test():
+    """Functionnal tests for the writing of the decoded coefficients of the rgb jpegdna codec to a JPEG file"""
+    img = io.imread("img/kodim01.png")[:37, :53]
+    for channel_sampler, sampling_factor in [("4:2:0", cv2.IMWRITE_JPEG_SAMPLING_FACTOR_420),
+                                             ("4:4:4", cv2.IMWRITE_JPEG_SAMPLING_FACTOR_444)]:
+        _, jpeg = cv2.imencode(".jpg", img[:, :, ::-1], [cv2.IMWRITE_JPEG_SAMPLING_FACTOR, sampling_factor])
+        session = JPEGSession(jpeg.tobytes())
+        (code, res, gammas) = JPEGDNARGB(1, session, channel_sampler, True).full_encode(None, "from_img", coefficients=True)
+        params = tuple(state[1:] for state in res)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            jpeg_fpath = os.path.join(tmp_dir, "decoded.jpg")
+            assert JPEGDNARGB(1, "", channel_sampler, False).full_decode(code, "from_img", params, gammas,
+                                                                         jpeg_fpath=jpeg_fpath) == jpeg_fpath
+            original, decoded = PyCoefficientDecoder(jpeg.tobytes()), PyCoefficientDecoder(jpeg_fpath)
+            assert (decoded.image_width, decoded.image_height) == (53, 37)
+            for channel in range(3):
+                assert decoded.h_samp_factor(channel) == original.h_samp_factor(channel)
+                assert decoded.v_samp_factor(channel) == original.v_samp_factor(channel)
+                assert (decoded.get_quantization_table(channel) == original.get_quantization_table(channel)).all()
+                assert (decoded.get_dct_coefficients(channel) == original.get_dct_coefficients(channel)).all()
+
+def jpegdnargb_channel_workers_test():
+    """Functionnal tests for the concurrent coding of the channels of the rgb jpegdna codec"""
+    img = io.imread("img/kodim01.png")[:64, :64]
+    _, jpeg = cv2.imencode(".jpg", img[:, :, ::-1])
+    session = JPEGSession(jpeg.tobytes())
+    (code, res, gammas) = JPEGDNARGB(1, session, "4:2:0", True).full_encode(None, "from_img", coefficients=True)
+    codec = JPEGDNARGB(1, session, "4:2:0", True, channel_workers=3)
+    (code_workers, res_workers, gammas_workers) = codec.full_encode(None, "from_img", coefficients=True)
+    assert code_workers == code
+    for state, state_workers, gamma, gamma_workers in zip(res, res_workers, gammas, gammas_workers):
+        assert state_workers[1:3] == state[1:3]
+        assert (state_workers[3] == state[3]).all() and (state_workers[4] == state[4]).all()
+        assert (gamma_workers == gamma).all()
+    params = tuple(state[1:] for state in res)
+    decoded = JPEGDNARGB(1, "", "4:2:0", False).full_decode(code, "from_img", params, gammas)
+    decoded_workers = JPEGDNARGB(1, "", "4:2:0", False, channel_workers=3).full_decode(code, "from_img", params, gammas,
+                                                                                          channel_lengths=codec.channel_lengths)
+    assert (decoded_workers == decoded).all()
+    # The channel lengths oligo is only written on demand
+    decoder = JPEGDNARGB(1, "", "4:2:0", False, formatting=True, channel_workers=3)
+    for channel_indexing, channel_lengths in [(False, None), (True, codec.channel_lengths)]:
+        oligos = JPEGDNARGB(1, session, "4:2:0", True, formatting=True,
+                            channel_indexing=channel_indexing).full_encode(None, "from_img", coefficients=True)
+        assert (decoder.full_decode(oligos, "from_img") == decoded).all()
+        assert decoder.formatter.channel_lengths == channel_lengths
+
+def jpegsession_test():
+    """Functionnal tests for the JPEG session shared by the codecs"""
+    img = io.imread("img/kodim01.png")[:37, :53]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        jpeg_fpath = os.path.join(tmp_dir, "image.jpg")
+        cv2.imwrite(jpeg_fpath, img[:, :, ::-1])
+        session, dec = JPEGSession(jpeg_fpath), PyCoefficientDecoder(jpeg_fpath)
+        assert session.path == jpeg_fpath
+        assert (session.image_width, session.image_height, session.num_components) == (dec.image_width, dec.image_height, 3)
+        assert (session.max_h_samp_factor, session.max_v_samp_factor) == (dec.max_h_samp_factor, dec.max_v_samp_factor)
+        for channel in range(3):
+            assert session.h_samp_factor(channel) == dec.h_samp_factor(channel)
+            assert session.v_samp_factor(channel) == dec.v_samp_factor(channel)
+            assert session.get_height_in_blocks(channel) == dec.get_height_in_blocks(channel)
+            assert session.get_width_in_blocks(channel) == dec.get_width_in_blocks(channel)
+            assert (session.get_quantization_table(channel) == dec.get_quantization_table(channel)).all()
+            assert (session.get_dct_coefficients(channel) == dec.get_dct_coefficients(channel)).all()
+            assert not session.get_dct_coefficients(channel).flags.writeable
+        assert not session.coefficient_buffer.flags.writeable
+        # Encoding from the session or from the path of the image gives the same strand
+        for coefficients in [False, True]:
+            code_session, _, _ = JPEGDNARGB(1, session, "4:2:0", True).full_encode(io.imread(jpeg_fpath), "from_img",
+                                                                                   coefficients=coefficients)
+            code_path, _, _ = JPEGDNARGB(1, jpeg_fpath, "4:2:0", True).full_encode(io.imread(jpeg_fpath), "from_img",
+                                                                                   coefficients=coefficients)
+            assert code_session == code_path
+
+def pycoefficientdecoder_all_coefficients_test():
+    """Functionnal tests for the reading of the coefficients of all the components by PyCoefficientDecoder"""
+    img = io.imread("img/kodim01.png")[:37, :53]
+    jpeg = cv2.imencode(".jpg", img[:, :, ::-1])[1].tobytes()
+    dec = PyCoefficientDecoder(jpeg)
+    layout = dec.get_coefficient_layout()
+    offset = 0
+    for channel, (channel_offset, shape, sampling_factors) in enumerate(layout):
+        assert channel_offset == offset
+        assert shape == (dec.get_height_in_blocks(channel), dec.get_width_in_blocks(channel))
+        assert sampling_factors == (dec.h_samp_factor(channel), dec.v_samp_factor(channel))
+        offset += shape[0] * shape[1]
+    buffer, coefficients = dec.get_all_dct_coefficients()
+    assert buffer.shape == (offset, 64) and buffer.dtype == np.int16
+    # A preallocated buffer larger than the image is filled from its start
+    out = np.full((offset + 3, 64), -1, dtype=np.int16)
+    out_buffer, out_coefficients = dec.get_all_dct_coefficients(out)
+    assert out_buffer is out
+    assert (out[:offset] == buffer).all() and (out[offset:] == -1).all()
+    for channel, (channel_offset, shape, _) in enumerate(layout):
+        assert (coefficients[channel] == dec.get_dct_coefficients(channel)).all()
+        assert (out_coefficients[channel] == coefficients[channel]).all()
+        assert np.shares_memory(out_coefficients[channel], out)
+        assert (buffer[channel_offset:channel_offset + shape[0] * shape[1]] == coefficients[channel]).all()
+
+@expected_value_error
+def pycoefficientdecoder_all_coefficients_failure_test():
+    """Failure tests for the reading of the coefficients of all the components into a too small buffer"""
+    img = io.imread("img/kodim01.png")[:37, :53]
+    dec = PyCoefficientDecoder(cv2.imencode(".jpg", img[:, :, ::-1])[1].tobytes())
+    num_blocks = sum(shape[0] * shape[1] for _, shape, _ in dec.get_coefficient_layout())
+    dec.get_all_dct_coefficients(np.empty((num_blocks - 1, 64), dtype=np.int16))
+
+def pycoefficientdecoder_buffer_test():
+    """Functionnal tests for the reading of JPEG images in memory by PyCoefficientDecoder"""
+    img = io.imread("img/kodim01.png")[:37, :53]
+    jpeg = cv2.imencode(".jpg", img[:, :, ::-1])[1].tobytes()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        jpeg_fpath = os.path.join(tmp_dir, "image.jpg")
+        with open(jpeg_fpath, "wb") as f:
+            f.write(jpeg)
+        dec = PyCoefficientDecoder(jpeg_fpath)
+        for buffer in [jpeg, bytearray(jpeg), memoryview(jpeg), np.frombuffer(jpeg, dtype=np.uint8)]:
+            dec_buffer = PyCoefficientDecoder(buffer)
+            assert (dec_buffer.image_width, dec_buffer.image_height) == (dec.image_width, dec.image_height)
+            for channel in range(3):
+                assert (dec_buffer.get_quantization_table(channel) == dec.get_quantization_table(channel)).all()
+                assert (dec_buffer.get_dct_coefficients(channel) == dec.get_dct_coefficients(channel)).all()
+
+def pycoefficientdecoder_threads_test():
+    """Functionnal tests for the concurrent reading of JPEG images by PyCoefficientDecoder"""
+    def read(jpeg):
+        dec = PyCoefficientDecoder(jpeg)
+        return ([dec.get_quantization_table(channel) for channel in range(3)],
+                [dec.get_dct_coefficients(channel) for channel in range(3)],
+                PyCoefficientDecoder(jpeg).get_decompressed_image())
+    jpegs = [cv2.imencode(".jpg", io.imread(f"img/kodim0{i}.png")[:96, :80, ::-1])[1].tobytes() for i in [1, 2, 3, 6]]
+    serial = [read(jpeg) for jpeg in jpegs]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        concurrent = list(executor.map(read, jpegs * 2))
+        # A decoder shared by the threads serializes their calls
+        dec = PyCoefficientDecoder(jpegs[0])
+        shared = list(executor.map(dec.get_dct_coefficients, [0, 1, 2] * 3))
+    for (tables, coeffs, image), (tables_serial, coeffs_serial, image_serial) in zip(concurrent, serial * 2):
+        assert all((table == table_serial).all() for table, table_serial in zip(tables, tables_serial))
+        assert all((coeff == coeff_serial).all() for coeff, coeff_serial in zip(coeffs, coeffs_serial))
+        assert (image == image_serial).all()
+    for channel, coeffs in enumerate(shared):
+        assert (coeffs == serial[0][1][channel % 3]).all()
+
+@expected_value_error
+def pycoefficientdecoder_channel_failure_test():
+    """Failure tests for the dimensions of a component which is not in the JPEG image"""
+    img = io.imread("img/kodim01.png")[:37, :53]
+    dec = PyCoefficientDecoder(cv2.imencode(".jpg", img[:, :, ::-1])[1].tobytes())
+    dec.get_width_in_blocks(3)
+
+@expected_value_error
+def pycoefficientdecoder_coefficients_channel_failure_test():
+    """Failure tests for the coefficients of a component which is not in the JPEG image"""
+    img = io.imread("img/kodim01.png")[:37, :53]
+    dec = PyCoefficientDecoder(cv2.imencode(".jpg", img[:, :, ::-1])[1].tobytes())
+    dec.iter_dct_coefficient_rows(-1)
+
+@expected_value_error
+def pycoefficientdecoder_empty_buffer_failure_test():
+    """Failure tests for the reading of an empty buffer by PyCoefficientDecoder"""
+    PyCoefficientDecoder(b"")
+
+@expected_runtime_error
+def pycoefficientdecoder_not_jpeg_failure_test():
+    """Failure tests for the reading of a buffer which is not a JPEG image by PyCoefficientDecoder"""
+    PyCoefficientDecoder(b"not a JPEG image")
+
+def jpegdnargb_read_coefficients_test():
+    """Functionnal tests for the reading of the coefficients of a JPEG image by the rgb jpegdna codec"""
+    img = io.imread("img/kodim01.png")[:37, :53]
+    _, jpeg = cv2.imencode(".jpg", img[:, :, ::-1])
+    session = JPEGSession(jpeg.tobytes())
+    channels = JPEGDNARGB(1, session, "4:2:0", True).read_coefficients(session)
+    assert [channel[1:] for channel in channels] == [(5, 7, 37, 53), (3, 4, 19, 27), (3, 4, 19, 27)]
+    for channel, (coeffs, *_) in enumerate(channels):
+        assert coeffs is session.get_dct_coefficients(channel)
+
+@expected_value_error
+def jpegdnargb_read_coefficients_failure_test():
+    """Failure tests for the reading of the coefficients of a JPEG image sampled unlike the channel sampler"""
+    img = io.imread("img/kodim01.png")[:37, :53]
+    _, jpeg = cv2.imencode(".jpg", img[:, :, ::-1])
+    session = JPEGSession(jpeg.tobytes())
+    JPEGDNARGB(1, session, "4:4:4", True).read_coefficients(session)
+
+def jpegdnagray_encode_coefficient_rows_test():
+    """Functionnal tests for the encoding of the coefficients of the gray level jpegdna codec a few rows at a time"""
+    rng = np.random.default_rng(0)
+    coeffs = np.zeros((6*5, 64), dtype=np.int16)
+    coeffs[:, :10] = rng.integers(-50, 50, size=(6*5, 10))
+    codec = JPEGDNAGray(1, "", False)
+    codec.set_frequencies_from_coefficients(coeffs, 6, 5)
+    freq_dc, freq_ac = codec.freq_dc, codec.freq_ac
+    code = codec.encode_coefficients(coeffs, 6, 5)
+    row_offsets = codec.row_offsets
+    rows = [coeffs[i*5:(i+2)*5] for i in range(0, 6, 2)]
+    codec.set_frequencies_from_coefficient_rows(rows, 5)
+    assert (codec.freq_dc == freq_dc).all() and (codec.freq_ac == freq_ac).all()
+    assert "".join(codec.encode_coefficient_rows(rows, 5)) == code
+    assert (codec.row_offsets == row_offsets).all()
+
+def jpegdnagray_encode_coefficient_rows_decoder_test():
+    """Functionnal tests for the encoding of the coefficients of a JPEG image read a few rows at a time"""
+    img = io.imread("img/kodim01.png")[:37, :53]
+    dec = PyCoefficientDecoder(cv2.imencode(".jpg", img[:, :, ::-1])[1].tobytes())
+    for channel in range(3):
+        nb_row_blocks, nb_col_blocks = dec.get_height_in_blocks(channel), dec.get_width_in_blocks(channel)
+        coeffs = dec.get_dct_coefficients(channel)
+        codec = JPEGDNAGray(1, "", False)
+        codec.set_frequencies_from_coefficients(coeffs, nb_row_blocks, nb_col_blocks)
+        code = codec.encode_coefficients(coeffs, nb_row_blocks, nb_col_blocks)
+        for rows_per_step in [1, 2, 4]:
+            codec.set_frequencies_from_coefficient_rows(dec.iter_dct_coefficient_rows(channel, rows_per_step), nb_col_blocks)
+            rows = dec.iter_dct_coefficient_rows(channel, rows_per_step)
+            assert "".join(codec.encode_coefficient_rows(rows, nb_col_blocks)) == code
+
+@expected_value_error
+def jpegdnagray_encode_coefficient_rows_failure_test():
+    """Failure tests for the encoding of a group of blocks which are not whole rows of blocks"""
+    coeffs = np.zeros((6*5, 64), dtype=np.int16)
+    codec = JPEGDNAGray(1, "", False)
+    codec.set_frequencies_from_coefficients(coeffs, 6, 5)
+    list(codec.encode_coefficient_rows([coeffs[:10], coeffs[10:17]], 5))
+
+def jpegdna_channel_test():
+    """Functionnal tests for the stateless coding of the coefficients of a channel"""
+    rng = np.random.default_rng(0)
+    coeffs = np.zeros((6*5, 64), dtype=np.int16)
+    coeffs[:, :10] = rng.integers(-50, 50, size=(6*5, 10))
+    codec = JPEGDNAGray(1, "", False)
+    codec.set_frequencies_from_coefficients(coeffs, 6, 5)
+    code = codec.encode_coefficients(coeffs, 6, 5)
+    plan = get_channel_plan(codec.freq_dc, codec.freq_ac)
+    encoded = encode_channel(coeffs.reshape((6, 5, 64)), plan)
+    assert encoded.strand == code
+    assert (encoded.row_offsets == codec.row_offsets).all()
+    decoded = decode_channel(encoded.strand, plan, (6, 5))
+    assert (decoded.coefficients == coeffs.reshape((6, 5, 64))).all()
+    assert decoded.decoded_blocks.all() and decoded.pos == len(code)
+    decoded = decode_channel("A" + code, plan, (6, 5), pos=1, row_offsets=encoded.row_offsets)
+    assert (decoded.coefficients == coeffs.reshape((6, 5, 64))).all()
+    # One plan shared by concurrent requests
+    images = [np.roll(coeffs, i, axis=0).reshape((6, 5, 64)) for i in range(8)]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        strands = list(executor.map(lambda image: encode_channel(image, plan).strand, images))
+        results = list(executor.map(lambda strand: decode_channel(strand, plan, (6, 5)).coefficients, strands))
+    for image, result in zip(images, results):
+        assert (result == image).all()
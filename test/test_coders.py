@@ -5,11 +5,19 @@ from jpegdna.coders import GoldmanCoder
 from jpegdna.coders import HuffmanCoder
 from jpegdna.coders import HexCoder
 from jpegdna.coders import ACCategoryCoder, DCCategoryCoder
-from jpegdna.coders import DCCoefficientCoder, ACCoefficientCoder
+from jpegdna.coders import DCCoefficientCoder, ACCoefficientCoder, ChannelCoder
+from jpegdna.coders import get_codec_plan, codec_plan_cache_info, clear_codec_plan_cache
 from jpegdna.coders import ValueCoder
+from jpegdna.coders.valuecoder import get_codebook_index, compute_min_value, compute_max_value
+from jpegdna.coders.valuecoder import get_codebook_tables, DEFAULT_CODEBOOK_CACHE_SIZE
 from jpegdna.coders.huffmancoder import huffmandict, x_in_y, huffman_nary_tree, huffman_initial_count, indicies_to_code
-from jpegdna.coders.categorycoder import count_run_cat
-from jpegdna.tools.loader import load_lut_matrix, load_codebook_matrix
+from jpegdna.coders.huffmancoder import canonical_huffmandict
+from jpegdna.coders.categorycoder import count_run_cat, build_codeword_trie, search_codeword_trie, get_runcat_tables
+from jpegdna.coders.categorycoder import DEFAULT_RUNCAT_CACHE_SIZE
+from jpegdna.coders.categorycoder import count_run_cat_blocks, find_categories, find_category_ac, find_category_dc
+from jpegdna.coders.categorycoder import AC_CATEGORY_BOUNDS, DC_CATEGORY_BOUNDS, check_coefficient_ranges
+from jpegdna.coders.categorycoder import validate_channel_coefficients
+from jpegdna.tools.loader import load_lut_matrix, load_codebook_matrix, get_package_lut, get_package_codebook
 from jpegdna.tools.exception_validator import expected_value_error
 from jpegdna.tools.exception_validator import expected_non_decodable_category, expected_non_decodable_goldman
 from jpegdna.tools.exception_validator import expected_getter_coder_error, expected_setter_coder_error
@@ -71,6 +79,23 @@ class TestGoldmanCoder():
     def goldman_coder_alphabet_failure_test(self):
         """Failure tests for the Goldman coder: ValueError"""
         _ = GoldmanCoder(["A", "T", "C", "A"])
+    def encode_decode_codewords_test(self):
+        """Functionnal tests for the Goldman coder: encode_decode_codewords_test"""
+        goldman_coder = GoldmanCoder(["A", "T", "C", "G"])
+        seqs = ["012012012", "", "2", "1100222"]
+        encoded = goldman_coder.encode_codewords(seqs)
+        assert encoded == [goldman_coder.encode(seq) if seq else "" for seq in seqs]
+        assert goldman_coder.decode_codewords(encoded) == seqs
+    def encode_decode_array_test(self):
+        """Functionnal tests for the Goldman coder: encode_decode_array_test"""
+        goldman_coder = GoldmanCoder(["A", "T", "C", "G"])
+        seq = "0120120122"*100
+        trits = np.frombuffer(seq.encode(), dtype=np.uint8) - ord("0")
+        nucleotides = goldman_coder.encode_array(trits)
+        assert nucleotides.dtype == np.uint8
+        assert goldman_coder.to_symbols(nucleotides) == goldman_coder.encode(seq)
+        assert (goldman_coder.decode_array(nucleotides) == trits).all()
+        assert goldman_coder.encode(seq[:10]) == goldman_coder.encode(seq)[:10]
 
 
 class TestHuffmanCoder():
@@ -167,6 +192,43 @@ class TestHuffmanCoder():
         enco = huffman_coder.encode(inp)
         decoded = huffman_coder.decode(enco)
         assert decoded == inp
+    def decode_signal_test(self):
+        """Functionnal tests for the Huffman coder: decode_signal_test"""
+        alpha = [1, 2, 3, 4, 5, 6, 7, 8, 9, 0]
+        freqs = [1, 2, 25, 15, 3, 9, 18, 135, 225, 27]
+        huffman_coder = HuffmanCoder(alpha, freqs, 3)
+        inp = list("8912345678900")
+        decoded = huffman_coder.decode(huffman_coder.encode(inp))
+        assert decoded == inp
+    @expected_value_error
+    def decode_failure_test(self):
+        """Failure tests for the Huffman coder: ValueError"""
+        alpha = [1, 2, 3, 4, 5, 6, 7, 8, 9, 0]
+        freqs = [1, 2, 25, 15, 3, 9, 18, 135, 225, 27]
+        huffman_coder = HuffmanCoder(alpha, freqs, 3)
+        _ = huffman_coder.decode("0211")
+    def canonical_dictionnary_builder_test(self):
+        """Functionnal tests for the Huffman coder: canonical_dictionnary_builder_test"""
+        alpha = [1, 2, 3, 4, 5, 6, 7, 8, 9, 0]
+        freqs = [1, 2, 25, 15, 3, 9, 18, 135, 225, 27]
+        target = {'0': '21', '1': '22220', '2': '22221', '3': '20', '4': '220', '5': '2220', '6': '2221', '7': '221', '8': '0', '9': '1'}
+        huffman_coder = HuffmanCoder(alpha, freqs, 3, canonical=True)
+        assert huffman_coder.dic == target
+        assert huffman_coder.decode(huffman_coder.encode(list("1234567890"))) == list("1234567890")
+    def canonical_length_limited_test(self):
+        """Functionnal tests for the Huffman coder: canonical_length_limited_test"""
+        alpha = range(162)
+        freqs = [2**(i//8) for i in alpha]
+        huffman_coder = HuffmanCoder(alpha, freqs, 3, canonical=True, max_length=6)
+        codewords = list(huffman_coder.dic.values())
+        assert max(len(codeword) for codeword in codewords) == 6
+        assert not any(a != b and b.startswith(a) for a in codewords for b in codewords)
+        inp = [str(i) for i in alpha]
+        assert huffman_coder.decode(huffman_coder.encode(inp)) == inp
+    @expected_value_error
+    def canonical_length_limited_failure_test(self):
+        """Failure tests for the Huffman coder: ValueError"""
+        _ = canonical_huffmandict(range(162), [1]*162, 3, max_length=4)
     def x_in_y_test(self):
         """Functionnal tests for x_in_y helper"""
         base = "aaa"
@@ -258,6 +320,29 @@ class TestCategoryCoder():
             code = dc_category_coder.encode(inp)
             res = dc_category_coder.full_decode(code)
             assert res[0] == inp[0]
+    def codeword_trie_test(self):
+        """Functionnal tests for the prefix tree of Goldman encoded codewords"""
+        alpha = range(162)
+        freqs = list(range(1, 163))
+        dic = huffmandict(alpha, freqs, 3)
+        gold_coder = GoldmanCoder(["A", "T", "C", "G"])
+        trie = build_codeword_trie(dic, gold_coder)
+        symbols = [161, 0, 37, 160, 5]
+        code = "".join(gold_coder.encode(dic[str(sym)]) for sym in symbols)
+        pos = 0
+        for sym in symbols:
+            res, length = search_codeword_trie(trie, code, pos)
+            assert res == sym
+            assert length == len(dic[str(sym)])
+            pos += length
+        assert pos == len(code)
+    @expected_non_decodable_category
+    def codeword_trie_failure_test(self):
+        """Failure tests for the prefix tree of Goldman encoded codewords: NonDecodableCategory"""
+        alpha = range(11)
+        dic = huffmandict(alpha, [1]*11, 3)
+        trie = build_codeword_trie(dic, GoldmanCoder(["A", "T", "C", "G"]))
+        _ = search_codeword_trie(trie, "ATCGG", 2)
     @expected_non_decodable_category
     def dc_category_coder_failure_test(self):
         """Failure tests for DCCategoryCoder: NonDecodableCategory"""
@@ -586,3 +671,251 @@ class TestValueCoder():
             print(f"Coefficient: {coeff}")
             print(f"Num_bits: {num_bits}")
             assert coeff == inp
+    def decode_position_dc_test(self):
+        """Functionnal tests for the DCT value coder: decode_position_DC_test"""
+        codebook = load_codebook_matrix("jpegdna/data/codebook.pkl")
+        prob_dc = [1/11]*11
+        gold_coder = GoldmanCoder(["A", "T", "C", "G"])
+        dict_dc = huffmandict(range(11), prob_dc, 3)
+        huffman_dc_coder = HuffmanCoder(dict_dc)
+        gold_code_dc = [gold_coder.encode(huffman_dc_coder.encode([str(i)])) for i in range(11)]
+        dc_coeff_coder = DCCoefficientCoder(dict_dc, codebook)
+        (code_first, _) = dc_coeff_coder.full_encode(-37, gold_code_dc)
+        (code_second, _) = dc_coeff_coder.full_encode(50, gold_code_dc)
+        code = code_first + code_second
+        (coeff, (num_bits)) = dc_coeff_coder.full_decode(code, 0)
+        assert coeff == -37
+        assert num_bits == len(code_first)
+        (coeff, (num_bits)) = dc_coeff_coder.full_decode(code, num_bits)
+        assert coeff == 50
+        assert num_bits == len(code_second)
+    def decode_position_ac_test(self):
+        """Functionnal tests for the DCT value coder: decode_position_AC_test"""
+        codebook = load_codebook_matrix("jpegdna/data/codebook.pkl")
+        inp = np.array([0, 0, 0, 12] + [0]*60)
+        lut = load_lut_matrix("jpegdna/data/lut.mat")
+        prob_ac = [1/162]*162
+        gold_coder = GoldmanCoder(["A", "T", "C", "G"])
+        dict_ac = huffmandict(range(162), prob_ac, 3)
+        huffman_ac_coder = HuffmanCoder(dict_ac)
+        gold_code_ac = [gold_coder.encode(huffman_ac_coder.encode([str(i)])) for i in range(162)]
+        ac_coeff_coder = ACCoefficientCoder(dict_ac, lut, codebook)
+        (code_ac, _) = ac_coeff_coder.full_encode(inp, gold_code_ac)
+        code = "GATC" + code_ac
+        (coeff, (num_zeros, num_bits, end_of_block)) = ac_coeff_coder.full_decode(code, 4)
+        assert coeff == 12
+        assert num_zeros == 2
+        assert not end_of_block
+        (coeff, (num_zeros, _, end_of_block)) = ac_coeff_coder.full_decode(code, 4+num_bits)
+        assert end_of_block
+    def codebook_index_test(self):
+        """Functionnal tests for the inverse index of the value codebooks"""
+        codebook = load_codebook_matrix("jpegdna/data/codebook.pkl")
+        value_coder = ValueCoder(codebook)
+        for ad_bits in range(2, 7):
+            index = get_codebook_index(ad_bits, codebook)
+            assert index is get_codebook_index(ad_bits, codebook)
+            for value in [compute_min_value(ad_bits), compute_max_value(ad_bits), -compute_min_value(ad_bits), -compute_max_value(ad_bits)]:
+                code = value_coder.full_encode(value, ad_bits-1)
+                assert index[code] == value
+
+    def codebook_tables_cache_test(self):
+        """Functionnal tests for the bounded cache of the tables of the codebooks"""
+        codebooks = [[["AT", "AC"]] for _ in range(DEFAULT_CODEBOOK_CACHE_SIZE + 2)]
+        tables = [get_codebook_tables(codebook) for codebook in codebooks]
+        assert get_codebook_tables(codebooks[-1])[0] is tables[-1][0]
+        # The tables of the codebooks used first have been dropped
+        assert get_codebook_tables(codebooks[0])[0] is not tables[0][0]
+
+def test_runcat_tables():
+    """Functionnal tests for the function get_runcat_tables"""
+    lut = load_lut_matrix("jpegdna/data/lut.mat")
+    runcat_table, symbol_table = get_runcat_tables(lut)
+    assert runcat_table.shape == (16, 11)
+    assert symbol_table.shape == (162, 2)
+    for symbol, runsize in enumerate(lut):
+        run, cat = symbol_table[symbol]
+        assert f"{run:X}{cat:X}" == runsize
+        assert runcat_table[run, cat] == symbol
+    assert runcat_table[15, 0] == 160
+    assert runcat_table[0, 0] == 161
+    assert runcat_table[1, 0] == -1
+    assert get_runcat_tables(lut)[0] is runcat_table
+    # Only the tables of the last luts used are kept
+    luts = [lut.copy() for _ in range(DEFAULT_RUNCAT_CACHE_SIZE)]
+    for other_lut in luts:
+        assert (get_runcat_tables(other_lut)[0] == runcat_table).all()
+    assert get_runcat_tables(luts[-1])[0] is get_runcat_tables(luts[-1])[0]
+    assert get_runcat_tables(lut)[0] is not runcat_table
+
+def test_count_run_cat_blocks():
+    """Functionnal tests for the function count_run_cat_blocks"""
+    lut = load_lut_matrix("jpegdna/data/lut.mat")
+    rng = np.random.default_rng(0)
+    seqs = rng.integers(-40, 40, size=(300, 64)) * (rng.random((300, 64)) < 0.1)
+    seqs[0] = [0]*54+[1]*4+[0]*6
+    seqs[1] = [0]*17+[3]+[0]*45+[2]
+    seqs[2] = [5]+[0]*63
+    seqs[3, 1:] = 0
+    seqs[3, 35] = 12
+    count_run_end, run_cat_count, count_run16 = 0, np.zeros((160)), 0
+    for seq in seqs:
+        res = count_run_cat(seq, lut)
+        count_run_end += res[0]
+        run_cat_count += res[1]
+        count_run16 += res[2]
+    res = count_run_cat_blocks(seqs, lut)
+    assert res[0] == count_run_end
+    assert (res[1] == run_cat_count).all()
+    assert res[2] == count_run16
+
+def test_find_categories():
+    """Functionnal tests for the function find_categories"""
+    values = np.arange(-80000, 80000, 7)
+    assert (find_categories(values, AC_CATEGORY_BOUNDS) == [find_category_ac(v) for v in values]).all()
+    assert (find_categories(values, DC_CATEGORY_BOUNDS) == [find_category_dc(v) for v in values]).all()
+
+def test_check_coefficient_ranges():
+    """Functionnal tests for the function check_coefficient_ranges"""
+    coeffs = np.zeros((6, 64), dtype=int)
+    coeffs[:, 0] = [40000, -40000, 0, 72909, 0, 10]
+    coeffs[2, 5] = -17580
+    coeffs[5, 63] = 17579
+    ranges = check_coefficient_ranges(coeffs, 3)
+    assert (ranges.max_dc_diff, ranges.max_ac) == (80000, 17580)
+    assert list(ranges.dc_blocks) == [1]
+    assert list(ranges.ac_blocks) == [2]
+    ranges = check_coefficient_ranges(coeffs.reshape((6, 8, 8)), 1)
+    assert ranges.max_dc_diff == 72909
+    assert list(ranges.dc_blocks) == []
+
+def test_validate_channel_coefficients():
+    """Functionnal tests for the function validate_channel_coefficients"""
+    coeffs = np.zeros((6, 64), dtype=int)
+    coeffs[:, 0] = [400, -400, 0, 729, 0, 10]
+    coeffs[2, 5] = -1758
+    ranges = validate_channel_coefficients(coeffs, 2, 3)
+    assert (ranges.max_dc_diff, ranges.max_ac) == (800, 1758)
+    # Only the blocks of the rows of blocks are checked
+    coeffs[5, 63] = 17580
+    assert validate_channel_coefficients(coeffs, 1, 3).max_ac == 1758
+
+@expected_value_error
+def test_validate_channel_coefficients_failure():
+    """Failure tests for the function validate_channel_coefficients: AC coefficient out of range"""
+    coeffs = np.zeros((6, 64), dtype=int)
+    coeffs[5, 63] = 17580
+    validate_channel_coefficients(coeffs, 2, 3)
+
+class TestChannelCoder():
+    """Test class for the Channel coder"""
+    def encode_test(self):
+        """Functionnal tests for the Channel coder: encode_test, against the coefficient coders"""
+        codebook = load_codebook_matrix("jpegdna/data/codebook.pkl")
+        lut = load_lut_matrix("jpegdna/data/lut.mat")
+        gold_coder = GoldmanCoder(["A", "T", "C", "G"])
+        dict_dc = huffmandict(range(11), [1/11]*11, 3)
+        dict_ac = huffmandict(range(162), [1/162]*162, 3)
+        gold_code_dc = [gold_coder.encode(HuffmanCoder(dict_dc).encode([str(i)])) for i in range(11)]
+        gold_code_ac = [gold_coder.encode(HuffmanCoder(dict_ac).encode([str(i)])) for i in range(162)]
+        rng = np.random.default_rng(0)
+        seq_coeffs = rng.integers(-300, 300, size=(12, 64)) * (rng.random((12, 64)) < 0.15)
+        seq_coeffs[0, 1:] = 0
+        seq_coeffs[1, 63] = 7
+        seq_coeffs[2, 1:] = [0]*16 + [4] + [0]*40 + [1] + [0]*5
+        dc_coeff_coder = DCCoefficientCoder(dict_dc, codebook)
+        ac_coeff_coder = ACCoefficientCoder(dict_ac, lut, codebook)
+        target, target_len, target_offsets = "", 0, []
+        for i in range(3):
+            dc_prev_coeff = 0
+            target_offsets.append(len(target))
+            for j in range(4):
+                seq_coeff = seq_coeffs[i*4+j]
+                (code_dc, count_cat_len) = dc_coeff_coder.full_encode(seq_coeff[0] - dc_prev_coeff, gold_code_dc)
+                (code_ac, count_runcat_len) = ac_coeff_coder.full_encode(seq_coeff, gold_code_ac)
+                dc_prev_coeff = seq_coeff[0]
+                target += code_dc + code_ac
+                target_len += count_cat_len + count_runcat_len
+        channel_coder = ChannelCoder(lut, codebook)
+        (code, total_runlength_nts) = channel_coder.full_encode(seq_coeffs, gold_code_dc, gold_code_ac, 4)
+        assert code == target
+        assert total_runlength_nts == target_len
+        assert (channel_coder.row_offsets == target_offsets).all()
+        # A coefficient following 16 zeros cannot be coded
+        _ = channel_coder.full_encode(seq_coeffs[2:3], gold_code_dc, gold_code_ac, 1)
+        assert channel_coder.dropped_coefficients == 1
+        # Encoding the rows of blocks in parallel gives the same strand
+        parallel_coder = ChannelCoder(lut, codebook, n_workers=2)
+        assert parallel_coder.full_encode(seq_coeffs, gold_code_dc, gold_code_ac, 4) == (code, total_runlength_nts)
+        assert (parallel_coder.row_offsets == target_offsets).all()
+        assert parallel_coder.full_encode(seq_coeffs, gold_code_dc, gold_code_ac, 1) == \
+            channel_coder.full_encode(seq_coeffs, gold_code_dc, gold_code_ac, 1)
+        assert parallel_coder.dropped_coefficients == channel_coder.dropped_coefficients
+        # The workers load the lut and codebooks of the package instead of receiving them
+        package_coder = ChannelCoder(get_package_lut(), get_package_codebook(), n_workers=2)
+        assert package_coder.full_encode(seq_coeffs, gold_code_dc, gold_code_ac, 4) == (code, total_runlength_nts)
+    def decode_test(self):
+        """Functionnal tests for the Channel coder: decode_test"""
+        codebook = load_codebook_matrix("jpegdna/data/codebook.pkl")
+        lut = load_lut_matrix("jpegdna/data/lut.mat")
+        gold_coder = GoldmanCoder(["A", "T", "C", "G"])
+        dict_dc = huffmandict(range(11), [1/11]*11, 3)
+        dict_ac = huffmandict(range(162), [1/162]*162, 3)
+        gold_code_dc = [gold_coder.encode(HuffmanCoder(dict_dc).encode([str(i)])) for i in range(11)]
+        gold_code_ac = [gold_coder.encode(HuffmanCoder(dict_ac).encode([str(i)])) for i in range(162)]
+        rng = np.random.default_rng(1)
+        seq_coeffs = rng.integers(-300, 300, size=(12, 64)) * (rng.random((12, 64)) < 0.15)
+        seq_coeffs[0, 1:] = 0
+        seq_coeffs[1, 63] = 7
+        seq_coeffs[2, 1:] = [0]*18 + [4] + [0]*38 + [1] + [0]*5
+        channel_coder = ChannelCoder(lut, codebook)
+        (code, _) = channel_coder.full_encode(seq_coeffs, gold_code_dc, gold_code_ac, 4)
+        row_offsets = channel_coder.row_offsets + 2
+        dc_coeff_coder = DCCoefficientCoder(dict_dc, codebook)
+        ac_coeff_coder = ACCoefficientCoder(dict_ac, lut, codebook)
+        # The last two blocks are past the end of the stream
+        (decoded, (pos, decoded_blocks)) = channel_coder.full_decode("GA" + code, gold_code_ac, 4, dc_coeff_coder,
+                                                                     ac_coeff_coder, 14, 2)
+        assert decoded.dtype == np.int16
+        assert (decoded[:12] == seq_coeffs).all()
+        assert not decoded[12:].any()
+        assert pos == len(code) + 2
+        assert decoded_blocks.all()
+        # Decoding the rows of blocks from their positions, serially and in parallel
+        for n_workers in [1, 2]:
+            row_coder = ChannelCoder(lut, codebook, n_workers=n_workers)
+            (decoded, (pos, decoded_blocks)) = row_coder.full_decode("GA" + code, gold_code_ac, 4, dc_coeff_coder,
+                                                                     ac_coeff_coder, 12, 2, row_offsets)
+            assert (decoded == seq_coeffs).all()
+            assert pos == len(code) + 2
+            assert decoded_blocks.all()
+    @expected_getter_coder_error
+    def getter_channel_coder_failure_test(self):
+        """Failure tests for the Channel coder: AutomataGetterException"""
+        channel_coder = ChannelCoder(load_lut_matrix("jpegdna/data/lut.mat"), None)
+        _ = channel_coder.get_state(case='backward')
+    @expected_setter_coder_error
+    def setter_channel_coder_failure_test(self):
+        """Failure tests for the Channel coder: AutomataSetterException"""
+        channel_coder = ChannelCoder(load_lut_matrix("jpegdna/data/lut.mat"), None)
+        channel_coder.set_state(None, None, case='encode')
+
+class TestCodecPlan():
+    """Test class for the codec plans"""
+    def plan_cache_test(self):
+        """Functionnal tests for the codec plans: plan_cache_test"""
+        clear_codec_plan_cache(maxsize=2)
+        freq_dc = np.arange(1, 12)
+        freq_ac = np.arange(1, 163)
+        plan = get_codec_plan(freq_dc, freq_ac)
+        assert get_codec_plan(freq_dc.astype(float), list(freq_ac)) is plan
+        assert codec_plan_cache_info() == (1, 1, 2, 1)
+        assert plan.gold_code_ac[161] == GoldmanCoder(["A", "T", "C", "G"]).encode(plan.huffman_ac_coder.dic["161"])
+        assert search_codeword_trie(plan.trie_ac, plan.gold_code_ac[37], 0) == (37, len(plan.gold_code_ac[37]))
+        other = get_codec_plan(freq_dc[::-1], freq_ac)
+        assert other is not plan
+        _ = get_codec_plan(freq_dc, freq_ac[::-1])
+        assert codec_plan_cache_info() == (1, 3, 2, 2)
+        assert get_codec_plan(freq_dc, freq_ac) is not plan
+        clear_codec_plan_cache(maxsize=32)
+        assert codec_plan_cache_info() == (0, 0, 32, 0)
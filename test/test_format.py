@@ -6,6 +6,7 @@ from jpegdna.format import JpegDNAFormatter
 from jpegdna.format import GeneralInfoFormatter
 from jpegdna.format import GrayFrequenciesFormatter, RGBFrequenciesFormatter
 from jpegdna.format import QuantizationTablesInfoFormatter
+from jpegdna.format import RowIndexFormatter, ChannelLengthsFormatter
 from jpegdna.format import DataFormatter
 from jpegdna.tools.exception_validator import expected_value_error, expected_index_error
 
@@ -183,6 +184,29 @@ def quantizationtablesformatter_test():
     formatter = QuantizationTablesInfoFormatter((8, 8), 'RGB', header, debug=True)
     oligos = formatter.format(inp)
 
+def rowindexformatter_test():
+    """Functionnal tests for the row index formatter"""
+    header = "ATCGATC"
+    inp = [np.array([0, 605, 1428, 2000]), np.array([0, 68]), np.array([0, 48, 30000, 40000000])]
+    formatter = RowIndexFormatter(header)
+    oligos = formatter.format(inp)
+    oligos_in = []
+    for oligo in oligos:
+        oligos_in.append(oligo[7:])
+    out = formatter.deformat(oligos_in[::-1])
+    assert len(out) == 3
+    for i in range(3):
+        assert (inp[i] == out[i]).all()
+    formatter = RowIndexFormatter(header, debug=True)
+    oligos = formatter.format(inp)
+
+def channellengthsformatter_test():
+    """Functionnal tests for the channel lengths formatter"""
+    inp = [1234567, 302, 0]
+    formatter = ChannelLengthsFormatter("ATCGATC")
+    oligos = formatter.format(inp)
+    assert formatter.deformat([oligo[7:] for oligo in oligos]) == inp
+
 def dataformatter_test():
     """Functionnal tests for the data formatter"""
     formatter = DataFormatter("ATCGATC", 8)
@@ -215,6 +239,20 @@ def jpegdna_test():
     assert n == 512
     assert (freq_dc == np.zeros((11)).astype(int)).all()
     assert (freq_ac == np.zeros((162)).astype(int)).all()
+    assert formatter.row_index is None
+    row_index = [np.arange(0, 8000, 125)]
+    oligos = formatter.full_format(image_strand, choice, 512, 512, np.zeros((11)).astype(int), np.zeros((162)).astype(int),
+                                   row_index=row_index)
+    data_strand, _ = formatter.full_deformat(oligos)
+    assert data_strand[:len(image_strand)] == image_strand
+    assert (formatter.row_index[0] == row_index[0]).all()
+    assert formatter.channel_lengths is None
+    oligos = formatter.full_format(image_strand, choice, 512, 512, np.zeros((11)).astype(int), np.zeros((162)).astype(int),
+                                   channel_lengths=[len(image_strand)])
+    data_strand, _ = formatter.full_deformat(oligos)
+    assert data_strand[:len(image_strand)] == image_strand
+    assert formatter.channel_lengths == [len(image_strand)]
+    assert formatter.row_index is None
     choice = "default"
     formatter = JpegDNAFormatter(np.zeros((8,8)), "gray", primer="illumina", oligo_length=200, debug=debug)
     oligos = formatter.full_format(image_strand, choice, 512, 512, np.zeros((11)).astype(int), np.zeros((162)).astype(int))
@@ -276,6 +314,13 @@ def jpegdna_failure_value_set_state_from_img_test():
     formatter = JpegDNAFormatter(np.zeros((8,8)), "gray", primer="illumina", oligo_length=200, debug=False)
     _ = formatter.full_format(image_strand, choice, 512, 512, np.zeros((11)).astype(int), np.zeros((162)).astype(int))
     formatter.set_freq_origin("coucou")
+@expected_value_error
+def rowindexformatter_failure_value_test():
+    """Failure tests for the row index formatter: more oligos than the offset codewords"""
+    formatter = RowIndexFormatter("ATCGATC")
+    payload_length = formatter.oligo_length - formatter.DEFAULT_ROW_INDEX_OFFSET_CODE_LENGTH
+    num_oligos = len(formatter.codebook[formatter.DEFAULT_ROW_INDEX_OFFSET_CODE_LENGTH - 2])
+    _ = formatter.format_index("A" * (payload_length * num_oligos + 1))
 @expected_index_error
 def jpegdna_failure_index_dc_test():
     """Failure tests for the general gray jpegdna formatter: IndexError"""
@@ -35,6 +35,16 @@ def test_lut_loader():
                     'E1', 'E2', 'E3', 'E4', 'E5', 'E6', 'E7', 'E8', 'E9', 'EA',
                     'F1', 'F2', 'F3', 'F4', 'F5', 'F6', 'F7', 'F8', 'F9', 'FA']).all()
 
+def test_package_tables():
+    """Functionnal tests for the tables of the package shared by the codecs"""
+    lut, codebook = loader.get_package_lut(), loader.get_package_codebook()
+    assert loader.get_package_lut() is lut
+    assert loader.get_package_table("lut.mat") is lut
+    assert loader.get_package_table("codebook.pkl") is codebook
+    assert loader.get_package_table_name(lut) == "lut.mat"
+    assert loader.get_package_table_name(codebook) == "codebook.pkl"
+    assert loader.get_package_table_name(list(codebook)) is None
+
 def test_generate_random_strand():
     """Functionnal tests for the random strand generator"""
     length = 200
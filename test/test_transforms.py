@@ -4,6 +4,7 @@ import numpy as np
 from jpegdna.transforms import DCT
 from jpegdna.transforms import ZigZag
 from jpegdna.transforms import ChannelSampler
+from jpegdna.tools.exception_validator import expected_value_error
 
 
 class TestDCT():
@@ -45,6 +46,23 @@ class TestDCT():
         transformed = transform.full_forward(inp, "ortho")
         out = transform.full_inverse(transformed, "ortho")
         assert ((inp - out) < inp * 1e-5).all()
+    def forward_inverse_blocks_test(self):
+        """Functionnal tests for the discrete cosine transform: forward_inverse_blocks_test"""
+        inp = np.random.default_rng(0).integers(-128, 128, size=(5, 8, 8))
+        transformed = DCT().forward_blocks(inp, "ortho")
+        for block, block_dct in zip(inp, transformed):
+            assert (block_dct == DCT().full_forward(block, "ortho")).all()
+        assert np.allclose(DCT(backend="matmul").forward_blocks(inp, "ortho"), transformed)
+        assert np.allclose(DCT().inverse_blocks(transformed, "ortho"), inp)
+        assert np.allclose(DCT(backend="matmul").inverse_blocks(transformed, "ortho"), inp)
+    @expected_value_error
+    def backend_failure_test(self):
+        """Failure tests for the discrete cosine transform: backend_failure_test"""
+        _ = DCT(backend="fft")
+    @expected_value_error
+    def matmul_norm_failure_test(self):
+        """Failure tests for the discrete cosine transform: matmul_norm_failure_test"""
+        DCT(backend="matmul").forward_blocks(np.zeros((1, 8, 8)))
 
 
 class TestZigZag():
@@ -63,6 +81,19 @@ class TestZigZag():
         transformed = [1, 2, 4, 7, 5, 3, 6, 8, 9]
         out = transform.full_inverse(transformed, 3, 3)
         assert (out == target).all()
+    def forward_inverse_blocks_test(self):
+        """Functionnal tests for the zig-zag transform: forward_inverse_blocks_test"""
+        transform = ZigZag()
+        inp = np.arange(3*64, dtype=np.int16).reshape((3, 8, 8)) - 100
+        transformed = transform.forward_blocks(inp)
+        assert transformed.dtype == np.int16
+        for block, seq in zip(inp, transformed):
+            assert (seq == transform.forward(block)).all()
+        assert (transform.forward_blocks(inp.reshape((3, 64))) == transformed).all()
+        out = transform.inverse_blocks(transformed)
+        assert out.dtype == np.int16
+        assert (out == inp).all()
+        assert (transform.forward_blocks([[[1, 2, 3], [4, 5, 6], [7, 8, 9]]]) == [1, 2, 4, 7, 5, 3, 6, 8, 9]).all()
 
 
 class TestChannelSampler():
@@ -176,3 +207,12 @@ class TestChannelSampler():
         inp = (np.zeros((64, 64)), np.zeros((32, 64)), np.zeros((32, 64)))
         res = sampler.inverse(inp)
         assert res.shape == (64, 64, 3)
+    def sampling_factors_test(self):
+        """Functionnal tests for the JPEG sampling factors of the channel samplers"""
+        for name in ["4:2:0", "4:2:2", "4:1:1", "4:4:0", "4:4:4"]:
+            sampler = ChannelSampler(sampler=name)
+            factors = sampler.get_sampling_factors()
+            res = sampler.forward(np.zeros((64, 64, 3)))
+            for channel in range(3):
+                assert res[channel].shape == (64 * factors[channel][1] // factors[0][1],
+                                              64 * factors[channel][0] // factors[0][0])